@@ -125,33 +125,47 @@ const addStaleOutputInteractions = (elem: HTMLElement) => {
   );
 };
 
+const clearCell = (elem: HTMLElement) => {
+  elem.classList.remove(staleClass);
+  elem.classList.remove(refresherClass);
+  elem.classList.remove(freshClass);
+  elem.classList.remove(refresherInputClass);
+
+  // clear any old event listeners
+  const inputCollapser = getJpInputCollapser(elem);
+  if (inputCollapser !== null) {
+    inputCollapser.firstElementChild.classList.remove(linkedStaleClass);
+    inputCollapser.firstElementChild.classList.remove(linkedRefresherClass);
+    inputCollapser.dispatchEvent(cleanup);
+  }
+
+  const outputCollapser = getJpOutputCollapser(elem);
+  if (outputCollapser !== null) {
+    outputCollapser.firstElementChild.classList.remove(linkedStaleClass);
+    outputCollapser.firstElementChild.classList.remove(linkedRefresherClass);
+    outputCollapser.dispatchEvent(cleanup);
+  }
+};
+
 const clearCellState = (notebook: Notebook, lastCellExecPositionIdx: any) => {
   notebook.widgets.forEach((cell, idx) => {
     if (idx < lastCellExecPositionIdx) {
       return;
     }
-    cell.node.classList.remove(staleClass);
-    cell.node.classList.remove(refresherClass);
-    cell.node.classList.remove(freshClass);
-    cell.node.classList.remove(refresherInputClass);
-
-    // clear any old event listeners
-    const inputCollapser = getJpInputCollapser(cell.node);
-    if (inputCollapser !== null) {
-      inputCollapser.firstElementChild.classList.remove(linkedStaleClass);
-      inputCollapser.firstElementChild.classList.remove(linkedRefresherClass);
-      inputCollapser.dispatchEvent(cleanup);
-    }
-
-    const outputCollapser = getJpOutputCollapser(cell.node);
-    if (outputCollapser !== null) {
-      outputCollapser.firstElementChild.classList.remove(linkedStaleClass);
-      outputCollapser.firstElementChild.classList.remove(linkedRefresherClass);
-      outputCollapser.dispatchEvent(cleanup);
-    }
+    clearCell(cell.node);
   });
 };
 
+// 32-bit FNV-1a; the kernel only compares these for equality, so they need not be cryptographic
+const computeContentHash = (text: string) => {
+  let hash = 0x811c9dc5;
+  for (let i = 0; i < text.length; i++) {
+    hash ^= text.charCodeAt(i);
+    hash = Math.imul(hash, 0x01000193);
+  }
+  return `${text.length}:${(hash >>> 0).toString(16)}`;
+};
+
 const addUnsafeCellInteraction = (elem: Element, linkedElems: [string],
                                   cellsById: {[id: string]: HTMLElement},
                                   collapserFun: (elem: HTMLElement) => Element,
@@ -174,6 +188,35 @@ const connectToComm = (
   const comm = kernel.createComm('nbsafety');
   let disconnected = false;
 
+  // content hashes of the cells as of the last freshness request, which the kernel has the sources for
+  let sentContentHashById: {[id: string]: string} = {};
+  let lastExecutedCellId: string = null;
+
+  const requestCellFreshness = () => {
+    const content_hash_by_cell_id: {[id: string]: string} = {};
+    const changed_content_by_cell_id: {[id: string]: string} = {};
+    const order_index_by_cell_id: {[id: string]: number} = {};
+    notebook.widgets.forEach((itercell, idx) => {
+      const text = itercell.model.value.text;
+      const contentHash = computeContentHash(text);
+      content_hash_by_cell_id[itercell.model.id] = contentHash;
+      if (sentContentHashById[itercell.model.id] !== contentHash) {
+        changed_content_by_cell_id[itercell.model.id] = text;
+      }
+      order_index_by_cell_id[itercell.model.id] = idx;
+    });
+    sentContentHashById = content_hash_by_cell_id;
+    const payload = {
+      type: 'cell_freshness',
+      version: 2,
+      executed_cell_id: lastExecutedCellId,
+      content_hash_by_cell_id: content_hash_by_cell_id,
+      changed_content_by_cell_id: changed_content_by_cell_id,
+      order_index_by_cell_id: order_index_by_cell_id,
+    };
+    comm.send(payload);
+  };
+
   const onExecution: any = (cell: ICellModel, args: IChangedArgs<any>) => {
     if (disconnected) {
       cell.stateChanged.disconnect(onExecution);
@@ -182,23 +225,14 @@ const connectToComm = (
     if (args.name !== 'executionCount' || args.newValue === null) {
       return;
     }
-    const content_by_cell_id: {[id: string]: string} = {};
-    const order_index_by_cell_id: {[id: string]: number} = {};
-    notebook.widgets.forEach((itercell, idx) => {
-      content_by_cell_id[itercell.model.id] = itercell.model.value.text;
-      order_index_by_cell_id[itercell.model.id] = idx;
+    notebook.widgets.forEach((itercell) => {
       if (itercell.model.id === cell.id) {
         itercell.node.classList.remove(freshClass);
         itercell.node.classList.remove(refresherInputClass);
       }
     });
-    const payload = {
-      type: 'cell_freshness',
-      executed_cell_id: cell.id,
-      content_by_cell_id: content_by_cell_id,
-      order_index_by_cell_id: order_index_by_cell_id,
-    };
-    comm.send(payload);
+    lastExecutedCellId = cell.id;
+    requestCellFreshness();
   };
 
   const notifyActiveCell = (newActiveCell: ICellModel) => {
@@ -244,22 +278,31 @@ const connectToComm = (
       notebook.activeCell.model.stateChanged.connect(onExecution);
       notifyActiveCell(notebook.activeCell.model);
     } else if (msg.content.data['type'] === 'cell_freshness') {
+      const missingCellIds: any = msg.content.data['missing_cell_ids'];
+      if (missingCellIds !== undefined) {
+        // the kernel lost track of some sources (e.g. it was restarted); send them again
+        for (const id of missingCellIds) {
+          delete sentContentHashById[id];
+        }
+        requestCellFreshness();
+        return;
+      }
+      // only cells whose state changed since the last response are included
+      const changedCells: any = msg.content.data['changed_cells'];
       const staleCells: any = msg.content.data['stale_cells'];
       const freshCells: any = msg.content.data['fresh_cells'];
       const staleLinks: any = msg.content.data['stale_links'];
       const refresherLinks: any = msg.content.data['refresher_links'];
-      const lastCellExecPositionIdx: any = msg.content.data['last_cell_exec_position_idx'];
       const cellsById: {[id: string]: HTMLElement} = {};
-      const orderIdxById: {[id: string]: number} = {};
-      clearCellState(notebook, lastCellExecPositionIdx);
-      notebook.widgets.forEach((cell, idx) => {
+      notebook.widgets.forEach((cell) => {
         cellsById[cell.model.id] = cell.node;
-        orderIdxById[cell.model.id] = idx;
       });
-      for (const [id, elem] of Object.entries(cellsById)) {
-        if (orderIdxById[id] < lastCellExecPositionIdx) {
+      for (const id of changedCells) {
+        const elem = cellsById[id];
+        if (elem === undefined) {
           continue;
         }
+        clearCell(elem);
         if (staleCells.indexOf(id) > -1) {
           elem.classList.add(staleClass);
           elem.classList.add(freshClass);
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Dict, List, Set, Tuple
+    from nbsafety.types import CellId
+
+
+def _stale_cell_sccs(
+        direct_links: 'Dict[CellId, Set[CellId]]',
+        stale_cells: 'Set[CellId]',
+) -> 'List[List[CellId]]':
+    """
+    Iterative Tarjan over the subgraph induced by the stale cells. Components
+    are emitted in reverse topological order, i.e., each component comes after
+    every component reachable from it.
+    """
+    index_by_cell: 'Dict[CellId, int]' = {}
+    lowlink_by_cell: 'Dict[CellId, int]' = {}
+    on_stack: 'Set[CellId]' = set()
+    stack: 'List[CellId]' = []
+    sccs: 'List[List[CellId]]' = []
+    for root in stale_cells:
+        if root in index_by_cell:
+            continue
+        index_by_cell[root] = lowlink_by_cell[root] = len(index_by_cell)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(direct_links.get(root, ())))]
+        while len(work) > 0:
+            cell_id, successors = work[-1]
+            for succ in successors:
+                if succ not in stale_cells:
+                    continue
+                if succ not in index_by_cell:
+                    index_by_cell[succ] = lowlink_by_cell[succ] = len(index_by_cell)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(direct_links.get(succ, ()))))
+                    break
+                elif succ in on_stack:
+                    lowlink_by_cell[cell_id] = min(lowlink_by_cell[cell_id], index_by_cell[succ])
+            else:
+                work.pop()
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    lowlink_by_cell[parent] = min(lowlink_by_cell[parent], lowlink_by_cell[cell_id])
+                if lowlink_by_cell[cell_id] == index_by_cell[cell_id]:
+                    scc = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        scc.append(member)
+                        if member == cell_id:
+                            break
+                    sccs.append(scc)
+    return sccs
+
+
+def compute_stale_and_refresher_links(
+        direct_links: 'Dict[CellId, Set[CellId]]',
+        stale_cells: 'Set[CellId]',
+) -> 'Tuple[Dict[CellId, Set[CellId]], Dict[CellId, List[CellId]]]':
+    """
+    Given the cells that directly refresh each stale cell, links each stale cell
+    to every non-stale cell reachable from it by going through stale refreshers
+    (the transitive closure up until we hit non-stale refresher cells), and links
+    each such refresher back to the stale cells it helps refresh.
+
+    The stale cells are condensed into strongly connected components so that
+    each component's reachable refreshers are computed once, reusing those of
+    the components downstream of it.
+    """
+    stale_links: 'Dict[CellId, Set[CellId]]' = {}
+    refresher_links: 'Dict[CellId, List[CellId]]' = defaultdict(list)
+    component_by_cell: 'Dict[CellId, int]' = {}
+    refreshers_by_component: 'List[Set[CellId]]' = []
+    for component_idx, scc in enumerate(_stale_cell_sccs(direct_links, stale_cells)):
+        for cell_id in scc:
+            component_by_cell[cell_id] = component_idx
+        refreshers: 'Set[CellId]' = set()
+        downstream_components: 'Set[int]' = set()
+        for cell_id in scc:
+            for refresher_cell_id in direct_links.get(cell_id, ()):
+                if refresher_cell_id not in stale_cells:
+                    refreshers.add(refresher_cell_id)
+                elif component_by_cell[refresher_cell_id] != component_idx:
+                    downstream_components.add(component_by_cell[refresher_cell_id])
+        for downstream_idx in downstream_components:
+            refreshers |= refreshers_by_component[downstream_idx]
+        refreshers_by_component.append(refreshers)
+        for cell_id in scc:
+            stale_links[cell_id] = refreshers
+    for stale_cell_id in stale_cells:
+        # cells in the same component share a set; hand out copies so callers can mutate them
+        stale_links[stale_cell_id] = set(stale_links[stale_cell_id])
+        for refresher_cell_id in stale_links[stale_cell_id]:
+            refresher_links[refresher_cell_id].append(stale_cell_id)
+    return stale_links, refresher_links
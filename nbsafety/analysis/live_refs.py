@@ -5,6 +5,7 @@ from typing import cast, TYPE_CHECKING
 
 from nbsafety.analysis.attr_symbols import get_attrsub_symbol_chain, AttrSubSymbolChain, CallPoint
 from nbsafety.analysis.mixins import SaveOffAttributesMixin, SkipUnboundArgsMixin, VisitListsMixin
+from nbsafety.utils import ContentAddressedCache
 
 if TYPE_CHECKING:
     from typing import List, Optional, Set, Tuple, Union
@@ -50,15 +51,10 @@ class ComputeLiveSymbolRefs(SaveOffAttributesMixin, SkipUnboundArgsMixin, VisitL
         return self.push_attributes(skip_simple_names=False)
 
     def _add_attrsub_to_live_if_eligible(self, ref: 'AttrSubSymbolChain'):
-        if ref in self.dead:
-            return
         if len(ref.symbols) == 0:
             # can happen if user made syntax error like [1, 2, 3][4, 5, 6] (e.g. forgot comma)
             return
-        leading_symbol = ref.symbols[0]
-        if isinstance(leading_symbol, str) and leading_symbol in self.dead:
-            return
-        if isinstance(leading_symbol, CallPoint) and leading_symbol.symbol in self.dead:
+        if is_symbol_ref_killed(ref, self.dead):
             return
         self.live.add(ref)
 
@@ -207,3 +203,28 @@ def compute_live_dead_symbol_refs(
     elif isinstance(code, list):
         code = ast.Module(body=code)
     return ComputeLiveSymbolRefs(init_killed)(code)
+
+
+def is_symbol_ref_killed(ref: 'SymbolRef', dead: 'Set[SymbolRef]') -> bool:
+    """
+    Whether a reference that would otherwise be live is killed by an earlier
+    definition of one of the given dead refs.
+    """
+    if ref in dead:
+        return True
+    if isinstance(ref, str) or len(ref.symbols) == 0:
+        return False
+    leading_symbol = ref.symbols[0]
+    if isinstance(leading_symbol, str) and leading_symbol in dead:
+        return True
+    if isinstance(leading_symbol, CallPoint) and leading_symbol.symbol in dead:
+        return True
+    return False
+
+
+class CellLivenessCache(ContentAddressedCache):
+    """
+    Maps a hash of a cell's source to the live / dead symbol refs computed from it.
+    Since these do not depend on any runtime state, only their resolution to data
+    symbols needs to be redone when the notebook changes.
+    """
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import ast
+import logging
+from typing import TYPE_CHECKING
+
+from nbsafety.analysis.symbol_edges import get_symbol_edges
+from nbsafety.analysis.utils import stmt_contains_lval
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, Optional, Set
+    from ..types import SymbolRef
+
+logger = logging.getLogger(__name__)
+
+
+class StatementFacts(object):
+    """
+    Everything the tracer needs to know about a statement that can be read off of its ast alone,
+    computed once so that finishing the statement doesn't redo the analysis every time.
+    The sets in `symbol_edges` and `rval_symbol_refs` are shared; don't mutate them.
+    """
+    __slots__ = (
+        'symbol_edges',
+        'should_overwrite',
+        'rval_symbol_refs',
+        'contains_lval',
+        'is_function_def',
+        'is_class_def',
+        'is_import',
+        'is_for',
+        'is_aug_assign',
+        'is_return',
+        'has_body_entered_before_finishing',
+    )
+
+    def __init__(self, stmt_node: 'ast.stmt'):
+        symbol_edges, should_overwrite = get_symbol_edges(stmt_node)
+        self.symbol_edges: 'Dict[Optional[SymbolRef], Set[Optional[SymbolRef]]]' = dict(symbol_edges)
+        self.should_overwrite: bool = should_overwrite
+        if len(symbol_edges) == 0:
+            self.rval_symbol_refs: 'Set[SymbolRef]' = set()
+        else:
+            self.rval_symbol_refs = set.union(*symbol_edges.values()) - {None}
+        self.contains_lval: bool = stmt_contains_lval(stmt_node)
+        self.is_function_def = isinstance(stmt_node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        self.is_class_def = isinstance(stmt_node, ast.ClassDef)
+        self.is_import = isinstance(stmt_node, (ast.Import, ast.ImportFrom))
+        self.is_for = isinstance(stmt_node, ast.For)
+        self.is_aug_assign = isinstance(stmt_node, ast.AugAssign)
+        self.is_return = isinstance(stmt_node, ast.Return)
+        # the body of these starts executing before we see the end of the statement itself
+        self.has_body_entered_before_finishing = isinstance(stmt_node, (ast.For, ast.If, ast.With))
+
+
+def compute_statement_facts(nodes: 'Iterable[ast.AST]') -> 'Dict[int, StatementFacts]':
+    """Facts for each statement in `nodes`, keyed by statement id; other nodes are skipped."""
+    facts_by_stmt_id = {}
+    for node in nodes:
+        if not isinstance(node, ast.stmt):
+            continue
+        try:
+            facts_by_stmt_id[id(node)] = StatementFacts(node)
+        except Exception as e:  # noqa
+            # the tracer recomputes these when it gets to the statement, and can deal with the error then
+            logger.warning('unable to compute facts for statement on line %d: %s', node.lineno, e)
+    return facts_by_stmt_id
@@ -9,7 +9,7 @@ import weakref
 from nbsafety.data_model.update_protocol import UpdateProtocol
 
 if TYPE_CHECKING:
-    from typing import Any, Dict, Optional, Set, Union
+    from typing import Any, Dict, Iterable, Optional, Set, Tuple, Union
     import ast
     from nbsafety.safety import NotebookSafety
     from nbsafety.data_model.scope import Scope, NamespaceScope
@@ -26,6 +26,34 @@ class DataSymbolType(Enum):
 
 
 class DataSymbol(object):
+    # notebooks that touch large containers can create a great many of these, so keep them compact
+    __slots__ = (
+        'name',
+        'symbol_type',
+        '_tombstone',
+        '_obj_ref',
+        '_has_weakref',
+        'cached_obj_ref',
+        '_cached_has_weakref',
+        'cached_obj_id',
+        'cached_obj_type',
+        'containing_scope',
+        'safety',
+        'stmt_node',
+        '_funcall_live_symbols',
+        '_parents',
+        '_children_by_cell_position',
+        'call_scope',
+        'defined_cell_num',
+        'required_cell_num',
+        '_fresher_ancestors',
+        '_namespace_stale_symbols',
+        '_implicit',
+        'disable_warnings',
+        '_hash',
+        'symbol_id',
+    )
+
     def __init__(
             self,
             name: 'Union[str, int]',
@@ -52,13 +80,19 @@ class DataSymbol(object):
         if refresh_cached_obj:
             self._refresh_cached_obj()
         self.containing_scope = containing_scope
+        # symbols compare by identity, so any per-symbol constant works as the hash; computing it once
+        # up front avoids walking the scope chain on every set insertion
+        self._hash = hash(self.full_path)
         self.safety = safety
+        # dense per-notebook id, for use as an index into arrays of per-symbol data
+        self.symbol_id = safety.next_symbol_id()
+        if safety.graph_store is not None:
+            safety.graph_store.register(self)
         self.stmt_node = self.update_stmt_node(stmt_node)
         self._funcall_live_symbols = None
-        if parents is None:
-            parents = set()
-        self.parents: Set[DataSymbol] = parents
-        self.children_by_cell_position: Dict[int, Set[DataSymbol]] = defaultdict(set)
+        # the following containers are only allocated once first used
+        self._parents: Optional[Set[DataSymbol]] = parents
+        self._children_by_cell_position: Optional[Dict[int, Set[DataSymbol]]] = None
 
         self.call_scope: Optional[Scope] = None
         if self.is_function:
@@ -69,8 +103,8 @@ class DataSymbol(object):
         # The notebook cell number this is required to have to not be considered stale
         self.required_cell_num = self.defined_cell_num
 
-        self.fresher_ancestors: Set[DataSymbol] = set()
-        self.namespace_stale_symbols: Set[DataSymbol] = set()
+        self._fresher_ancestors: Optional[Set[DataSymbol]] = None
+        self._namespace_stale_symbols: Optional[Set[DataSymbol]] = None
 
         # if implicitly created by attrsub access
         self._implicit = implicit
@@ -79,6 +113,8 @@ class DataSymbol(object):
         self.disable_warnings = False
 
         self.safety.aliases[id(obj)].add(self)
+        if not self.containing_scope.is_globally_accessible or self.containing_scope.is_garbage:
+            self.safety.garbage_symbol_candidates.add(self)
 
     def __repr__(self) -> str:
         return f'<{self.readable_name}>'
@@ -87,7 +123,62 @@ class DataSymbol(object):
         return self.readable_name
 
     def __hash__(self):
-        return hash(self.full_path)
+        return self._hash
+
+    @property
+    def parents(self) -> 'Set[DataSymbol]':
+        if self._parents is None:
+            self._parents = set()
+        return self._parents
+
+    @parents.setter
+    def parents(self, parents: 'Set[DataSymbol]'):
+        self._parents = parents
+
+    def iter_parents(self) -> 'Iterable[DataSymbol]':
+        """Like parents, but without allocating anything for parentless symbols."""
+        return self._parents or ()
+
+    @property
+    def children_by_cell_position(self) -> 'Dict[int, Set[DataSymbol]]':
+        if self._children_by_cell_position is None:
+            self._children_by_cell_position = defaultdict(set)
+        return self._children_by_cell_position
+
+    def iter_children_by_cell_position(self) -> 'Iterable[Tuple[int, Set[DataSymbol]]]':
+        """Like children_by_cell_position.items(), but without allocating anything for childless symbols."""
+        if self._children_by_cell_position is None:
+            return ()
+        return self._children_by_cell_position.items()
+
+    def add_parent(self, parent: 'DataSymbol', position: int) -> None:
+        parent.children_by_cell_position[position].add(self)
+        self.parents.add(parent)
+
+    def remove_parent(self, parent: 'DataSymbol') -> None:
+        for _, parent_children in parent.iter_children_by_cell_position():
+            parent_children.discard(self)
+        self.parents.discard(parent)
+
+    @property
+    def fresher_ancestors(self) -> 'Set[DataSymbol]':
+        if self._fresher_ancestors is None:
+            self._fresher_ancestors = set()
+        return self._fresher_ancestors
+
+    @fresher_ancestors.setter
+    def fresher_ancestors(self, fresher_ancestors: 'Set[DataSymbol]'):
+        self._fresher_ancestors = fresher_ancestors
+
+    @property
+    def namespace_stale_symbols(self) -> 'Set[DataSymbol]':
+        if self._namespace_stale_symbols is None:
+            self._namespace_stale_symbols = set()
+        return self._namespace_stale_symbols
+
+    @namespace_stale_symbols.setter
+    def namespace_stale_symbols(self, namespace_stale_symbols: 'Set[DataSymbol]'):
+        self._namespace_stale_symbols = namespace_stale_symbols
 
     @property
     def readable_name(self) -> str:
@@ -165,18 +256,27 @@ class DataSymbol(object):
         # just write a tombstone here; we'll do a batch collect after the main part of the cell is done running
         # can potentially support GC in the background further down the line
         self._tombstone = True
+        self.safety.garbage_symbol_candidates.add(self)
 
     def collect_self_garbage(self):
-        for parent in self.parents:
-            for parent_children in parent.children_by_cell_position.values():
-                parent_children.discard(self)
-        for self_children in self.children_by_cell_position.values():
-            for child in self_children:
-                child.parents.discard(self)
+        if self.safety.lazy_staleness is not None:
+            self.safety.lazy_staleness.forget(self)
+        self._remove_edges_for_collection()
+        if self.call_scope is not None:
+            self.call_scope.symbol_lookup_caches.clear()
         # kill the alias but leave the namespace
         # namespace needs to stick around to properly handle the staleness propagation protocol
         self._handle_aliases(readd=False)
 
+    def _remove_edges_for_collection(self) -> None:
+        for parent in self.iter_parents():
+            for _, parent_children in parent.iter_children_by_cell_position():
+                parent_children.discard(self)
+        # we keep our children around, so staleness can still propagate to them if we get updated again
+        for _, self_children in self.iter_children_by_cell_position():
+            for child in self_children:
+                child.parents.discard(self)
+
     # def update_type(self, new_type):
     #     self.symbol_type = new_type
     #     if self.is_function:
@@ -203,6 +303,10 @@ class DataSymbol(object):
             old_aliases.discard(self)
             if len(old_aliases) == 0:
                 del self.safety.aliases[self.cached_obj_id]
+                # nothing refers to the namespace for this object anymore
+                old_namespace = self.safety.namespaces.get(self.cached_obj_id, None)
+                if old_namespace is not None:
+                    self.safety.add_namespace_garbage_candidates(old_namespace)
         if readd:
             self.safety.aliases[self.obj_id].add(self)
 
@@ -251,7 +355,26 @@ class DataSymbol(object):
     def is_stale(self):
         if self.disable_warnings:
             return False
-        return self.defined_cell_num < self.required_cell_num or len(self.namespace_stale_symbols) > 0
+        if self.safety.lazy_staleness is not None:
+            return self.safety.lazy_staleness.is_stale(self)
+        return self.defined_cell_num < self.required_cell_num or bool(self._namespace_stale_symbols)
+
+    @property
+    def is_stale_from_ancestors(self):
+        """Like `is_stale`, but ignores staleness that only comes from the symbol's namespace."""
+        if self.disable_warnings:
+            return False
+        if self.safety.lazy_staleness is not None:
+            return self.safety.lazy_staleness.is_stale_from_ancestors(self)
+        return self.defined_cell_num < self.required_cell_num
+
+    def record_staleness(self):
+        """
+        Makes sure `required_cell_num`, `fresher_ancestors`, and `namespace_stale_symbols` reflect the
+        symbol's staleness; lazy staleness only fills these in when asked.
+        """
+        if self.safety.lazy_staleness is not None and not self.disable_warnings:
+            self.safety.lazy_staleness.record_staleness(self)
 
     def should_mark_stale(self, updated_dep):
         if self.disable_warnings:
@@ -266,31 +389,35 @@ class DataSymbol(object):
         # skip updates for imported symbols
         if self.is_import:
             return
+        self._invalidate_lazy_staleness()
         # if we get here, no longer implicit
         self._implicit = False
         # quick last fix to avoid overwriting if we appear inside the set of deps to add
         overwrite = overwrite and self not in new_deps
         new_deps.discard(self)
+        new_deps.discard(None)
         if overwrite:
             for parent in self.parents - new_deps:
-                for parent_children in parent.children_by_cell_position.values():
-                    parent_children.discard(self)
-            self.parents = set()
+                self.remove_parent(parent)
 
-        for new_parent in new_deps - self.parents:
-            if new_parent is None:
-                continue
-            new_parent.children_by_cell_position[self.safety.active_cell_position_idx].add(self)
-            self.parents.add(new_parent)
+        # with overwrite, edges from parents we already had get introduced again at the active cell position
+        for new_parent in new_deps if overwrite else new_deps - self.parents:
+            self.add_parent(new_parent, self.safety.active_cell_position_idx)
         self.required_cell_num = -1
         UpdateProtocol(self.safety, self, new_deps, mutated)(propagate=propagate)
         self._refresh_cached_obj()
         self.safety.updated_symbols.add(self)
 
     def refresh(self: 'DataSymbol'):
-        self.fresher_ancestors = set()
+        self._fresher_ancestors = None
         self.defined_cell_num = self.safety.cell_counter()
-        self.namespace_stale_symbols = set()
+        self._namespace_stale_symbols = None
+        if self.safety.lazy_staleness is not None:
+            self.safety.lazy_staleness.refresh(self)
+
+    def _invalidate_lazy_staleness(self):
+        if self.safety.lazy_staleness is not None:
+            self.safety.lazy_staleness.invalidate()
 
     def _propagate_refresh_to_namespace_parents(self, seen: 'Set[DataSymbol]'):
         if self in seen:
@@ -307,9 +434,10 @@ class DataSymbol(object):
             containing_namespace_obj_id = containing_scope.obj_id
             # print('containing namespaces:', self.safety.aliases[containing_namespace_obj_id])
             for alias in self.safety.aliases[containing_namespace_obj_id]:
-                alias.namespace_stale_symbols.discard(self)
+                if alias._namespace_stale_symbols is not None:
+                    alias._namespace_stale_symbols.discard(self)
                 if not alias.is_stale:
                     alias.defined_cell_num = self.safety.cell_counter()
-                    alias.fresher_ancestors = set()
+                    alias._fresher_ancestors = None
                 # print('working on', alias, '; stale?', alias.is_stale, alias.namespace_stale_symbols)
                 alias._propagate_refresh_to_namespace_parents(seen)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import chain, compress, count, repeat
+import logging
+import operator
+from typing import TYPE_CHECKING
+
+from nbsafety.data_model.data_symbol import DataSymbol
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# don't bother rebuilding the arrays for fewer pending edge changes than this
+_MIN_EDGES_BEFORE_COMPACTION = 1024
+
+
+def _row_bounds(offsets: 'array', row: int) -> 'Tuple[int, int]':
+    if row + 1 < len(offsets):
+        return offsets[row], offsets[row + 1]
+    # rows for symbols registered since the last compaction are empty
+    return 0, 0
+
+
+def _sort_order(major: 'array', minor: 'array', num_symbols: int) -> 'List[int]':
+    return sorted(range(len(major)), key=list(map(
+        operator.add, map(operator.mul, major, repeat(num_symbols)), minor
+    )).__getitem__)
+
+
+def _row_offsets(sorted_ids: 'array', num_symbols: int) -> 'array':
+    return array('l', map(bisect_left, repeat(sorted_ids, num_symbols + 1), range(num_symbols + 1)))
+
+
+class DependencyGraphStore(object):
+    """
+    Keeps the dependency graph in flat integer arrays indexed by symbol id, for queries over the
+    whole graph that would otherwise have to visit every DataSymbol. When the store is enabled,
+    symbols are GraphStoreDataSymbols, and the arrays here are the only copy of their edges and
+    of their defined and required cell numbers.
+
+    Edges, along with the cell position each one was introduced at, are stored in compressed
+    sparse row form in both directions, with sorted rows, plus a log of edges added, removed, or
+    moved since the rows were last rebuilt, which happens once the pending changes grow past a
+    fraction of the number of edges.
+
+    Released symbols get marked dead and lose the edges from their parents. Like a collected
+    DataSymbol, a dead symbol keeps its edges to its children, so that staleness can still propagate
+    to them if it gets updated again, but its children don't see it among their parents until then.
+    """
+    def __init__(self, compaction_ratio: float = 1.0):
+        self.compaction_ratio = compaction_ratio
+        self.symbols: 'List[Optional[DataSymbol]]' = []
+        self.defined_cell_nums = array('l')
+        self.required_cell_nums = array('l')
+        self.num_edges = 0
+        self._alive = bytearray()
+        self._child_offsets = array('l', [0])
+        self._child_ids = array('l')
+        self._child_positions = array('l')
+        self._parent_offsets = array('l', [0])
+        self._parent_ids = array('l')
+        # edges changed since the last compaction, indexed from both ends; the child end has the
+        # edge's cell position, or None if it was removed, and the parent end whether it is present
+        self._delta_children: 'Dict[int, Dict[int, Optional[int]]]' = {}
+        self._delta_parents: 'Dict[int, Dict[int, bool]]' = {}
+        self._delta_size = 0
+        self._max_delta_size = _MIN_EDGES_BEFORE_COMPACTION
+
+    def register(self, dsym: 'DataSymbol') -> None:
+        if dsym.symbol_id != len(self.symbols):
+            raise ValueError('symbols must be registered in order of their symbol ids')
+        self.symbols.append(dsym)
+        self.defined_cell_nums.append(-1)
+        self.required_cell_nums.append(-1)
+        self._alive.append(1)
+
+    def release(self, dsym: 'DataSymbol') -> None:
+        """Marks a garbage collected symbol as dead, dropping the edges from its parents."""
+        symbol_id = dsym.symbol_id
+        if not self._alive[symbol_id]:
+            return
+        for parent_id in list(self.parent_ids(symbol_id)):
+            self._set_edge(parent_id, symbol_id, None)
+        self._alive[symbol_id] = 0
+        self.symbols[symbol_id] = None
+
+    def revive(self, dsym: 'DataSymbol') -> None:
+        """Marks a symbol that got updated again after it was collected as live again."""
+        symbol_id = dsym.symbol_id
+        if not self._alive[symbol_id]:
+            self._alive[symbol_id] = 1
+            self.symbols[symbol_id] = dsym
+
+    def add_edge(self, parent: 'DataSymbol', child: 'DataSymbol', position: int = -1) -> None:
+        """Adds an edge, or moves an existing one to a later cell position."""
+        self.revive(parent)
+        self.revive(child)
+        parent_id, child_id = parent.symbol_id, child.symbol_id
+        old_position = self.edge_position(parent_id, child_id)
+        if old_position is not None and old_position >= position:
+            return
+        self._set_edge(parent_id, child_id, position)
+
+    def remove_edge(self, parent: 'DataSymbol', child: 'DataSymbol') -> None:
+        parent_id, child_id = parent.symbol_id, child.symbol_id
+        if self.edge_position(parent_id, child_id) is not None:
+            self._set_edge(parent_id, child_id, None)
+
+    def has_edge(self, parent_id: int, child_id: int) -> bool:
+        return self.edge_position(parent_id, child_id) is not None
+
+    def edge_position(self, parent_id: int, child_id: int) -> 'Optional[int]':
+        """The cell position that the edge was introduced at, or None if there is no such edge."""
+        if not (self._alive[parent_id] and self._alive[child_id]):
+            return None
+        delta = self._delta_children.get(parent_id, None)
+        if delta is not None and child_id in delta:
+            return delta[child_id]
+        return self._compacted_position(parent_id, child_id)
+
+    def child_edges(self, symbol_id: int) -> 'Iterator[Tuple[int, int]]':
+        """Yields (child id, cell position) pairs for the symbol's children, even if it is dead."""
+        alive = self._alive
+        lo, hi = _row_bounds(self._child_offsets, symbol_id)
+        delta = self._delta_children.get(symbol_id, None)
+        for child_id, position in zip(self._child_ids[lo:hi], self._child_positions[lo:hi]):
+            if alive[child_id] and (delta is None or child_id not in delta):
+                yield child_id, position
+        if delta is not None:
+            for child_id, position in delta.items():
+                if position is not None and alive[child_id]:
+                    yield child_id, position
+
+    def child_ids(self, symbol_id: int) -> 'Iterator[int]':
+        return (child_id for child_id, _ in self.child_edges(symbol_id))
+
+    def parent_ids(self, symbol_id: int) -> 'Iterator[int]':
+        """Yields the ids of the symbol's live parents."""
+        alive = self._alive
+        if not alive[symbol_id]:
+            return
+        lo, hi = _row_bounds(self._parent_offsets, symbol_id)
+        delta = self._delta_parents.get(symbol_id, None)
+        for parent_id in self._parent_ids[lo:hi]:
+            if alive[parent_id] and (delta is None or parent_id not in delta):
+                yield parent_id
+        if delta is not None:
+            for parent_id, present in delta.items():
+                if present and alive[parent_id]:
+                    yield parent_id
+
+    def stale_symbols(self) -> 'List[DataSymbol]':
+        """
+        Symbols whose defined cell number is behind their required cell number. This is a scan over the
+        cell number arrays; staleness due to namespace members is not tracked here.
+        """
+        symbols = self.symbols
+        stale_ids = compress(count(), map(operator.lt, self.defined_cell_nums, self.required_cell_nums))
+        return [symbols[symbol_id] for symbol_id in stale_ids if symbols[symbol_id] is not None]
+
+    def compact(self) -> None:
+        num_symbols = len(self.symbols)
+        alive = self._alive
+        old_offsets = self._child_offsets
+        # one entry per edge in the rows, as parallel parent id, child id, and position columns
+        edge_parent_ids = array('l', chain.from_iterable(map(
+            repeat, range(len(old_offsets) - 1), map(operator.sub, old_offsets[1:], old_offsets[:-1])
+        )))
+        edge_child_ids, edge_positions = self._child_ids, self._child_positions
+        # keep the edges to live symbols that the log doesn't override; dead symbols keep their child edges
+        keep = map(alive.__getitem__, edge_child_ids)
+        delta_children = self._delta_children
+        if len(delta_children) > 0:
+            logged = {(parent_id, child_id) for parent_id, delta in delta_children.items() for child_id in delta}
+            keep = map(operator.gt, keep, map(logged.__contains__, zip(edge_parent_ids, edge_child_ids)))
+        keep_mask = bytearray(keep)
+        edge_parent_ids = array('l', compress(edge_parent_ids, keep_mask))
+        edge_child_ids = array('l', compress(edge_child_ids, keep_mask))
+        edge_positions = array('l', compress(edge_positions, keep_mask))
+        num_kept_edges = len(edge_parent_ids)
+        for parent_id, delta in delta_children.items():
+            for child_id, position in delta.items():
+                if position is not None and alive[child_id]:
+                    edge_parent_ids.append(parent_id)
+                    edge_child_ids.append(child_id)
+                    edge_positions.append(position)
+        if len(edge_parent_ids) > num_kept_edges:
+            # the kept edges are still in row order, but the logged ones need to be merged in
+            edge_order = _sort_order(edge_parent_ids, edge_child_ids, num_symbols)
+            edge_child_ids = array('l', map(edge_child_ids.__getitem__, edge_order))
+            edge_positions = array('l', map(edge_positions.__getitem__, edge_order))
+            edge_parent_ids = array('l', map(edge_parent_ids.__getitem__, edge_order))
+        child_ids, child_positions = edge_child_ids, edge_positions
+        # transpose; the sort is stable, and edges are already ordered by parent, so parent rows come out sorted
+        transposed_order = sorted(range(len(child_ids)), key=child_ids.__getitem__)
+        parent_ids = array('l', map(edge_parent_ids.__getitem__, transposed_order))
+        self._child_offsets = _row_offsets(edge_parent_ids, num_symbols)
+        self._child_ids, self._child_positions = child_ids, child_positions
+        self._parent_offsets = _row_offsets(array('l', map(child_ids.__getitem__, transposed_order)), num_symbols)
+        self._parent_ids = parent_ids
+        self._delta_children.clear()
+        self._delta_parents.clear()
+        self._delta_size = 0
+        self._max_delta_size = max(_MIN_EDGES_BEFORE_COMPACTION, int(self.compaction_ratio * len(child_ids)))
+        self.num_edges = len(child_ids)
+
+    def _maybe_compact(self) -> None:
+        if self._delta_size > self._max_delta_size:
+            self.compact()
+
+    def _compacted_position(self, parent_id: int, child_id: int) -> 'Optional[int]':
+        lo, hi = _row_bounds(self._child_offsets, parent_id)
+        idx = bisect_left(self._child_ids, child_id, lo, hi)
+        if idx < hi and self._child_ids[idx] == child_id:
+            return self._child_positions[idx]
+        return None
+
+    def _set_edge(self, parent_id: int, child_id: int, position: 'Optional[int]') -> None:
+        compacted_position = self._compacted_position(parent_id, child_id)
+        delta_children = self._delta_children
+        delta = delta_children.get(parent_id, None)
+        logged = delta is not None and child_id in delta
+        old_position = delta[child_id] if logged else compacted_position
+        if (old_position is None) != (position is None):
+            self.num_edges += 1 if position is not None else -1
+        if position == compacted_position:
+            # back in agreement with the compacted rows, so nothing to log
+            if logged:
+                del delta[child_id]
+                del self._delta_parents[child_id][parent_id]
+                self._delta_size -= 1
+            return
+        if not logged:
+            self._delta_size += 1
+        if delta is None:
+            delta = delta_children[parent_id] = {}
+        delta[child_id] = position
+        delta_parents = self._delta_parents
+        parent_delta = delta_parents.get(child_id, None)
+        if parent_delta is None:
+            parent_delta = delta_parents[child_id] = {}
+        parent_delta[parent_id] = position is not None
+        self._maybe_compact()
+
+
+class GraphStoreDataSymbol(DataSymbol):
+    """A DataSymbol whose edges and cell numbers live in the notebook's DependencyGraphStore."""
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        # edges are only made from both ends, through `add_parent`
+        kwargs['parents'] = None
+        super().__init__(*args, **kwargs)
+
+    @property
+    def defined_cell_num(self) -> int:
+        return self.safety.graph_store.defined_cell_nums[self.symbol_id]
+
+    @defined_cell_num.setter
+    def defined_cell_num(self, defined_cell_num: int):
+        self.safety.graph_store.defined_cell_nums[self.symbol_id] = defined_cell_num
+
+    @property
+    def required_cell_num(self) -> int:
+        return self.safety.graph_store.required_cell_nums[self.symbol_id]
+
+    @required_cell_num.setter
+    def required_cell_num(self, required_cell_num: int):
+        self.safety.graph_store.required_cell_nums[self.symbol_id] = required_cell_num
+
+    @property
+    def parents(self) -> 'Set[DataSymbol]':
+        return set(self.iter_parents())
+
+    @parents.setter
+    def parents(self, parents: 'Set[DataSymbol]'):
+        for parent in self.parents - parents:
+            self.remove_parent(parent)
+        for parent in parents:
+            self.add_parent(parent, -1)
+
+    def iter_parents(self) -> 'Iterable[DataSymbol]':
+        graph_store = self.safety.graph_store
+        symbols = graph_store.symbols
+        return [symbols[parent_id] for parent_id in graph_store.parent_ids(self.symbol_id)]
+
+    @property
+    def children_by_cell_position(self) -> 'Dict[int, Set[DataSymbol]]':
+        graph_store = self.safety.graph_store
+        symbols = graph_store.symbols
+        children_by_cell_position: 'Dict[int, Set[DataSymbol]]' = defaultdict(set)
+        for child_id, position in graph_store.child_edges(self.symbol_id):
+            children_by_cell_position[position].add(symbols[child_id])
+        return children_by_cell_position
+
+    def iter_children_by_cell_position(self) -> 'Iterable[Tuple[int, Set[DataSymbol]]]':
+        return self.children_by_cell_position.items()
+
+    def add_parent(self, parent: 'DataSymbol', position: int) -> None:
+        self.safety.graph_store.add_edge(parent, self, position)
+
+    def remove_parent(self, parent: 'DataSymbol') -> None:
+        self.safety.graph_store.remove_edge(parent, self)
+
+    def _remove_edges_for_collection(self) -> None:
+        self.safety.graph_store.release(self)
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+import logging
+from typing import cast, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+    from nbsafety.data_model.data_symbol import DataSymbol
+    from nbsafety.data_model.scope import NamespaceScope
+    from nbsafety.safety import NotebookSafety
+    # (epoch, symbol that was (re)defined at that epoch, position of the cell that did it)
+    Epoch = Tuple[int, DataSymbol, int]
+    # newest first, each later one with a smaller position than all those before it (see `_merge_epochs`)
+    Epochs = Tuple[Epoch, ...]
+
+logger = logging.getLogger(__name__)
+
+
+# Each symbol gets two nodes in the graph that we search for fresher ancestors:
+#   - its *parent* node, for staleness that comes from its ancestors (or those of the symbols containing it),
+#     which the eager UpdateProtocol would have recorded in `required_cell_num`;
+#   - its *namespace* node, for staleness that comes from the symbols in its namespace,
+#     which the eager UpdateProtocol would have recorded in `namespace_stale_symbols`.
+_PARENT = 0
+_NAMESPACE = 1
+
+_NO_EPOCHS: 'Epochs' = ()
+
+# when staleness propagates backwards across cells, every epoch gets this position, so that
+# the newest epoch always makes it past every edge that an older one would have
+_ANY_POSITION = -1
+
+
+def _merge_epochs(first: 'Epochs', second: 'Epochs') -> 'Epochs':
+    """
+    Epochs from both, minus those for which there is an epoch at least as new from a cell at the same
+    position or above, since anything the latter can't propagate to, the former can't either.
+    """
+    if len(first) == 0:
+        return second
+    if len(second) == 0:
+        return first
+    # fast paths for when the newest epoch of one makes every epoch of the other redundant
+    if second[0][0] >= first[0][0] and second[0][2] <= first[-1][2]:
+        return second
+    if first[0][0] >= second[0][0] and first[0][2] <= second[-1][2]:
+        return first
+    merged: 'List[Epoch]' = []
+    for epoch in sorted(first + second, key=lambda e: (-e[0], e[2])):
+        if len(merged) == 0 or epoch[2] < merged[-1][2]:
+            merged.append(epoch)
+    return tuple(merged)
+
+
+def _passing_epochs(epochs: 'Epochs', min_epoch: int, edge_pos: 'Optional[int]') -> 'Epochs':
+    """
+    The epochs later than `min_epoch` that make it past an edge introduced at `edge_pos`; the eager
+    UpdateProtocol doesn't propagate an update along edges introduced in the updating cell or in cells
+    above it. `edge_pos` is None for edges that every epoch makes it past.
+    """
+    start = 0
+    if edge_pos is not None:
+        while start < len(epochs) and epochs[start][2] >= edge_pos:
+            start += 1
+    end = start
+    while end < len(epochs) and epochs[end][0] > min_epoch:
+        end += 1
+    return epochs[start:end]
+
+
+class LazyStaleness(object):
+    """
+    Computes whether a symbol is stale on demand, instead of having each update eagerly mark
+    every transitive dependent of the updated symbol as stale.
+
+    A symbol is stale if some ancestor was (re)defined in a later cell than the symbol itself, where
+    a symbol's ancestors are its parents, the symbols whose namespace contains it, and the symbols in
+    its own namespace, with the same restrictions that the eager UpdateProtocol applies to each of
+    these (e.g., no propagation past class -> instance edges). The latest epoch reachable from each
+    node is memoized until the next call to `invalidate`, which should happen whenever symbols are
+    updated or redefined.
+
+    When staleness shouldn't propagate backwards across cells, an older update can reach a symbol
+    that a newer update to the same ancestor can't, so instead of just the latest epoch, each node
+    gets the latest epoch that makes it past each edge position (see `_merge_epochs`).
+    """
+    def __init__(self, safety: 'NotebookSafety'):
+        self.safety = safety
+        self._memo: 'Dict[int, Epochs]' = {}
+        # child symbol id -> parent symbol id -> parent epoch that the child is known to be up to date with
+        self._acknowledged_epochs: 'Dict[int, Dict[int, int]]' = {}
+        # parent symbol id -> ids of the children that have acknowledged one of its epochs
+        self._acknowledging_children: 'Dict[int, Set[int]]' = {}
+        # ids of collected symbols whose children no longer have edges back to them
+        self._detached_parents: 'Set[int]' = set()
+        # symbol id -> latest epochs that reached the symbol through the edges it lost to collected parents
+        self._inherited_epochs: 'Dict[int, Epochs]' = {}
+        # symbol id -> the symbol's own updates, with the positions of the cells that made them, for when
+        # staleness shouldn't propagate backwards across cells
+        self._update_epochs: 'Dict[int, Epochs]' = {}
+
+    def invalidate(self) -> None:
+        self._memo.clear()
+
+    def is_stale(self, dsym: 'DataSymbol') -> bool:
+        if dsym.defined_cell_num < dsym.required_cell_num:
+            return True
+        parent_epoch, namespace_epoch = self._stale_epochs(dsym)
+        return parent_epoch is not None or namespace_epoch is not None
+
+    def is_stale_from_ancestors(self, dsym: 'DataSymbol') -> bool:
+        """Like `is_stale`, but ignores staleness that only comes from the symbol's namespace."""
+        if dsym.defined_cell_num < dsym.required_cell_num:
+            return True
+        return self._stale_epochs(dsym)[0] is not None
+
+    def record_staleness(self, dsym: 'DataSymbol') -> None:
+        """
+        Records the staleness found for the symbol in the same fields the eager UpdateProtocol
+        writes to, so that warnings can consult them as usual.
+        """
+        parent_epoch, namespace_epoch = self._stale_epochs(dsym)
+        if parent_epoch is not None:
+            dsym.required_cell_num = max(dsym.required_cell_num, parent_epoch[0])
+            dsym.fresher_ancestors.add(parent_epoch[1])
+        if namespace_epoch is not None:
+            dsym.namespace_stale_symbols.add(namespace_epoch[1])
+
+    def _stale_epochs(self, dsym: 'DataSymbol') -> 'Tuple[Optional[Epoch], Optional[Epoch]]':
+        """The latest parent and namespace epochs if they are later than the symbol's own, or None for each if not."""
+        defined_cell_num = dsym.defined_cell_num
+        if defined_cell_num >= self.safety.cell_counter():
+            # nothing can have been updated more recently than the current cell
+            return None, None
+        parent_epoch = self._latest_epoch(dsym, _PARENT)
+        if parent_epoch is not None and parent_epoch[0] <= defined_cell_num:
+            parent_epoch = None
+        namespace_epoch = self._latest_epoch(dsym, _NAMESPACE)
+        if namespace_epoch is not None and namespace_epoch[0] <= defined_cell_num:
+            namespace_epoch = None
+        return parent_epoch, namespace_epoch
+
+    def acknowledge_update(self, updated_sym: 'DataSymbol', dependents: 'Iterable[DataSymbol]') -> None:
+        """
+        Keeps the latest update to `updated_sym` from making the given symbols stale, for updates that the
+        eager UpdateProtocol would not have propagated to them, e.g. because they appear on the RHS of the
+        update (like `inds` in `x = x[inds]`, where `inds = np.argsort(x)`), or because the update assigned
+        the same object again. Only direct dependents (children, or symbols whose namespace contains
+        `updated_sym`) are tracked.
+        """
+        epoch = updated_sym.defined_cell_num
+        updated_sym_id = updated_sym.symbol_id
+        acknowledging_children = self._acknowledging_children.get(updated_sym_id, None)
+        if acknowledging_children is None:
+            acknowledging_children = self._acknowledging_children[updated_sym_id] = set()
+        for dependent in dependents:
+            dependent_id = dependent.symbol_id
+            acknowledged_epochs = self._acknowledged_epochs.get(dependent_id, None)
+            if acknowledged_epochs is None:
+                acknowledged_epochs = self._acknowledged_epochs[dependent_id] = {}
+            acknowledged_epochs[updated_sym_id] = epoch
+            acknowledging_children.add(dependent_id)
+        self.invalidate()
+
+    def refresh(self, dsym: 'DataSymbol') -> None:
+        """Should be called whenever the symbol is (re)defined."""
+        symbol_id = dsym.symbol_id
+        if symbol_id in self._detached_parents:
+            # the symbol was collected, but it is being updated again, so its children depend on it again
+            self._detached_parents.discard(symbol_id)
+            for position, children in list(dsym.iter_children_by_cell_position()):
+                for child in list(children):
+                    child.add_parent(dsym, position)
+        if not self.safety.config.get('backwards_cell_staleness_propagation', True):
+            self._update_epochs[symbol_id] = _merge_epochs(
+                ((dsym.defined_cell_num, dsym, self.safety.active_cell_position_idx),),
+                self._update_epochs.get(symbol_id, _NO_EPOCHS),
+            )
+        # anything inherited is older than the symbol now
+        self._inherited_epochs.pop(symbol_id, None)
+        self.invalidate()
+
+    def forget(self, dsym: 'DataSymbol') -> None:
+        """
+        Drops everything recorded about a symbol that was collected. Its children should no longer
+        have edges back to it; they get added back if the symbol is ever (re)defined again.
+        """
+        symbol_id = dsym.symbol_id
+        for _, children in dsym.iter_children_by_cell_position():
+            if len(children) > 0:
+                self._detached_parents.add(symbol_id)
+            # the children may already be stale because of updates that reached them through the symbol
+            for child in children:
+                epochs = _passing_epochs(self._latest_epochs(child, _PARENT), child.defined_cell_num, None)
+                if len(epochs) > 0:
+                    self._inherited_epochs[child.symbol_id] = _merge_epochs(
+                        epochs, self._inherited_epochs.get(child.symbol_id, _NO_EPOCHS)
+                    )
+        self._inherited_epochs.pop(symbol_id, None)
+        acknowledged_epochs = self._acknowledged_epochs.pop(symbol_id, None)
+        if acknowledged_epochs is not None:
+            for parent_id in acknowledged_epochs:
+                acknowledging_children = self._acknowledging_children.get(parent_id, None)
+                if acknowledging_children is not None:
+                    acknowledging_children.discard(symbol_id)
+        for child_id in self._acknowledging_children.pop(symbol_id, ()):
+            child_acknowledged_epochs = self._acknowledged_epochs.get(child_id, None)
+            if child_acknowledged_epochs is not None:
+                child_acknowledged_epochs.pop(symbol_id, None)
+        self._update_epochs.pop(symbol_id, None)
+        self.invalidate()
+
+    def override(self, dsym: 'DataSymbol') -> None:
+        """Treats the symbol as up to date w.r.t. everything it currently depends on."""
+        parent_epoch = self._latest_epoch(dsym, _PARENT)
+        namespace_epoch = self._latest_epoch(dsym, _NAMESPACE)
+        dsym.defined_cell_num = max(
+            dsym.defined_cell_num,
+            dsym.required_cell_num,
+            -1 if parent_epoch is None else parent_epoch[0],
+            -1 if namespace_epoch is None else namespace_epoch[0],
+        )
+        dsym.namespace_stale_symbols = set()
+        dsym.fresher_ancestors = set()
+        self.invalidate()
+
+    def _own_epochs(self, dsym: 'DataSymbol') -> 'Epochs':
+        update_epochs = self._update_epochs.get(dsym.symbol_id, None)
+        if update_epochs is None:
+            return ((dsym.defined_cell_num, dsym, _ANY_POSITION),)
+        # the symbol may have been marked as up to date since, in which case that counts as its latest update
+        return _merge_epochs(((dsym.defined_cell_num, dsym, update_epochs[0][2]),), update_epochs)
+
+    def _predecessors(self, dsym: 'DataSymbol', kind: int) -> 'Iterator[Any]':
+        """
+        Yields either epochs that contribute directly to the node, or (symbol, kind, min epoch, edge position)
+        tuples for nodes whose latest epochs contribute to it if they are later than the min epoch and
+        make it past the edge (see `_passing_epochs`).
+        """
+        safety = self.safety
+        if kind == _NAMESPACE:
+            namespace = safety.namespaces.get(dsym.obj_id, None)
+            if namespace is None:
+                return
+            acknowledged_epochs = self._acknowledged_epochs.get(dsym.symbol_id, {})
+            # subscripts in runs have no dependencies, so they can't be stale
+            for ns_child in namespace.all_data_symbols_this_indentation(exclude_class=True, materialize_runs=False):
+                if acknowledged_epochs.get(ns_child.symbol_id, -1) >= ns_child.defined_cell_num:
+                    continue
+                # only stale symbols pass staleness on to the symbols whose namespace contains them
+                yield ns_child, _PARENT, ns_child.defined_cell_num, None
+                yield ns_child, _NAMESPACE, ns_child.defined_cell_num, None
+            return
+        inherited_epoch = self._inherited_epochs.get(dsym.symbol_id, None)
+        if inherited_epoch is not None:
+            yield inherited_epoch
+        parents = dsym.iter_parents()
+        if parents:
+            dsym_namespace = dsym.namespace
+            acknowledged_epochs = self._acknowledged_epochs.get(dsym.symbol_id, {})
+            backwards_propagation = safety.config.get('backwards_cell_staleness_propagation', True)
+            for parent in parents:
+                if acknowledged_epochs.get(parent.symbol_id, -1) >= parent.defined_cell_num:
+                    continue
+                edge_pos = None
+                if not backwards_propagation:
+                    edge_pos = max((
+                        pos for pos, children in parent.iter_children_by_cell_position() if dsym in children
+                    ), default=-1)
+                parent_epochs = _passing_epochs(self._own_epochs(parent), -1, edge_pos)
+                if len(parent_epochs) > 0:
+                    yield parent_epochs
+                # don't propagate along class -> instance edges
+                if (dsym_namespace is not None and dsym_namespace.cloned_from is not None
+                        and dsym_namespace.cloned_from.obj_id == parent.obj_id):
+                    continue
+                yield parent, _PARENT, -1, edge_pos
+                yield parent, _NAMESPACE, -1, edge_pos
+        containing_scope = cast('NamespaceScope', dsym.containing_scope)
+        if containing_scope is not None and containing_scope.is_namespace_scope:
+            for containing_alias in safety.aliases.get(containing_scope.obj_id, ()):
+                # only stale containing symbols pass staleness on to the symbols in their namespace
+                yield containing_alias, _PARENT, containing_alias.defined_cell_num, None
+
+    def _latest_epoch(self, root: 'DataSymbol', root_kind: int) -> 'Optional[Epoch]':
+        epochs = self._latest_epochs(root, root_kind)
+        return epochs[0] if len(epochs) > 0 else None
+
+    def _latest_epochs(self, root: 'DataSymbol', root_kind: int) -> 'Epochs':
+        root_key = 2 * root.symbol_id + root_kind
+        memo = self._memo
+        cached = memo.get(root_key, None)
+        if cached is not None:
+            return cached
+        # Iterative DFS. Nodes whose search ran into a node still on the stack (i.e., a cycle) only
+        # have a partial result when they finish, which we use for the rest of this search, but don't
+        # memoize. Every node on such a cycle is an ancestor of the root, so the root's result is complete.
+        partial: 'Dict[int, Epochs]' = {}
+        on_stack = {root_key}
+        # frames of [key, predecessors, latest epochs, whether the result is only partial,
+        #            min epoch for the caller, edge position for the caller]
+        stack: 'List[List[Any]]' = [[root_key, self._predecessors(root, root_kind), _NO_EPOCHS, False, -1, None]]
+        while True:
+            frame = stack[-1]
+            for pred in frame[1]:
+                if isinstance(pred[0], tuple):
+                    # epochs that contribute directly
+                    frame[2] = _merge_epochs(frame[2], pred)
+                    continue
+                pred_sym, pred_kind, min_epoch, edge_pos = pred
+                pred_key = 2 * pred_sym.symbol_id + pred_kind
+                pred_epochs = memo.get(pred_key, None)
+                if pred_epochs is None:
+                    if pred_key in on_stack:
+                        frame[3] = True
+                        continue
+                    pred_epochs = partial.get(pred_key, None)
+                    if pred_epochs is None:
+                        on_stack.add(pred_key)
+                        stack.append([
+                            pred_key, self._predecessors(pred_sym, pred_kind), _NO_EPOCHS, False, min_epoch, edge_pos
+                        ])
+                        break
+                    frame[3] = True
+                frame[2] = _merge_epochs(frame[2], _passing_epochs(pred_epochs, min_epoch, edge_pos))
+            else:
+                stack.pop()
+                key, _, epochs, is_partial, min_epoch, edge_pos = frame
+                on_stack.discard(key)
+                if len(stack) == 0:
+                    memo[key] = epochs
+                    return epochs
+                if is_partial:
+                    partial[key] = epochs
+                else:
+                    memo[key] = epochs
+                parent_frame = stack[-1]
+                parent_frame[3] = parent_frame[3] or is_partial
+                parent_frame[2] = _merge_epochs(parent_frame[2], _passing_epochs(epochs, min_epoch, edge_pos))
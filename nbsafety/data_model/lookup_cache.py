@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import logging
+from typing import TYPE_CHECKING
+
+from nbsafety.analysis import AttrSubSymbolChain, CallPoint
+from nbsafety.data_model.scope import Scope
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Tuple
+    from nbsafety.data_model.data_symbol import DataSymbol
+    from nbsafety.data_model.scope import NamespaceScope
+    from nbsafety.safety import NotebookSafety
+    from nbsafety.types import SupportedIndexType
+
+logger = logging.getLogger(__name__)
+
+
+class _CachedLookup(object):
+    """
+    A resolution made from `scope`, along with what it depended on: the version of each name looked up in
+    every scope consulted, and, for chains, the object id each intermediate symbol had when we went on to look
+    in its namespace.
+    """
+    __slots__ = ('scope', 'name_versions', 'namespace_hops', 'result', 'is_cacheable', 'check_staleness')
+
+    def __init__(self, scope: 'Scope'):
+        self.scope = scope
+        self.name_versions: 'List[Tuple[Scope, SupportedIndexType, int]]' = []
+        self.namespace_hops: 'List[Tuple[DataSymbol, int, Optional[NamespaceScope]]]' = []
+        self.result: 'Any' = None
+        self.is_cacheable = True
+        self.check_staleness = False
+
+    def is_valid(self, safety: 'NotebookSafety') -> bool:
+        if not self.is_cacheable:
+            return False
+        for scope, name, version in self.name_versions:
+            if scope.name_version(name) != version:
+                return False
+        for dsym, obj_id, namespace in self.namespace_hops:
+            if dsym.obj_id != obj_id or safety.namespaces.get(obj_id, None) is not namespace:
+                return False
+        return True
+
+
+class SymbolLookupCache(object):
+    """
+    Remembers the DataSymbols that names and attribute / subscript chains resolved to at one statement, so that
+    executing the statement again doesn't have to walk the same scopes and namespaces again.
+
+    Entries are checked against the versions that the scopes they consulted keep for each name, which get
+    bumped whenever the symbol for that name changes, so that e.g. a function's locals getting rebound on every
+    call doesn't invalidate its lookups of globals. Chains are checked against the objects tracked by the
+    symbols along the way rather than by reading each attribute or subscript off of the live objects again.
+
+    Caches belong to the call scope of the function whose statement they are for, and are dropped when the
+    function is redefined or collected.
+    """
+    def __init__(self, safety: 'NotebookSafety'):
+        self.safety = safety
+        self._name_entries: 'Dict[SupportedIndexType, _CachedLookup]' = {}
+        self._chain_entries: 'Dict[AttrSubSymbolChain, _CachedLookup]' = {}
+
+    def lookup_data_symbol_by_name(self, scope: 'Scope', name: 'SupportedIndexType') -> 'Optional[DataSymbol]':
+        entry = self._name_entries.get(name, None)
+        if entry is None or entry.scope is not scope or not entry.is_valid(self.safety):
+            entry = _CachedLookup(scope)
+            entry.result = self._resolve_name(scope, name, entry)
+            self._name_entries[name] = entry
+        return entry.result
+
+    def get_most_specific_data_symbol_for_attrsub_chain(
+            self, scope: 'Scope', chain: AttrSubSymbolChain
+    ) -> 'Tuple[Optional[DataSymbol], Optional[DataSymbol], bool]':
+        entry = self._chain_entries.get(chain, None)
+        if entry is None or entry.scope is not scope or not entry.is_valid(self.safety):
+            entry = _CachedLookup(scope)
+            entry.result = self._resolve_chain(scope, chain, entry)
+            self._chain_entries[chain] = entry
+        dsym, next_dsym, success = entry.result
+        if entry.check_staleness:
+            # same hack as in `Scope.get_most_specific_data_symbol_for_attrsub_chain`; it depends on
+            # the staleness of `dsym`, so it gets checked every time
+            if dsym.is_stale and not dsym.is_stale_from_ancestors:
+                dsym = None
+        return dsym, next_dsym, success
+
+    @staticmethod
+    def _resolve_name(scope: 'Scope', name: 'SupportedIndexType', entry: '_CachedLookup') -> 'Optional[DataSymbol]':
+        # mirrors `Scope.lookup_data_symbol_by_name`
+        cur_scope: 'Optional[Scope]' = scope
+        while cur_scope is not None:
+            dsym = cur_scope.lookup_data_symbol_by_name_this_indentation(name)
+            # recorded after the lookup, since it may have materialized a subscript symbol
+            clone = cur_scope
+            while clone is not None:
+                entry.name_versions.append((clone, name, clone.name_version(name)))
+                clone = getattr(clone, 'cloned_from', None)
+            if dsym is not None:
+                return dsym
+            cur_scope = cur_scope.non_namespace_parent_scope
+        return None
+
+    def _resolve_chain(
+            self, scope: 'Scope', chain: AttrSubSymbolChain, entry: '_CachedLookup'
+    ) -> 'Tuple[Optional[DataSymbol], Optional[DataSymbol], bool]':
+        # mirrors `Scope.get_most_specific_data_symbol_for_attrsub_chain`, minus the staleness hack
+        cur_scope = scope
+        dsym, next_dsym, success = None, None, False
+        obj = None
+        for name in chain.symbols:
+            if isinstance(name, CallPoint):
+                next_dsym = self._resolve_name(cur_scope, name.symbol, entry)
+                break
+            next_dsym = self._resolve_name(cur_scope, name, entry)
+            if dsym is not None and next_dsym is None:
+                entry.check_staleness = True
+                break
+            dsym, next_dsym = next_dsym, None
+            try:
+                obj = Scope._get_member(obj, dsym, name)
+            except (KeyError, IndexError, Exception):
+                # nothing to validate against once the attribute or subscript shows up
+                entry.is_cacheable = False
+                break
+            cur_scope = self.safety.namespaces.get(id(obj), None)
+            entry.namespace_hops.append((dsym, id(obj), cur_scope))
+            if cur_scope is None:
+                break
+        else:
+            success = True
+        return dsym, next_dsym, success
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
-import inspect
+from bisect import bisect_right
 import itertools
-from typing import TYPE_CHECKING
+from typing import cast, TYPE_CHECKING
 import weakref
 
 from IPython import get_ipython
@@ -14,12 +14,49 @@ from nbsafety.analysis import AttrSubSymbolChain, CallPoint
 from nbsafety.data_model.data_symbol import DataSymbol, DataSymbolType
 
 if TYPE_CHECKING:
-    from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+    from typing import Any, Callable, Dict, Iterable, List, MutableMapping, Optional, Set, Tuple, Union
     import ast
+    from nbsafety.data_model.lookup_cache import SymbolLookupCache
     from nbsafety.safety import NotebookSafety
     from nbsafety.types import SupportedIndexType
 
 
+def _lookup_any_member(obj: 'Any', name: str) -> 'Any':
+    # what `inspect.getmembers` would have found for `name`, without evaluating every other member
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        raise KeyError(name)
+
+
+def _lookup_instance_member(obj: 'Any', name: str) -> 'Any':
+    try:
+        instance_dict = obj.__dict__
+    except Exception:  # noqa
+        return _lookup_any_member(obj, name)
+    return instance_dict[name]
+
+
+def _lookup_dataframe_column(obj: 'Any', name: str) -> 'Any':
+    # pandas doesn't play nicely w/ inspect.getmembers, so we only resolve columns
+    if name not in obj.columns:
+        raise KeyError(name)
+    return getattr(obj, name)
+
+
+def _choose_member_lookup(obj_type: type) -> 'Callable[[Any, str], Any]':
+    if pandas is not None and issubclass(obj_type, pandas.DataFrame):
+        return _lookup_dataframe_column
+    if any('__dict__' in vars(klass) for klass in obj_type.__mro__):
+        return _lookup_instance_member
+    # e.g. slotted classes and builtins
+    return _lookup_any_member
+
+
+# how to get a single member of an instance, by type of instance
+_member_lookup_by_type: 'MutableMapping[type, Callable[[Any, str], Any]]' = weakref.WeakKeyDictionary()
+
+
 class Scope(object):
     GLOBAL_SCOPE_NAME = '<module>'
 
@@ -33,6 +70,13 @@ class Scope(object):
         self.scope_name = scope_name
         self.parent_scope = parent_scope  # None iff this is the global scope
         self._data_symbol_by_name: Dict[SupportedIndexType, DataSymbol] = {}
+        # bumped whenever the symbols this scope resolves names to change; each name remembers the version
+        # at which it last changed, so that cached lookups only depend on the names they actually looked up
+        self.version = 0
+        self._name_versions: Dict[SupportedIndexType, int] = {}
+        self._min_name_version = 0
+        # cached lookups for the statements of the function this is the call scope of, by statement id
+        self.symbol_lookup_caches: Dict[int, SymbolLookupCache] = {}
 
     def __hash__(self):
         return hash(self.full_path)
@@ -68,6 +112,19 @@ class Scope(object):
     def put(self, name: 'SupportedIndexType', val: DataSymbol):
         self._data_symbol_by_name[name] = val
         val.containing_scope = self
+        self._bump_name_version(name)
+
+    def name_version(self, name: 'SupportedIndexType') -> int:
+        return self._name_versions.get(name, self._min_name_version)
+
+    def _bump_name_version(self, name: 'SupportedIndexType') -> None:
+        self.version += 1
+        self._name_versions[name] = self.version
+
+    def _bump_all_name_versions(self) -> None:
+        self.version += 1
+        self._name_versions.clear()
+        self._min_name_version = self.version
 
     def lookup_data_symbol_by_name_this_indentation(self, name) -> 'Optional[DataSymbol]':
         return self._data_symbol_by_name.get(name, None)
@@ -82,26 +139,24 @@ class Scope(object):
         return ret
 
     @staticmethod
-    def _get_name_to_obj_mapping(obj, dc) -> 'Dict[SupportedIndexType, Any]':
+    def _get_member(obj, dc, name: 'SupportedIndexType') -> 'Any':
+        """Raises KeyError (or whatever the lookup raises) if `obj` has no member called `name`."""
         if obj is None:
-            return get_ipython().ns_table['user_global']
+            return get_ipython().ns_table['user_global'][name]
         elif dc is not None and dc.is_subscript:
-            return obj
-        else:
-            try:
-                if (pandas is not None) and isinstance(obj, pandas.DataFrame):
-                    # FIXME: hack to get it working w/ pandas, which doesn't play nicely w/ inspect.getmembers
-                    name_to_obj = {}
-                    for col in obj.columns:
-                        try:
-                            name_to_obj[col] = getattr(obj, col)
-                        except:
-                            continue
-                else:
-                    name_to_obj = obj.__dict__
-            except:  # noqa
-                return dict(inspect.getmembers(obj))
-        return name_to_obj
+            return obj[name]
+        elif not isinstance(name, str):
+            # only subscripts can be anything other than strings
+            raise KeyError(name)
+        obj_type = type(obj)
+        try:
+            lookup_member = _member_lookup_by_type[obj_type]
+        except KeyError:
+            lookup_member = _member_lookup_by_type[obj_type] = _choose_member_lookup(obj_type)
+        except TypeError:
+            # not weakly referenceable, so don't bother caching
+            lookup_member = _choose_member_lookup(obj_type)
+        return lookup_member(obj, name)
 
     def get_most_specific_data_symbol_for_attrsub_chain(self, chain: AttrSubSymbolChain):
         """
@@ -118,12 +173,12 @@ class Scope(object):
             if dsym is not None and next_dsym is None:
                 # HUGE HACK: prevents us from checking namespace symbols unless entire namespace is stale
                 # TODO: get rid of this check once namespace symbols created for dictionary literals
-                if dsym.is_stale and dsym.defined_cell_num >= dsym.required_cell_num:
+                if dsym.is_stale and not dsym.is_stale_from_ancestors:
                     dsym = None
                 break
             dsym, next_dsym = next_dsym, None
             try:
-                obj = Scope._get_name_to_obj_mapping(obj, dsym)[name]
+                obj = Scope._get_member(obj, dsym, name)
             except (KeyError, IndexError, Exception):
                 break
             cur_scope = self.safety.namespaces.get(id(obj), None)
@@ -193,6 +248,9 @@ class Scope(object):
             if name in self.data_symbol_by_name(old_dc.is_subscript) and old_dc.symbol_type == symbol_type:
                 old_dc.update_obj_ref(obj, refresh_cached=False)
                 # old_dc.update_type(symbol_type)
+                if old_dc.call_scope is not None and stmt_node is not old_dc.stmt_node:
+                    # the statements of the old function body won't run again
+                    old_dc.call_scope.symbol_lookup_caches.clear()
                 old_dc.update_stmt_node(stmt_node)
                 return old_dc, old_dc, old_id
             else:
@@ -215,7 +273,9 @@ class Scope(object):
                 # EDIT: added check to avoid propagating along class -> instance edge when class not redefined, so now
                 # it is important to explicitly add this dep.
                 deps.add(old_dc)
-        dc = DataSymbol(name, symbol_type, obj, self, self.safety, stmt_node=stmt_node, parents=deps, refresh_cached_obj=False)
+        dc = self.safety.data_symbol_class(
+            name, symbol_type, obj, self, self.safety, stmt_node=stmt_node, parents=deps, refresh_cached_obj=False
+        )
         self.put(name, dc)
         return dc, old_dc, old_id
 
@@ -265,6 +325,28 @@ class Scope(object):
         return str(dc.name)
 
 
+# subscripted objects that can't be mutated through other references to them, so that their subscript
+# symbols can go without aliases until something looks them up
+_RUN_ELEMENT_TYPES = frozenset([bool, bytes, complex, float, int, str, type(None)])
+
+
+class SubscriptRun(object):
+    """
+    Consecutive integer subscripts [start, stop) of a container that have no DataSymbols of their own.
+    Each stands for a subscript symbol with no dependencies, defined by `stmt_node` in `defined_cell_num`.
+    """
+    __slots__ = ('start', 'stop', 'stmt_node', 'defined_cell_num')
+
+    def __init__(self, start: int, stop: int, stmt_node: 'ast.AST', defined_cell_num: int):
+        self.start = start
+        self.stop = stop
+        self.stmt_node = stmt_node
+        self.defined_cell_num = defined_cell_num
+
+    def __len__(self):
+        return self.stop - self.start
+
+
 class NamespaceScope(Scope):
     # TODO: support (multiple) inheritance by allowing
     #  NamespaceScopes from classes to clone their parent class's NamespaceScopes
@@ -279,6 +361,9 @@ class NamespaceScope(Scope):
         self.safety.namespaces[obj_id] = self
         self.max_defined_timestamp = 0
         self._subscript_data_symbol_by_name: Dict[SupportedIndexType, DataSymbol] = {}
+        # sorted and disjoint; a subscript only gets a DataSymbol once something needs one for it
+        self._subscript_runs: List[SubscriptRun] = []
+        self._subscript_run_starts: List[int] = []
 
     @property
     def is_garbage(self):
@@ -303,6 +388,9 @@ class NamespaceScope(Scope):
             raise ValueError('precondition failed; namespace should no longer be registered before we can clear')
         self._data_symbol_by_name.clear()
         self._subscript_data_symbol_by_name.clear()
+        self._subscript_runs.clear()
+        self._subscript_run_starts.clear()
+        self._bump_all_name_versions()
 
     def _update_obj_ref_inner(self, obj):
         tombstone = False
@@ -316,6 +404,7 @@ class NamespaceScope(Scope):
     def _obj_reference_expired_callback(self, *_):
         self._tombstone = True
         self.safety.garbage_namespace_obj_ids.add(self.obj_id)
+        self.safety.add_namespace_garbage_candidates(self)
 
     def data_symbol_by_name(self, is_subscript=False):
         if is_subscript:
@@ -330,6 +419,8 @@ class NamespaceScope(Scope):
         cloned.update_obj_ref(obj)
         cloned._data_symbol_by_name = {}
         cloned._subscript_data_symbol_by_name = {}
+        cloned._subscript_runs = []
+        cloned._subscript_run_starts = []
         self.child_clones.append(cloned)
         return cloned
 
@@ -354,11 +445,21 @@ class NamespaceScope(Scope):
             ret = self._subscript_data_symbol_by_name.get(name, None)
         else:
             ret = self._data_symbol_by_name.get(name, None)
+        if ret is None and is_subscript is not False and len(self._subscript_runs) > 0:
+            ret = self._materialize_subscript(name)
         if ret is None and self.cloned_from is not None:
             ret = self.cloned_from.lookup_data_symbol_by_name_this_indentation(name)
         return ret
 
-    def all_data_symbols_this_indentation(self, exclude_class=False, is_subscript=None) -> 'Iterable[DataSymbol]':
+    def all_data_symbols_this_indentation(
+            self, exclude_class=False, is_subscript=None, materialize_runs=True
+    ) -> 'Iterable[DataSymbol]':
+        """
+        Callers that can account for subscript runs without DataSymbols for each of their subscripts
+        should pass `materialize_runs=False`; the rest get DataSymbols for all of them.
+        """
+        if materialize_runs and is_subscript is not False:
+            self._materialize_subscript_runs()
         if is_subscript is None:
             dsym_collections_to_chain: List[Iterable] = [
                 self._data_symbol_by_name.values(), self._subscript_data_symbol_by_name.values()
@@ -373,7 +474,7 @@ class NamespaceScope(Scope):
 
     @property
     def num_subscript_symbols(self):
-        return len(self._subscript_data_symbol_by_name)
+        return len(self._subscript_data_symbol_by_name) + sum(map(len, self._subscript_runs))
 
     @property
     def num_dotted_symbols(self):
@@ -385,16 +486,136 @@ class NamespaceScope(Scope):
 
     def put(self, name: 'SupportedIndexType', val: DataSymbol):
         if val.is_subscript:
+            if len(self._subscript_runs) > 0:
+                run_idx = self._find_subscript_run(name)
+                if run_idx is not None:
+                    # only int indices are ever found in runs
+                    self._split_subscript_run(run_idx, cast(int, name))
             self._subscript_data_symbol_by_name[name] = val
         else:
             if not isinstance(name, str):
                 raise TypeError('%s should be a string' % name)
             self._data_symbol_by_name[name] = val
         val.containing_scope = self
+        self._bump_name_version(name)
 
     def refresh(self):
         self.max_defined_timestamp = self.safety.cell_counter()
 
+    def add_subscript_to_run(self, index: 'SupportedIndexType', obj: 'Any', stmt_node: 'ast.AST') -> bool:
+        """
+        Records a new subscript with no dependencies as part of a run instead of creating a DataSymbol for it,
+        when subscript runs are enabled. Returns False if it didn't, in which case the caller should upsert
+        a DataSymbol as usual.
+
+        Only immutable scalar elements go in runs. Mutable elements, e.g. rows appended to a list of lists,
+        still get a DataSymbol each, since mutations made through other names for an element only reach
+        the container by way of the element's own symbol in `safety.aliases`.
+        """
+        if not self.safety.config.subscript_runs or type(index) is not int or type(obj) not in _RUN_ELEMENT_TYPES:
+            return False
+        # we need to be able to get the subscripted object back when the time comes to materialize it
+        if self._obj_ref is None or self._obj_ref() is None:
+            return False
+        if index in self._subscript_data_symbol_by_name or self._find_subscript_run(index) is not None:
+            return False
+        defined_cell_num = self.safety.cell_counter()
+        self._bump_name_version(index)
+        runs = self._subscript_runs
+        run_idx = bisect_right(self._subscript_run_starts, index)
+        if run_idx > 0:
+            prev_run = runs[run_idx - 1]
+            if (
+                prev_run.stop == index
+                and prev_run.stmt_node is stmt_node
+                and prev_run.defined_cell_num == defined_cell_num
+            ):
+                prev_run.stop += 1
+                return True
+        runs.insert(run_idx, SubscriptRun(index, index + 1, stmt_node, defined_cell_num))
+        self._subscript_run_starts.insert(run_idx, index)
+        return True
+
+    def refresh_subscript_runs(self):
+        for run in self._subscript_runs:
+            run.defined_cell_num = self.safety.cell_counter()
+
+    def _find_subscript_run(self, index: 'SupportedIndexType') -> 'Optional[int]':
+        if type(index) is not int:
+            return None
+        run_idx = bisect_right(self._subscript_run_starts, index) - 1
+        if run_idx >= 0 and index < self._subscript_runs[run_idx].stop:
+            return run_idx
+        return None
+
+    def _split_subscript_run(self, run_idx: int, index: int):
+        runs, starts = self._subscript_runs, self._subscript_run_starts
+        run = runs[run_idx]
+        if index + 1 < run.stop:
+            runs.insert(run_idx + 1, SubscriptRun(index + 1, run.stop, run.stmt_node, run.defined_cell_num))
+            starts.insert(run_idx + 1, index + 1)
+        run.stop = index
+        if run.start == run.stop:
+            del runs[run_idx]
+            del starts[run_idx]
+
+    def _make_subscript_symbol(self, run: SubscriptRun, index: int, container: 'Any') -> 'Optional[DataSymbol]':
+        try:
+            obj = container[index]
+        except Exception:  # noqa
+            # e.g. the container shrank since the run was recorded
+            return None
+        dsym = self.safety.data_symbol_class(
+            index, DataSymbolType.SUBSCRIPT, obj, self, self.safety, stmt_node=run.stmt_node, refresh_cached_obj=True
+        )
+        # same state that `upsert_data_symbol_for_name` would have left the symbol in
+        dsym.defined_cell_num = run.defined_cell_num
+        dsym.required_cell_num = -1
+        self._subscript_data_symbol_by_name[index] = dsym
+        self._bump_name_version(index)
+        if run.defined_cell_num == self.safety.cell_counter():
+            self.safety.updated_symbols.add(dsym)
+        return dsym
+
+    def _materialize_subscript(self, index: 'SupportedIndexType') -> 'Optional[DataSymbol]':
+        run_idx = self._find_subscript_run(index)
+        if run_idx is None:
+            return None
+        container = self._obj_ref()
+        if container is None:
+            return None
+        run = self._subscript_runs[run_idx]
+        # only int indices are ever found in runs
+        int_index = cast(int, index)
+        dsym = self._make_subscript_symbol(run, int_index, container)
+        if dsym is not None:
+            self._split_subscript_run(run_idx, int_index)
+        return dsym
+
+    def _materialize_subscript_runs(self):
+        if len(self._subscript_runs) == 0:
+            return
+        container = None if self._obj_ref is None else self._obj_ref()
+        if container is not None:
+            for run in self._subscript_runs:
+                for index in range(run.start, run.stop):
+                    self._make_subscript_symbol(run, index, container)
+        self._subscript_runs.clear()
+        self._subscript_run_starts.clear()
+
+    def _subscript_runs_contain_obj_id(self, obj_id: int) -> bool:
+        container = None if self._obj_ref is None else self._obj_ref()
+        if container is None:
+            return False
+        for run in self._subscript_runs:
+            for index in range(run.start, run.stop):
+                try:
+                    if id(container[index]) == obj_id:
+                        return True
+                except Exception:  # noqa
+                    break
+        return False
+
     def get_earliest_ancestor_containing(self, obj_id: int, is_subscript: bool) -> 'Optional[NamespaceScope]':
         # TODO: test this properly
         ret = None
@@ -402,9 +623,14 @@ class NamespaceScope(Scope):
             ret = self.namespace_parent_scope.get_earliest_ancestor_containing(obj_id, is_subscript)
         if ret is not None:
             return ret
-        set_to_check = map(lambda dsym: dsym.obj_id, self.all_data_symbols_this_indentation(is_subscript=is_subscript))
+        set_to_check = map(
+            lambda dsym: dsym.obj_id,
+            self.all_data_symbols_this_indentation(is_subscript=is_subscript, materialize_runs=False)
+        )
         if obj_id in set_to_check:
             return self
+        elif is_subscript is not False and self._subscript_runs_contain_obj_id(obj_id):
+            return self
         else:
             return None
 
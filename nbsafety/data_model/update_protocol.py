@@ -3,14 +3,75 @@ import logging
 from typing import cast, TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from typing import Set
+    from typing import Generator, Iterable, List, Optional, Set
     from nbsafety.data_model.data_symbol import DataSymbol
     from nbsafety.data_model.scope import NamespaceScope
     from nbsafety.safety import NotebookSafety
+    # a step of the propagation; it yields the steps it would otherwise have made recursive calls to
+    PropagationStep = Generator['PropagationStep', None, None]
 
 logger = logging.getLogger(__name__)
 
 
+class VisitedSymbols(object):
+    """
+    Set of DataSymbols keyed by their integer symbol ids, backed by a bytearray of marks.
+    The marks are meant to be reused across update protocol runs; `clear` only resets
+    the marks that were set. Hot loops may test and set `marks` directly, so long as
+    they append newly marked symbols to `visited` and `reserve` room for them first.
+    """
+    __slots__ = ('marks', 'visited')
+
+    def __init__(self):
+        self.marks = bytearray()
+        self.visited: 'List[DataSymbol]' = []
+
+    def reserve(self, num_symbol_ids: int) -> None:
+        if num_symbol_ids > len(self.marks):
+            self.marks.extend(bytes(max(num_symbol_ids, 2 * len(self.marks)) - len(self.marks)))
+
+    def __contains__(self, dsym: 'DataSymbol') -> bool:
+        symbol_id = dsym.symbol_id
+        return symbol_id < len(self.marks) and self.marks[symbol_id] != 0
+
+    def __iter__(self) -> 'Iterable[DataSymbol]':
+        return iter(self.visited)
+
+    def __len__(self) -> int:
+        return len(self.visited)
+
+    def add(self, dsym: 'DataSymbol') -> None:
+        symbol_id = dsym.symbol_id
+        self.reserve(symbol_id + 1)
+        if self.marks[symbol_id] == 0:
+            self.marks[symbol_id] = 1
+            self.visited.append(dsym)
+
+    def update(self, dsyms: 'Iterable[DataSymbol]') -> None:
+        for dsym in dsyms:
+            self.add(dsym)
+
+    def clear(self) -> None:
+        marks = self.marks
+        for dsym in self.visited:
+            marks[dsym.symbol_id] = 0
+        self.visited.clear()
+
+
+def _run_to_completion(step: 'PropagationStep') -> None:
+    # Runs the steps depth-first on an explicit stack, so that they happen in exactly
+    # the order that the equivalent recursive calls would, but without growing the
+    # Python stack (and hitting the recursion limit) on long dependency chains.
+    stack = [step]
+    push, pop = stack.append, stack.pop
+    while stack:
+        next_step = next(stack[-1], None)
+        if next_step is None:
+            pop()
+        else:
+            push(next_step)
+
+
 class UpdateProtocol(object):
     def __init__(
             self,
@@ -23,38 +84,95 @@ class UpdateProtocol(object):
         self.updated_sym = updated_sym
         self.new_deps = new_deps
         self.mutated = mutated
-        self.seen: Set[DataSymbol] = set()
+        self.seen: 'Optional[VisitedSymbols]' = None
+        self._marks = bytearray()
+        self._visited: 'List[DataSymbol]' = []
 
     def __call__(self, propagate=True):
+        self.seen = self.safety.acquire_visited_symbols()
+        # symbols only get created while propagating when subscript runs get materialized (which reserves
+        # room for them), so there is room to mark all of them directly
+        self.seen.reserve(self.safety.num_symbol_ids)
+        self._marks = self.seen.marks
+        self._visited = self.seen.visited
+        try:
+            self._run(propagate)
+        finally:
+            self.safety.release_visited_symbols(self.seen)
+            self.seen = None
+
+    def _visit(self, dsym: 'DataSymbol') -> bool:
+        """Marks the symbol as seen, returning whether it had not been seen before."""
+        symbol_id = dsym.symbol_id
+        if self._marks[symbol_id]:
+            return False
+        self._marks[symbol_id] = 1
+        self._visited.append(dsym)
+        return True
+
+    def _run(self, propagate):
         namespace_refresh = None
         if propagate:
             if self.mutated or self.updated_sym.obj_id != self.updated_sym.cached_obj_id:
-                self._collect_updated_symbols(self.updated_sym, skip_aliases=not self.mutated)
+                _run_to_completion(self._collect_updated_symbols(self.updated_sym, skip_aliases=not self.mutated))
             if self.updated_sym.cached_obj_id is not None:
                 # TODO: also condition on non simple assign
                 namespace = self.safety.namespaces.get(self.updated_sym.obj_id, None)
                 if namespace is not None:
                     # TODO: go deeper?
-                    namespace_refresh = set(namespace.all_data_symbols_this_indentation())
+                    namespace_refresh = set(namespace.all_data_symbols_this_indentation(materialize_runs=False))
+                    namespace.refresh_subscript_runs()
         updated_symbols = set(self.seen)
         self.safety.updated_symbols |= updated_symbols
-        self.seen |= self.new_deps  # don't propagate to stuff on RHS
-        for dsym in updated_symbols:
-            self._propagate_staleness_to_deps(dsym, skip_seen_check=True)
+        self.seen.update(self.new_deps)  # don't propagate to stuff on RHS
+        if self.safety.lazy_staleness is None:
+            for dsym in updated_symbols:
+                _run_to_completion(self._propagate_staleness_to_deps(dsym, skip_seen_check=True))
         # important! don't bump defined_cell_num until the very end!
         #  need to wait until here because, by default,
         #  we don't want to propagate to symbols defined in the same cell
-        for updated_sym in updated_symbols:
-            if not updated_sym.is_stale:
-                updated_sym.refresh()
+        # (with lazy staleness, refreshing one of these could make another one look stale, so check them all first)
         self.updated_sym.refresh()
+        if self.safety.lazy_staleness is not None:
+            # we never propagate to any of the symbols updated along with self.updated_sym
+            self.safety.lazy_staleness.acknowledge_update(self.updated_sym, [
+                updated_sym for updated_sym in updated_symbols if self.updated_sym in updated_sym.parents
+            ])
+        for updated_sym in [updated_sym for updated_sym in updated_symbols if not updated_sym.is_stale]:
+            updated_sym.refresh()
+        if self.safety.lazy_staleness is not None:
+            self._acknowledge_unpropagated_updates(updated_symbols)
         if namespace_refresh is not None:
             for updated_sym in namespace_refresh:
                 updated_sym.refresh()
                 for updated_sym_alias in self.safety.aliases.get(updated_sym.obj_id, []):
                     updated_sym_alias.refresh()
 
-    def _collect_updated_symbols(self, dsym: 'DataSymbol', skip_aliases=False):
+    def _acknowledge_unpropagated_updates(self, updated_symbols: 'Set[DataSymbol]') -> None:
+        # lazy staleness has no record of which dependents an update was propagated to, so tell it which ones it wasn't
+        lazy_staleness = self.safety.lazy_staleness
+        for dep in self.new_deps:
+            for parent in dep.parents:
+                if parent is self.updated_sym or parent in updated_symbols:
+                    lazy_staleness.acknowledge_update(parent, [dep])
+        for updated_sym in updated_symbols:
+            if updated_sym is not self.updated_sym and updated_sym.is_class:
+                # updates to a class's namespace don't propagate to its instances (see `_non_class_to_instance_children`)
+                lazy_staleness.acknowledge_update(updated_sym, [
+                    child for _, children in updated_sym.iter_children_by_cell_position() for child in children
+                    if child.namespace is not None and child.namespace.cloned_from is not None
+                    and child.namespace.cloned_from.obj_id == updated_sym.obj_id
+                ])
+        if self.updated_sym not in updated_symbols:
+            dependents = [
+                child for _, children in self.updated_sym.iter_children_by_cell_position() for child in children
+            ]
+            containing_scope = cast('NamespaceScope', self.updated_sym.containing_scope)
+            if containing_scope is not None and containing_scope.is_namespace_scope:
+                dependents.extend(self.safety.aliases.get(containing_scope.obj_id, []))
+            lazy_staleness.acknowledge_update(self.updated_sym, dependents)
+
+    def _collect_updated_symbols(self, dsym: 'DataSymbol', skip_aliases=False) -> 'PropagationStep':
         if dsym.is_import:
             return
         if skip_aliases:
@@ -62,9 +180,8 @@ class UpdateProtocol(object):
         else:
             aliases_to_consider = self.safety.aliases[dsym.obj_id]
         for dsym_alias in aliases_to_consider:
-            if dsym_alias.is_import or dsym_alias in self.seen:
+            if dsym_alias.is_import or not self._visit(dsym_alias):
                 continue
-            self.seen.add(dsym_alias)
             containing_scope: 'NamespaceScope' = cast('NamespaceScope', dsym_alias.containing_scope)
             if not containing_scope.is_namespace_scope:
                 continue
@@ -75,30 +192,31 @@ class UpdateProtocol(object):
             for alias in self.safety.aliases[containing_namespace_obj_id]:
                 alias.namespace_stale_symbols.discard(dsym)
                 # print('discard stale', dsym, 'from', alias, 'namespace, has fresher ancestors:', alias.fresher_ancestors)
-                self._collect_updated_symbols(alias)
+                yield self._collect_updated_symbols(alias)
 
-    def _propagate_staleness_to_namespace_parents(self, dsym: 'DataSymbol', skip_seen_check=False):
-        if not skip_seen_check and dsym in self.seen:
+    def _propagate_staleness_to_namespace_parents(self, dsym: 'DataSymbol', skip_seen_check=False) -> 'PropagationStep':
+        if not self._visit(dsym) and not skip_seen_check:
             return
-        self.seen.add(dsym)
         containing_scope: 'NamespaceScope' = cast('NamespaceScope', dsym.containing_scope)
         if containing_scope is None or not containing_scope.is_namespace_scope:
             return
         for containing_alias in self.safety.aliases[containing_scope.obj_id]:
             containing_alias.namespace_stale_symbols.add(dsym)
-            self._propagate_staleness_to_namespace_parents(containing_alias)
+            if not self._marks[containing_alias.symbol_id]:
+                yield self._propagate_staleness_to_namespace_parents(containing_alias)
             for child in self._non_class_to_instance_children(containing_alias):
                 # print('propagate from', dsym, 'to', child)
-                self._propagate_staleness_to_deps(child)
+                if not self._marks[child.symbol_id]:
+                    yield self._propagate_staleness_to_deps(child)
 
     def _non_class_to_instance_children(self, dsym):
         if self.updated_sym is dsym:
-            for dep_introduced_pos, dsym_children in dsym.children_by_cell_position.items():
+            for dep_introduced_pos, dsym_children in dsym.iter_children_by_cell_position():
                 if not self.safety.config.get('backwards_cell_staleness_propagation', True) and dep_introduced_pos <= self.safety.active_cell_position_idx:
                     continue
                 yield from dsym_children
             return
-        for dep_introduced_pos, dsym_children in dsym.children_by_cell_position.items():
+        for dep_introduced_pos, dsym_children in dsym.iter_children_by_cell_position():
             if not self.safety.config.get('backwards_cell_staleness_propagation', True) and dep_introduced_pos <= self.safety.active_cell_position_idx:
                 continue
             for child in dsym_children:
@@ -110,27 +228,33 @@ class UpdateProtocol(object):
                         continue
                 yield child
 
-    def _propagate_staleness_to_namespace_children(self, dsym: 'DataSymbol', skip_seen_check=False):
-        if not skip_seen_check and dsym in self.seen:
+    def _propagate_staleness_to_namespace_children(self, dsym: 'DataSymbol', skip_seen_check=False) -> 'PropagationStep':
+        if not self._visit(dsym) and not skip_seen_check:
             return
-        self.seen.add(dsym)
         self_scope = self.safety.namespaces.get(dsym.obj_id, None)
         if self_scope is None:
             return
-        for ns_child in self_scope.all_data_symbols_this_indentation(exclude_class=True):
+        ns_children = self_scope.all_data_symbols_this_indentation(exclude_class=True)
+        self.seen.reserve(self.safety.num_symbol_ids)
+        for ns_child in ns_children:
             # print('propagate from', dsym, 'to namespace child', ns_child)
-            self._propagate_staleness_to_deps(ns_child)
+            if not self._marks[ns_child.symbol_id]:
+                yield self._propagate_staleness_to_deps(ns_child)
 
-    def _propagate_staleness_to_deps(self, dsym: 'DataSymbol', skip_seen_check=False):
-        if not skip_seen_check and dsym in self.seen:
+    def _propagate_staleness_to_deps(self, dsym: 'DataSymbol', skip_seen_check=False) -> 'PropagationStep':
+        if not self._visit(dsym) and not skip_seen_check:
             return
-        self.seen.add(dsym)
         if dsym not in self.safety.updated_symbols:
             if dsym.should_mark_stale(self.updated_sym):
                 dsym.fresher_ancestors.add(self.updated_sym)
                 dsym.required_cell_num = self.safety.cell_counter()
-                self._propagate_staleness_to_namespace_parents(dsym, skip_seen_check=True)
-                self._propagate_staleness_to_namespace_children(dsym, skip_seen_check=True)
+                # skip making steps for the common case where there is no namespace to propagate to / from
+                containing_scope = dsym.containing_scope
+                if containing_scope is not None and containing_scope.is_namespace_scope:
+                    yield self._propagate_staleness_to_namespace_parents(dsym, skip_seen_check=True)
+                if dsym.obj_id in self.safety.namespaces:
+                    yield self._propagate_staleness_to_namespace_children(dsym, skip_seen_check=True)
         for child in self._non_class_to_instance_children(dsym):
             # print('propagate from', dsym, 'to', child)
-            self._propagate_staleness_to_deps(child)
+            if not self._marks[child.symbol_id]:
+                yield self._propagate_staleness_to_deps(child)
@@ -43,6 +43,7 @@ def show_deps(safety: 'NotebookSafety', line: 'List[str]'):
     for data_sym_name in line[1:]:
         data_sym = safety.global_scope.lookup_data_symbol_by_name(data_sym_name)
         if data_sym:
+            data_sym.record_staleness()
             print("DataSymbol {} (defined {}; required {}) is dependent on {}".format(
                 data_sym.readable_name,
                 data_sym.defined_cell_num,
@@ -57,7 +58,12 @@ def show_stale(safety: 'NotebookSafety', line: 'List[str]'):
     if len(line) < 2 or line[1] == 'global':
         dsym_sets: Any = [safety.global_scope.all_data_symbols_this_indentation()]
     elif line[1] == 'all':
-        dsym_sets = safety.aliases.values()
+        if safety.graph_store is not None and safety.lazy_staleness is None:
+            # only symbols behind on their required cell number, or with namespaces, can be stale
+            dsym_sets = [safety.graph_store.stale_symbols()]
+            dsym_sets.extend(safety.aliases.get(obj_id, ()) for obj_id in safety.namespaces)
+        else:
+            dsym_sets = safety.aliases.values()
     else:
         print("TODO: show usage statement")
         return
@@ -96,9 +102,7 @@ def remove_dep(safety: 'NotebookSafety', line: 'List[str]'):
     if parent_data_sym not in child_data_sym.parents:
         print("Two DataSymbols do not have a dependency relation")
         return
-    for children in parent_data_sym.children_by_cell_position.values():
-        children.remove(child_data_sym)
-    child_data_sym.parents.remove(parent_data_sym)
+    child_data_sym.remove_parent(parent_data_sym)
 
 
 def add_dep(safety: 'NotebookSafety', line: 'List[str]'):
@@ -116,8 +120,7 @@ def add_dep(safety: 'NotebookSafety', line: 'List[str]'):
     if parent_data_sym in child_data_sym.parents:
         print("Two DataSymbols already have a dependency relation")
         return
-    parent_data_sym.children_by_cell_position[-1].add(child_data_sym)
-    child_data_sym.parents.add(parent_data_sym)
+    child_data_sym.add_parent(parent_data_sym, -1)
 
 
 def turn_off_warnings_for(safety: 'NotebookSafety', line: 'List[str]'):
@@ -11,9 +11,13 @@ from IPython import get_ipython
 from IPython.core.magic import register_cell_magic, register_line_magic
 
 from nbsafety.analysis import (
+    CellLivenessCache,
+    StatementFacts,
     compute_live_dead_symbol_refs,
     compute_call_chain_live_symbols,
+    compute_stale_and_refresher_links,
     get_symbols_for_references,
+    is_symbol_ref_killed,
 )
 from nbsafety.ipython_utils import (
     ast_transformer_context,
@@ -22,16 +26,20 @@ from nbsafety.ipython_utils import (
     save_number_of_currently_executing_cell,
 )
 from nbsafety import line_magics
+from nbsafety.data_model.data_symbol import DataSymbol
 from nbsafety.data_model.scope import Scope, NamespaceScope
+from nbsafety.data_model.graph_store import DependencyGraphStore, GraphStoreDataSymbol
+from nbsafety.data_model.lazy_staleness import LazyStaleness
+from nbsafety.data_model.update_protocol import VisitedSymbols
 from nbsafety.run_mode import SafetyRunMode
-from nbsafety.tracing import SafetyAstRewriter, TracingManager
+from nbsafety.tracing import CellCodeTable, InstrumentedCellCache, SafetyAstRewriter, TracingManager
 from nbsafety.utils import DotDict
 
 if TYPE_CHECKING:
-    from typing import Any, Dict, List, Set, Optional, Tuple, Union
-    from types import FrameType
-    from nbsafety.data_model.data_symbol import DataSymbol
-    CellId = Union[str, int]
+    from typing import Any, Dict, FrozenSet, List, Set, Optional, Tuple, Type, Union
+    from nbsafety.types import CellId, SymbolRef
+    # (stale / fresh / neither, ids of linked refresher cells, ids of linked stale cells)
+    CellFreshness = Tuple[Optional[str], FrozenSet[CellId], FrozenSet[CellId]]
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
@@ -41,12 +49,16 @@ _SAFETY_LINE_MAGIC = 'safety'
 
 _NB_MAGIC_PATTERN = re.compile(r'(^%|^!|^cd |\?$)')
 
+_CELL_FRESHNESS_DELTA_VERSION = 2
+_NO_FRESHNESS: 'CellFreshness' = (None, frozenset(), frozenset())
+
 
 def _safety_warning(node: 'DataSymbol'):
     if not node.is_stale:
         raise ValueError('Expected node with stale ancestor; got %s' % node)
     if node.defined_cell_num < 1:
         return
+    node.record_staleness()
     fresher_symbols = node.fresher_ancestors
     if len(fresher_symbols) == 0:
         fresher_symbols = node.namespace_stale_symbols
@@ -70,24 +82,50 @@ class NotebookSafety(object):
             track_dependencies=True,
             naive_refresher_computation=False,
             skip_unsafe_cells=kwargs.pop('skip_unsafe', True),
+            use_sys_monitoring=kwargs.pop('use_sys_monitoring', True),
+            instrumented_cell_cache_size=kwargs.pop('instrumented_cell_cache_size', 256),
+            liveness_cache_size=kwargs.pop('liveness_cache_size', 1024),
+            lazy_staleness=kwargs.pop('lazy_staleness', False),
+            graph_store=kwargs.pop('graph_store', False),
+            subscript_runs=kwargs.pop('subscript_runs', False),
+            event_buffer=kwargs.pop('event_buffer', False),
             mode=SafetyRunMode.get(),
             **kwargs
         ))
         # Note: explicitly adding the types helps PyCharm's built-in code inspection
         self.namespaces: 'Dict[int, NamespaceScope]' = {}
         self.aliases: 'Dict[int, Set[DataSymbol]]' = defaultdict(set)
+        self.num_symbol_ids = 0
+        self._visited_symbols: 'Optional[VisitedSymbols]' = VisitedSymbols()
+        self.lazy_staleness: 'Optional[LazyStaleness]' = LazyStaleness(self) if self.config.lazy_staleness else None
+        self.graph_store: 'Optional[DependencyGraphStore]' = (
+            DependencyGraphStore() if self.config.graph_store else None
+        )
+        # symbols keep their edges and cell numbers in the graph store when there is one
+        self.data_symbol_class: 'Type[DataSymbol]' = (
+            DataSymbol if self.graph_store is None else GraphStoreDataSymbol
+        )
         self.global_scope: 'Scope' = Scope(self)
         self.updated_symbols: 'Set[DataSymbol]' = set()
         self.updated_scopes: 'Set[NamespaceScope]' = set()
         self.garbage_namespace_obj_ids: 'Set[int]' = set()
+        # symbols that may have become garbage since the last collection
+        self.garbage_symbol_candidates: 'Set[DataSymbol]' = set()
         self.ast_node_by_id: 'Dict[int, ast.AST]' = {}
         self.statement_cache: 'Dict[int, Dict[int, ast.stmt]]' = defaultdict(dict)
         self.statement_to_func_cell: 'Dict[int, DataSymbol]' = {}
+        self.statement_facts: 'Dict[int, StatementFacts]' = {}
+        self.instrumented_cell_cache = InstrumentedCellCache(self.config.instrumented_cell_cache_size)
+        self.liveness_cache = CellLivenessCache(self.config.liveness_cache_size)
+        self.cell_code_table = CellCodeTable(self)
         self.tracing_manager: 'TracingManager' = TracingManager(self)
         self.stale_dependency_detected = False
         self.active_cell_position_idx = -1
         self._last_execution_counter = 0
         self._counters_by_cell_id: Dict[CellId, int] = {}
+        self._cell_source_by_id: 'Dict[CellId, str]' = {}
+        self._cell_content_hash_by_id: 'Dict[CellId, str]' = {}
+        self._last_freshness_by_cell_id: 'Dict[CellId, CellFreshness]' = {}
         self._active_cell_id: Optional[str] = None
         if cell_magic_name is None:
             self._cell_magic = None
@@ -111,6 +149,36 @@ class NotebookSafety(object):
     def is_test(self) -> bool:
         return self.config.get('test_context', False)
 
+    def next_symbol_id(self) -> int:
+        symbol_id = self.num_symbol_ids
+        self.num_symbol_ids += 1
+        return symbol_id
+
+    def acquire_visited_symbols(self) -> 'VisitedSymbols':
+        visited = self._visited_symbols
+        if visited is None:
+            # only happens for reentrant update protocol runs
+            return VisitedSymbols()
+        self._visited_symbols = None
+        return visited
+
+    def release_visited_symbols(self, visited: 'VisitedSymbols') -> None:
+        visited.clear()
+        self._visited_symbols = visited
+
+    def _invalidate_lazy_staleness(self) -> None:
+        # symbols can be redefined outside of the update protocol, e.g. by line magics,
+        # so don't reuse anything computed before a new batch of staleness queries
+        if self.lazy_staleness is not None:
+            self.lazy_staleness.invalidate()
+
+    def get_statement_facts(self, stmt_node: 'ast.stmt') -> 'StatementFacts':
+        facts = self.statement_facts.get(id(stmt_node), None)
+        if facts is None:
+            # computing them at instrumentation time failed; try again so the error surfaces here
+            facts = self.statement_facts[id(stmt_node)] = StatementFacts(stmt_node)
+        return facts
+
     def cell_counter(self):
         if self.config.store_history:
             return cell_counter()
@@ -122,15 +190,13 @@ class NotebookSafety(object):
         self._ast_transformer_raised = new_val
         return ret
 
-    def get_position(self, frame: 'FrameType'):
-        cell_num = self._cell_name_to_cell_num_mapping[frame.f_code.co_filename.split('-')[3]]
-        return cell_num, frame.f_lineno
-
-    def maybe_set_name_to_cell_num_mapping(self, frame: 'FrameType'):
-        if self._recorded_cell_name_to_cell_num:
-            return
-        self._recorded_cell_name_to_cell_num = True
-        self._cell_name_to_cell_num_mapping[frame.f_code.co_filename.split('-')[3]] = self.cell_counter()
+    def get_cell_num_for_cell_filename(self, filename: str) -> 'Optional[int]':
+        cell_name = filename.split('-')[3]
+        if not self._recorded_cell_name_to_cell_num:
+            # the first cell code we come across while tracing is that of the cell being run
+            self._recorded_cell_name_to_cell_num = True
+            self._cell_name_to_cell_num_mapping[cell_name] = self.cell_counter()
+        return self._cell_name_to_cell_num_mapping.get(cell_name, None)
 
     def set_active_cell(self, cell_id, position_idx=-1):
         self._active_cell_id = cell_id
@@ -142,35 +208,137 @@ class NotebookSafety(object):
             request = msg['content']['data']
             self.handle(request, comm=comm)
 
+        # a new frontend connection starts out without any cell state
+        self._cell_source_by_id.clear()
+        self._cell_content_hash_by_id.clear()
+        self._last_freshness_by_cell_id.clear()
         comm.send({'type': 'establish'})
 
     def handle(self, request, comm=None):
         if request['type'] == 'change_active_cell':
             self.set_active_cell(request['active_cell_id'], position_idx=request.get('active_cell_order_idx', -1))
         elif request['type'] == 'cell_freshness':
-            cell_id = request.get('executed_cell_id', None)
-            if cell_id is not None:
-                self._counters_by_cell_id[cell_id] = self._last_execution_counter
-            cells_by_id = request['content_by_cell_id']
-            if self.config.get('backwards_cell_staleness_propagation', True):
-                order_index_by_id = None
-                last_cell_exec_position_idx = -1
-            else:
-                order_index_by_id = request['order_index_by_cell_id']
-                last_cell_exec_position_idx = order_index_by_id.get(cell_id, -1)
-            response = self.check_and_link_multiple_cells(cells_by_id, order_index_by_id)
-            response['type'] = 'cell_freshness'
-            response['last_cell_exec_position_idx'] = last_cell_exec_position_idx
+            response = self._handle_cell_freshness_request(request)
             if comm is not None:
                 comm.send(response)
         else:
             logger.error('Unsupported request type for request %s' % request)
 
+    def _handle_cell_freshness_request(self, request: 'Dict[str, Any]') -> 'Dict[str, Any]':
+        """
+        Version 1 requests carry the full source of every cell, and get the full freshness state back.
+
+        Version 2 requests carry a content hash for every cell, along with the source of just
+        those cells whose hash changed since the last request. The response then lists only those
+        cells whose stale / fresh / link status changed since the last response (plus the executed
+        cell, since the frontend clears its state upon execution), under 'changed_cells'.
+        If we are missing the source for some cell, we instead ask for it under 'missing_cell_ids'.
+        """
+        cell_id = request.get('executed_cell_id', None)
+        if cell_id is not None:
+            self._counters_by_cell_id[cell_id] = self._last_execution_counter
+        version = request.get('version', 1)
+        if version >= _CELL_FRESHNESS_DELTA_VERSION:
+            missing_cell_ids = self._update_cell_sources(
+                request['content_hash_by_cell_id'], request.get('changed_content_by_cell_id', {})
+            )
+            if len(missing_cell_ids) > 0:
+                return {'type': 'cell_freshness', 'version': version, 'missing_cell_ids': missing_cell_ids}
+            cells_by_id = self._cell_source_by_id
+        else:
+            cells_by_id = request['content_by_cell_id']
+        if self.config.get('backwards_cell_staleness_propagation', True):
+            order_index_by_id = None
+            last_cell_exec_position_idx = -1
+        else:
+            order_index_by_id = request['order_index_by_cell_id']
+            last_cell_exec_position_idx = order_index_by_id.get(cell_id, -1)
+        response = self.check_and_link_multiple_cells(cells_by_id, order_index_by_id)
+        if version >= _CELL_FRESHNESS_DELTA_VERSION:
+            response = self._compute_cell_freshness_delta(
+                response, cell_id, order_index_by_id, last_cell_exec_position_idx
+            )
+            response['version'] = version
+        response['type'] = 'cell_freshness'
+        response['last_cell_exec_position_idx'] = last_cell_exec_position_idx
+        return response
+
+    def _update_cell_sources(
+            self,
+            content_hash_by_cell_id: 'Dict[CellId, str]',
+            changed_content_by_cell_id: 'Dict[CellId, str]',
+    ) -> 'List[CellId]':
+        cell_source_by_id: 'Dict[CellId, str]' = {}
+        cell_content_hash_by_id: 'Dict[CellId, str]' = {}
+        missing_cell_ids = []
+        # rebuilt in the frontend's order; cells that no longer appear there get dropped
+        for cell_id, content_hash in content_hash_by_cell_id.items():
+            content = changed_content_by_cell_id.get(cell_id, None)
+            if content is None:
+                if self._cell_content_hash_by_id.get(cell_id, None) != content_hash:
+                    missing_cell_ids.append(cell_id)
+                    continue
+                content = self._cell_source_by_id[cell_id]
+            cell_source_by_id[cell_id] = content
+            cell_content_hash_by_id[cell_id] = content_hash
+        self._cell_source_by_id = cell_source_by_id
+        self._cell_content_hash_by_id = cell_content_hash_by_id
+        return missing_cell_ids
+
+    def _compute_cell_freshness_delta(
+            self,
+            response: 'Dict[str, Any]',
+            executed_cell_id: 'Optional[CellId]',
+            order_index_by_cell_id: 'Optional[Dict[CellId, int]]',
+            last_cell_exec_position_idx: int,
+    ) -> 'Dict[str, Any]':
+        stale_cells = set(response['stale_cells'])
+        fresh_cells = set(response['fresh_cells'])
+        stale_links = response['stale_links']
+        refresher_links = response['refresher_links']
+        prev_freshness_by_cell_id = self._last_freshness_by_cell_id
+        freshness_by_cell_id: 'Dict[CellId, CellFreshness]' = {}
+        changed_cell_ids = []
+        for cell_id in self._cell_source_by_id:
+            if (order_index_by_cell_id is not None and
+                    order_index_by_cell_id.get(cell_id, -1) < last_cell_exec_position_idx):
+                # the frontend leaves the state of cells above the executed one alone
+                if cell_id in prev_freshness_by_cell_id:
+                    freshness_by_cell_id[cell_id] = prev_freshness_by_cell_id[cell_id]
+                continue
+            if cell_id in stale_cells:
+                status = 'stale'
+            elif cell_id in fresh_cells:
+                status = 'fresh'
+            else:
+                status = None
+            freshness = (
+                status, frozenset(stale_links.get(cell_id, ())), frozenset(refresher_links.get(cell_id, ()))
+            )
+            freshness_by_cell_id[cell_id] = freshness
+            if cell_id == executed_cell_id or prev_freshness_by_cell_id.get(cell_id, _NO_FRESHNESS) != freshness:
+                changed_cell_ids.append(cell_id)
+        self._last_freshness_by_cell_id = freshness_by_cell_id
+        return {
+            'changed_cells': changed_cell_ids,
+            'stale_cells': [cell_id for cell_id in changed_cell_ids if freshness_by_cell_id[cell_id][0] == 'stale'],
+            'fresh_cells': [cell_id for cell_id in changed_cell_ids if freshness_by_cell_id[cell_id][0] == 'fresh'],
+            'stale_links': {
+                cell_id: list(freshness_by_cell_id[cell_id][1])
+                for cell_id in changed_cell_ids if len(freshness_by_cell_id[cell_id][1]) > 0
+            },
+            'refresher_links': {
+                cell_id: list(freshness_by_cell_id[cell_id][2])
+                for cell_id in changed_cell_ids if len(freshness_by_cell_id[cell_id][2]) > 0
+            },
+        }
+
     def check_and_link_multiple_cells(
             self,
             cells_by_id: 'Dict[CellId, str]',
             order_index_by_cell_id: 'Optional[Dict[CellId, int]]' = None
     ) -> 'Dict[str, Any]':
+        self._invalidate_lazy_staleness()
         stale_cells = set()
         fresh_cells = []
         stale_symbols_by_cell_id: 'Dict[CellId, Set[DataSymbol]]' = {}
@@ -192,38 +360,18 @@ class NotebookSafety(object):
                     killing_cell_ids_for_symbol[dead_sym].add(cell_id)
             except SyntaxError:
                 continue
-        stale_links: 'Dict[CellId, Set[CellId]]' = defaultdict(set)
-        refresher_links: 'Dict[CellId, List[CellId]]' = defaultdict(list)
-        for stale_cell_id in stale_cells:
-            stale_syms = stale_symbols_by_cell_id[stale_cell_id]
-            if self.config.get('naive_refresher_computation', False):
-                refresher_cell_ids = self._naive_compute_refresher_cells(
-                    stale_cell_id,
-                    stale_syms,
-                    cells_by_id,
-                    order_index_by_cell_id=order_index_by_cell_id
-                )
-            else:
-                refresher_cell_ids = set.union(*(killing_cell_ids_for_symbol[stale_sym] for stale_sym in stale_syms))
-            stale_links[stale_cell_id] = refresher_cell_ids
-        stale_link_changes = True
-        # transitive closer up until we hit non-stale refresher cells
-        while stale_link_changes:
-            stale_link_changes = False
-            for stale_cell_id in stale_cells:
-                new_stale_links = set(stale_links[stale_cell_id])
-                original_length = len(new_stale_links)
-                for refresher_cell_id in stale_links[stale_cell_id]:
-                    if refresher_cell_id not in stale_cells:
-                        continue
-                    new_stale_links |= stale_links[refresher_cell_id]
-                new_stale_links.discard(stale_cell_id)
-                stale_link_changes = stale_link_changes or original_length != len(new_stale_links)
-                stale_links[stale_cell_id] = new_stale_links
-        for stale_cell_id in stale_cells:
-            stale_links[stale_cell_id] -= stale_cells
-            for refresher_cell_id in stale_links[stale_cell_id]:
-                refresher_links[refresher_cell_id].append(stale_cell_id)
+        if self.config.get('naive_refresher_computation', False):
+            direct_links = self._naive_compute_refresher_links(
+                stale_symbols_by_cell_id,
+                cells_by_id,
+                order_index_by_cell_id=order_index_by_cell_id
+            )
+        else:
+            direct_links = {
+                stale_cell_id: set.union(*(killing_cell_ids_for_symbol[stale_sym] for stale_sym in stale_syms))
+                for stale_cell_id, stale_syms in stale_symbols_by_cell_id.items()
+            }
+        stale_links, refresher_links = compute_stale_and_refresher_links(direct_links, stale_cells)
         return {
             'stale_cells': list(stale_cells),
             'fresh_cells': fresh_cells,
@@ -234,29 +382,51 @@ class NotebookSafety(object):
             'refresher_links': refresher_links,
         }
 
-    def _naive_compute_refresher_cells(
+    def _naive_compute_refresher_links(
             self,
-            stale_cell_id: 'CellId',
-            stale_symbols: 'Set[DataSymbol]',
+            stale_symbols_by_cell_id: 'Dict[CellId, Set[DataSymbol]]',
             cells_by_id: 'Dict[CellId, str]',
             order_index_by_cell_id: 'Optional[Dict[CellId, int]]' = None
-    ) -> 'Set[CellId]':
-        refresher_cell_ids: Set[CellId] = set()
-        stale_cell_content = cells_by_id[stale_cell_id]
+    ) -> 'Dict[CellId, Set[CellId]]':
+        """
+        A cell refreshes a stale cell if running the two back to back leaves strictly fewer stale symbols.
+        Rather than analyzing each concatenation, we compose the cached live / dead refs of both cells,
+        resolving each live ref of the stale cell to stale symbols only once.
+        """
+        if len(stale_symbols_by_cell_id) == 0:
+            return {}
+        # stale symbols referenced by each cell on its own, along with the refs that it kills
+        summary_by_cell_id: 'Dict[CellId, Tuple[Set[DataSymbol], Set[SymbolRef]]]' = {}
         for cell_id, cell_content in cells_by_id.items():
-            if cell_id == stale_cell_id:
-                continue
-            if (order_index_by_cell_id is not None and
-                    order_index_by_cell_id.get(cell_id, -1) >= order_index_by_cell_id.get(stale_cell_id, -1)):
-                continue
-            concated_content = f'{cell_content}\n\n{stale_cell_content}'
             try:
-                concated_stale_symbols = self._check_cell_and_resolve_symbols(concated_content)['stale']
+                live_symbol_refs, dead_symbol_refs = self._get_live_dead_symbol_refs(cell_content)
             except SyntaxError:
                 continue
-            if concated_stale_symbols < stale_symbols:
-                refresher_cell_ids.add(cell_id)
-        return refresher_cell_ids
+            summary_by_cell_id[cell_id] = (self._resolve_stale_symbols(live_symbol_refs), dead_symbol_refs)
+        refresher_cell_ids_by_stale_cell_id: 'Dict[CellId, Set[CellId]]' = {}
+        for stale_cell_id, stale_symbols in stale_symbols_by_cell_id.items():
+            stale_symbols_by_ref: 'Dict[SymbolRef, Set[DataSymbol]]' = {}
+            for ref in self._get_live_dead_symbol_refs(cells_by_id[stale_cell_id])[0]:
+                stale_symbols_for_ref = self._resolve_stale_symbols({ref})
+                if len(stale_symbols_for_ref) > 0:
+                    stale_symbols_by_ref[ref] = stale_symbols_for_ref
+            refresher_cell_ids: 'Set[CellId]' = set()
+            for cell_id, (cell_stale_symbols, cell_dead_refs) in summary_by_cell_id.items():
+                if cell_id == stale_cell_id:
+                    continue
+                if (order_index_by_cell_id is not None and
+                        order_index_by_cell_id.get(cell_id, -1) >= order_index_by_cell_id.get(stale_cell_id, -1)):
+                    continue
+                if not cell_stale_symbols <= stale_symbols:
+                    continue
+                composed_stale_symbols = set(cell_stale_symbols)
+                for ref, stale_symbols_for_ref in stale_symbols_by_ref.items():
+                    if not is_symbol_ref_killed(ref, cell_dead_refs):
+                        composed_stale_symbols |= stale_symbols_for_ref
+                if composed_stale_symbols < stale_symbols:
+                    refresher_cell_ids.add(cell_id)
+            refresher_cell_ids_by_stale_cell_id[stale_cell_id] = refresher_cell_ids
+        return refresher_cell_ids_by_stale_cell_id
 
     @staticmethod
     def _get_cell_ast(cell):
@@ -278,15 +448,33 @@ class NotebookSafety(object):
                 max_defined_cell_num = max(max_defined_cell_num, namespace_scope.max_defined_timestamp)
         return max_defined_cell_num
 
+    def _get_live_dead_symbol_refs(self, cell: str) -> 'Tuple[Set[SymbolRef], Set[SymbolRef]]':
+        cache_key = self.liveness_cache.key_for(cell)
+        cached = self.liveness_cache.get(cache_key)
+        if cached is None:
+            cell_ast = self._get_cell_ast(cell)
+            live_symbol_refs, dead_symbol_refs = compute_live_dead_symbol_refs(cell_ast)
+            self.liveness_cache.put(cache_key, (live_symbol_refs, dead_symbol_refs))
+        else:
+            live_symbol_refs, dead_symbol_refs = cached
+        return live_symbol_refs, dead_symbol_refs
+
+    def _resolve_live_symbols(self, live_symbol_refs: 'Set[SymbolRef]') -> 'Set[DataSymbol]':
+        live_symbols, called_symbols = get_symbols_for_references(live_symbol_refs, self.global_scope)
+        return live_symbols.union(compute_call_chain_live_symbols(called_symbols))
+
+    def _resolve_stale_symbols(self, live_symbol_refs: 'Set[SymbolRef]') -> 'Set[DataSymbol]':
+        return set(dsym for dsym in self._resolve_live_symbols(live_symbol_refs) if dsym.is_stale)
+
     def _check_cell_and_resolve_symbols(
             self,
             cell: 'Union[ast.Module, str]'
     ) -> 'Dict[str, Set[DataSymbol]]':
         if isinstance(cell, str):
-            cell = self._get_cell_ast(cell)
-        live_symbol_refs, dead_symbol_refs = compute_live_dead_symbol_refs(cell)
-        live_symbols, called_symbols = get_symbols_for_references(live_symbol_refs, self.global_scope)
-        live_symbols = live_symbols.union(compute_call_chain_live_symbols(called_symbols))
+            live_symbol_refs, dead_symbol_refs = self._get_live_dead_symbol_refs(cell)
+        else:
+            live_symbol_refs, dead_symbol_refs = compute_live_dead_symbol_refs(cell)
+        live_symbols = self._resolve_live_symbols(live_symbol_refs)
         # only mark dead attrsubs as killed if we can traverse the entire chain
         dead_symbols, _ = get_symbols_for_references(
             dead_symbol_refs, self.global_scope, only_add_successful_resolutions=True
@@ -301,11 +489,11 @@ class NotebookSafety(object):
     def _precheck_for_stale(self, cell: str):
         # Precheck process. First obtain the names that need to be checked. Then we check if their
         # `defined_cell_num` is greater than or equal to required; if not we give a warning and return `True`.
+        self._invalidate_lazy_staleness()
         try:
-            cell_ast = self._get_cell_ast(cell)
+            symbols = self._check_cell_and_resolve_symbols(cell)
         except SyntaxError:
             return False
-        symbols = self._check_cell_and_resolve_symbols(cell_ast)
         stale_symbols, live_symbols = symbols['stale'], symbols['live']
         if self._last_refused_code is None or cell != self._last_refused_code:
             self._prev_cell_stale_symbols = stale_symbols
@@ -325,6 +513,9 @@ class NotebookSafety(object):
             # Instead of breaking the dependency chain, simply refresh the nodes
             # with stale deps to their required cell numbers
             for node in self._prev_cell_stale_symbols:
+                if self.lazy_staleness is not None:
+                    self.lazy_staleness.override(node)
+                    continue
                 node.defined_cell_num = node.required_cell_num
                 node.namespace_stale_symbols = set()
                 node.fresher_ancestors = set()
@@ -386,7 +577,7 @@ class NotebookSafety(object):
 
             # Stage 2: Trace / run the cell, updating dependencies as they are encountered.
             try:
-                with self._tracing_context():
+                with self._tracing_context(cell):
                     ret = run_cell_func(cell)
                 # Stage 2.1: resync any defined symbols that could have gotten out-of-sync
                 #  due to tracing being disabled
@@ -409,14 +600,14 @@ class NotebookSafety(object):
         return register_cell_magic(_dependency_safety)
 
     @contextmanager
-    def _tracing_context(self):
+    def _tracing_context(self, cell: 'Optional[str]' = None):
         self.updated_symbols.clear()
         self.updated_scopes.clear()
         self._recorded_cell_name_to_cell_num = False
 
         try:
             with self.tracing_manager.tracing_context():
-                with ast_transformer_context([SafetyAstRewriter(self)]):
+                with ast_transformer_context([SafetyAstRewriter(self, cell_source=cell)]):
                     yield
         finally:
             # TODO: actually handle errors that occurred in our code while tracing
@@ -426,7 +617,7 @@ class NotebookSafety(object):
     def _reset_trace_state_hook(self):
         # this assert doesn't hold anymore now that tracing could be disabled inside of something
         # assert len(self.attr_trace_manager.stack) == 0
-        self.tracing_manager = TracingManager(self)
+        self.tracing_manager.reset()
         self._gc()
 
     def _make_line_magic(self):
@@ -482,6 +673,7 @@ class NotebookSafety(object):
         for obj_id in self.garbage_namespace_obj_ids:
             garbage_ns = self.namespaces.pop(obj_id, None)
             if garbage_ns is not None:
+                self.add_namespace_garbage_candidates(garbage_ns)
                 garbage_ns.clear_namespace(obj_id)
         self.garbage_namespace_obj_ids.clear()
         # while True:
@@ -494,9 +686,20 @@ class NotebookSafety(object):
         #     if len(self.garbage_namespace_obj_ids) == 0:
         #         break
 
+    def add_namespace_garbage_candidates(self, namespace: 'NamespaceScope'):
+        self.garbage_symbol_candidates.update(
+            namespace.all_data_symbols_this_indentation(exclude_class=True, materialize_runs=False)
+        )
+
     def _gc(self):
-        for dsym in list(self.all_data_symbols()):
+        # Symbols only become garbage when their objects die, when they are created in a scope that isn't
+        # globally accessible, or when the namespace containing them does, and each of these adds them to
+        # the candidates, so there's no need to check every symbol.
+        candidates = self.garbage_symbol_candidates
+        while len(candidates) > 0:
+            dsym = candidates.pop()
             if dsym.is_garbage:
+                # collecting this may in turn add candidates from namespaces that are no longer aliased
                 dsym.collect_self_garbage()
 
     def retrieve_namespace_attr_or_sub(self, obj: 'Any', attr_or_sub: 'Union[str, int]', is_subscript: bool):
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-from .safety_ast_rewriter import SafetyAstRewriter
+from .cell_code import CellCodeTable
+from .safety_ast_rewriter import InstrumentedCellCache, SafetyAstRewriter
 from .trace_manager import TracingManager
 from .trace_events import TraceEvent
 from .trace_stmt import TraceStatement
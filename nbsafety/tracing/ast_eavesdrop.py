@@ -5,7 +5,7 @@ import logging
 from typing import cast, TYPE_CHECKING
 import sys
 
-from nbsafety.tracing.trace_events import TraceEvent, EMIT_EVENT
+from nbsafety.tracing.trace_events import TraceEvent
 from nbsafety.utils import fast
 
 if TYPE_CHECKING:
@@ -21,9 +21,6 @@ class AstEavesdropper(ast.NodeTransformer):
         self._orig_to_copy_mapping = orig_to_copy_mapping
         self._inside_attrsub_load_chain = False
 
-    def _emitter_ast(self):
-        return fast.Name(EMIT_EVENT, ast.Load())
-
     def _get_copy_id_ast(self, orig_node_id: 'Union[int, ast.AST]'):
         if not isinstance(orig_node_id, int):
             orig_node_id = id(orig_node_id)
@@ -82,31 +79,32 @@ class AstEavesdropper(ast.NodeTransformer):
                 attr_node = cast(ast.Attribute, node)
                 attr_or_sub = fast.Str(attr_node.attr)
 
-            extra_args: 'List[ast.keyword]' = []
             if isinstance(node.value, ast.Name):
-                extra_args = fast.kwargs(name=fast.Str(node.value.id))
+                obj_name: ast.expr = fast.Str(node.value.id)
+            else:
+                obj_name = fast.NameConstant(None)
 
             with self.attrsub_load_context():
+                evt = TraceEvent.subscript if is_subscript else TraceEvent.attribute
                 node.value = fast.Call(
-                    func=self._emitter_ast(),
+                    func=evt.emitter_ast(),
                     args=[
-                        TraceEvent.subscript.to_ast() if is_subscript else TraceEvent.attribute.to_ast(),
-                        self._get_copy_id_ast(node.value)
+                        self.visit(node.value),
+                        attr_or_sub,
+                        fast.Str(node.ctx.__class__.__name__),
+                        fast.NameConstant(call_context),
+                        fast.NameConstant(is_subscript),
+                        obj_name,
                     ],
-                    keywords=fast.kwargs(
-                        obj=self.visit(node.value),
-                        attr_or_sub=attr_or_sub,
-                        ctx=fast.Str(node.ctx.__class__.__name__),
-                        call_context=fast.NameConstant(call_context),
-                    ) + extra_args
+                    keywords=[],
                 )
         # end fast.location_of(node.value)
         if not self._inside_attrsub_load_chain and is_load:
             with fast.location_of(node):
                 return fast.Call(
-                    func=self._emitter_ast(),
-                    args=[TraceEvent.after_attrsub_chain.to_ast(), self._get_copy_id_ast(node)],
-                    keywords=fast.kwargs(obj=node, call_context=fast.NameConstant(call_context)),
+                    func=TraceEvent.after_attrsub_chain.emitter_ast(),
+                    args=[node, fast.NameConstant(call_context)],
+                    keywords=[],
                 )
         return node
 
@@ -123,9 +121,9 @@ class AstEavesdropper(ast.NodeTransformer):
                 if should_record:
                     with self.attrsub_load_context(False):
                         new_arg_value = cast(ast.expr, fast.Call(
-                            func=self._emitter_ast(),
-                            args=[TraceEvent.argument.to_ast(), self._get_copy_id_ast(maybe_kwarg)],
-                            keywords=fast.kwargs(obj=visited_maybe_kwarg),
+                            func=TraceEvent.argument.emitter_ast(),
+                            args=[visited_maybe_kwarg, self._get_copy_id_ast(maybe_kwarg)],
+                            keywords=[],
                         ))
                 else:
                     new_arg_value = visited_maybe_kwarg
@@ -137,7 +135,6 @@ class AstEavesdropper(ast.NodeTransformer):
         return replacement_args
 
     def visit_Call(self, node: ast.Call):
-        orig_node_id = id(node)
         is_attrsub = False
         if isinstance(node.func, (ast.Attribute, ast.Subscript)):
             is_attrsub = True
@@ -162,21 +159,21 @@ class AstEavesdropper(ast.NodeTransformer):
         # f(a, b, ..., c) -> trace(f, 'enter argument list')(a, b, ..., c)
         with fast.location_of(node.func):
             node.func = fast.Call(
-                func=self._emitter_ast(),
-                args=[TraceEvent.before_arg_list.to_ast(), self._get_copy_id_ast(node.func)],
-                keywords=fast.kwargs(obj=node.func),
+                func=TraceEvent.before_arg_list.emitter_ast(),
+                args=[node.func],
+                keywords=[],
             )
 
         # f(a, b, ..., c) -> trace(f(a, b, ..., c), 'exit argument list')
         with fast.location_of(node):
             node = fast.Call(
-                func=self._emitter_ast(),
-                args=[TraceEvent.after_arg_list.to_ast(), self._get_copy_id_ast(node)],
-                keywords=fast.kwargs(
-                    obj=node,
-                    is_attrsub=fast.NameConstant(is_attrsub),
-                    inside_chain=fast.NameConstant(self._inside_attrsub_load_chain),
-                ),
+                func=TraceEvent.after_arg_list.emitter_ast(),
+                args=[
+                    node,
+                    fast.NameConstant(is_attrsub),
+                    fast.NameConstant(self._inside_attrsub_load_chain),
+                ],
+                keywords=[],
             )
 
         if self._inside_attrsub_load_chain or not is_attrsub:
@@ -184,16 +181,15 @@ class AstEavesdropper(ast.NodeTransformer):
 
         with fast.location_of(node):
             return fast.Call(
-                func=self._emitter_ast(),
-                args=[TraceEvent.after_attrsub_chain.to_ast(), self._get_copy_id_ast(orig_node_id)],
-                keywords=fast.kwargs(obj=node, call_context=fast.NameConstant(True)),
+                func=TraceEvent.after_attrsub_chain.emitter_ast(),
+                args=[node, fast.NameConstant(True)],
+                keywords=[],
             )
 
     def visit_Assign(self, node: ast.Assign):
         if not isinstance(node.value, (ast.List, ast.Tuple)):
             return self.generic_visit(node)
 
-        orig_node_value = id(node.value)
         new_targets = []
         for target in node.targets:
             new_targets.append(self.visit(target))
@@ -201,8 +197,8 @@ class AstEavesdropper(ast.NodeTransformer):
         with fast.location_of(node.value):
             # TODO: replace 42 with start literal tracer
             node.value = fast.Tuple([fast.Call(
-                func=self._emitter_ast(),
-                args=[TraceEvent.before_literal.to_ast(), self._get_copy_id_ast(orig_node_value)],
+                func=TraceEvent.before_literal.emitter_ast(),
+                args=[],
                 keywords=[],
             ), node.value], ast.Load())
             slc: 'Union[ast.Constant, ast.Num, ast.Index]' = fast.Num(1)
@@ -210,8 +206,8 @@ class AstEavesdropper(ast.NodeTransformer):
                 slc = fast.Index(slc)
             node.value = fast.Subscript(node.value, slc, ast.Load())
             node.value = fast.Call(
-                func=self._emitter_ast(),
-                args=[TraceEvent.after_literal.to_ast(), self._get_copy_id_ast(orig_node_value)],
-                keywords=fast.kwargs(obj=node.value),
+                func=TraceEvent.after_literal.emitter_ast(),
+                args=[node.value],
+                keywords=[],
             )
         return node
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import ast
+from typing import cast, TYPE_CHECKING
+
+from nbsafety.tracing.ast_eavesdrop import AstEavesdropper
+from nbsafety.tracing.stmt_inserter import StatementInserter
+from nbsafety.tracing.stmt_mapper import StatementMapper
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Tuple
+
+
+class AstInstrumenter(AstEavesdropper, StatementInserter):
+    """
+    Does the work of StatementMapper, AstEavesdropper, and StatementInserter
+    in a single walk over the cell's ast.
+
+    The pristine copies that StatementMapper would make get created on the way
+    down: each node's children are copied (with their fields snapshotted, but
+    not yet filled in) before the node itself gets rewritten, and the fields of
+    the copies are filled in from the snapshots once the walk is done.
+    """
+    def __init__(self, line_to_stmt_map: 'Dict[int, ast.stmt]', id_map: 'Dict[int, ast.AST]'):
+        self._mapper = StatementMapper(line_to_stmt_map, id_map)
+        AstEavesdropper.__init__(self, self._mapper.orig_to_copy_mapping)
+        StatementInserter.__init__(self, self._mapper.orig_to_copy_mapping)
+        # id of original node -> (its copy, the original's fields at the time the copy was made)
+        self._unfilled_copies: 'Dict[int, Tuple[ast.AST, List[Tuple[str, Any]]]]' = {}
+
+    @property
+    def orig_to_copy_mapping(self) -> 'Dict[int, ast.AST]':
+        return self._mapper.orig_to_copy_mapping
+
+    def __call__(self, node: 'ast.AST') -> 'ast.AST':
+        node = self.visit(node)
+        for node_copy, fields in self._unfilled_copies.values():
+            for name, field in fields:
+                # anything the walk did not reach (e.g. subscript slices) gets copied here
+                setattr(node_copy, name, self._mapper.copy_field(field))
+        self._unfilled_copies = {}
+        return node
+
+    def _copy_without_fields(self, node: 'ast.AST') -> 'Tuple[ast.AST, List[Tuple[str, Any]]]':
+        ret = self._unfilled_copies.get(id(node), None)
+        if ret is None:
+            ret = self._mapper.copy_node(node), list(ast.iter_fields(node))
+            self._unfilled_copies[id(node)] = ret
+        return ret
+
+    def visit(self, node: 'ast.AST'):
+        node_copy, fields = self._copy_without_fields(node)
+        if isinstance(node, ast.stmt):
+            self._mapper.record_stmt(node, cast(ast.stmt, node_copy))
+        # rewriting a node can replace fields of its children without visiting
+        # them (e.g. call keywords), so the children need to be copied beforehand
+        for _, field in fields:
+            if isinstance(field, ast.AST):
+                self._copy_without_fields(field)
+            elif isinstance(field, list):
+                for inner in field:
+                    if isinstance(inner, ast.AST):
+                        self._copy_without_fields(inner)
+        return super().visit(node)
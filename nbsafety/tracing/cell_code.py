@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from functools import partial
+import logging
+import weakref
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import ast
+    from typing import Dict, Iterator, Optional
+    from types import CodeType
+    from nbsafety.safety import NotebookSafety
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+
+
+# notebook cells have filenames that appear as '<ipython-input...>'
+CELL_FILENAME_PREFIX = '<ipython-input'
+
+
+def _iter_code_tree(code: 'CodeType') -> 'Iterator[CodeType]':
+    yield code
+    for const in code.co_consts:
+        if hasattr(const, 'co_consts'):
+            yield from _iter_code_tree(const)
+
+
+class CellCode(object):
+    """The cell that a code object was compiled from, or None for code that doesn't come from a cell."""
+    __slots__ = ('code_ref', 'cell_num', 'stmt_by_lineno')
+
+    def __init__(
+            self,
+            code_ref: 'weakref.ref[CodeType]',
+            cell_num: 'Optional[int]',
+            stmt_by_lineno: 'Optional[Dict[int, ast.stmt]]',
+    ):
+        self.code_ref = code_ref
+        self.cell_num = cell_num
+        self.stmt_by_lineno = stmt_by_lineno
+
+
+class CellCodeTable(object):
+    """
+    Maps code objects to the cells they were compiled from, going by object identity (code objects compare
+    equal across cells with the same source). The first time we see some cell's code, everything nested in it
+    for functions, lambdas, and comprehensions gets registered along with it, so only that lookup has to look at
+    the filename. Code that isn't from any cell gets an entry too, so that it isn't looked at again either.
+    """
+    def __init__(self, safety: 'NotebookSafety'):
+        self.safety = safety
+        # entries get dropped once their code goes away
+        self._entries: 'Dict[int, CellCode]' = {}
+
+    def lookup(self, code: 'CodeType') -> 'CellCode':
+        entry = self._entries.get(id(code), None)
+        if entry is None or entry.code_ref() is not code:
+            entry = self._register(code)
+        return entry
+
+    def is_cell_code(self, code: 'CodeType') -> bool:
+        return self.lookup(code).cell_num is not None
+
+    def _register(self, code: 'CodeType') -> 'CellCode':
+        filename = code.co_filename
+        if not filename.startswith(CELL_FILENAME_PREFIX):
+            return self._add_entry(code, None, None)
+        cell_num = self.safety.get_cell_num_for_cell_filename(filename)
+        stmt_by_lineno = None if cell_num is None else self.safety.statement_cache[cell_num]
+        for nested_code in _iter_code_tree(code):
+            self._add_entry(nested_code, cell_num, stmt_by_lineno)
+        return self._entries[id(code)]
+
+    def _add_entry(
+            self, code: 'CodeType', cell_num: 'Optional[int]', stmt_by_lineno: 'Optional[Dict[int, ast.stmt]]'
+    ) -> 'CellCode':
+        code_id = id(code)
+        entry = self._entries[code_id] = CellCode(
+            weakref.ref(code, partial(self._remove_entry, code_id)), cell_num, stmt_by_lineno
+        )
+        return entry
+
+    def _remove_entry(self, code_id: int, code_ref: 'weakref.ref[CodeType]') -> None:
+        entry = self._entries.get(code_id, None)
+        # the id may belong to some newer code by now
+        if entry is not None and entry.code_ref is code_ref:
+            del self._entries[code_id]
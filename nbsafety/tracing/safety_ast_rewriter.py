@@ -3,32 +3,66 @@ import logging
 import traceback
 from typing import TYPE_CHECKING
 
-from nbsafety.tracing.ast_eavesdrop import AstEavesdropper
-from nbsafety.tracing.stmt_inserter import StatementInserter
-from nbsafety.tracing.stmt_mapper import StatementMapper
+from nbsafety.analysis import compute_statement_facts
+from nbsafety.tracing.ast_instrumenter import AstInstrumenter
+from nbsafety.utils import ContentAddressedCache
 
 if TYPE_CHECKING:
+    from typing import Dict, Optional, Tuple
+    from nbsafety.analysis import StatementFacts
     from nbsafety.safety import NotebookSafety
+    InstrumentedCell = Tuple[ast.AST, Dict[int, ast.stmt], Dict[int, ast.AST], Dict[int, StatementFacts]]
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
 
+class InstrumentedCellCache(ContentAddressedCache):
+    """
+    Maps a hash of a cell's source to its instrumented AST, along with the
+    line -> stmt and id -> node entries that the instrumented code refers to
+    and the static facts of its statements, so that unchanged cells can skip
+    the rewriting pipeline.
+    """
+
+
 class SafetyAstRewriter(ast.NodeTransformer):
-    def __init__(self, safety: 'NotebookSafety'):
+    def __init__(self, safety: 'NotebookSafety', cell_source: 'Optional[str]' = None):
         self.safety = safety
+        self._cache_key = None if cell_source is None else InstrumentedCellCache.key_for(cell_source)
 
     def visit(self, node: 'ast.AST'):
+        cell_counter = self.safety.cell_counter()
+        cache_key = self._cache_key
+        # only the first module we see is the cell itself; magics like %time
+        # can call back into the ast transformers for pieces of the cell later on
+        self._cache_key = None
+        if cache_key is not None:
+            cached: 'Optional[InstrumentedCell]' = self.safety.instrumented_cell_cache.get(cache_key)
+            if cached is not None:
+                # the instrumented code refers to statements by the ids of these nodes, so it suffices
+                # to re-register the same nodes under the new cell counter
+                node, line_to_stmt_map, cell_ast_node_by_id, cell_statement_facts = cached
+                self.safety.statement_cache[cell_counter] = line_to_stmt_map
+                self.safety.ast_node_by_id.update(cell_ast_node_by_id)
+                self.safety.statement_facts.update(cell_statement_facts)
+                return node
         try:
-            mapper = StatementMapper(self.safety.statement_cache[self.safety.cell_counter()], self.safety.ast_node_by_id)
-            orig_to_copy_mapping = mapper(node)
-            # very important that the eavesdropper does not create new ast nodes for ast.stmt (but just
-            # modifies existing ones), since StatementInserter relies on being able to map these
-            node = AstEavesdropper(orig_to_copy_mapping).visit(node)
-            node = StatementInserter(orig_to_copy_mapping).visit(node)
+            line_to_stmt_map = self.safety.statement_cache[cell_counter]
+            cell_ast_node_by_id = {}
+            # very important that the instrumenter does not create new ast nodes for ast.stmt (but just
+            # modifies existing ones), since it looks up the copies of statements by the ids of the originals
+            node = AstInstrumenter(line_to_stmt_map, cell_ast_node_by_id)(node)
+            self.safety.ast_node_by_id.update(cell_ast_node_by_id)
+            cell_statement_facts = compute_statement_facts(cell_ast_node_by_id.values())
+            self.safety.statement_facts.update(cell_statement_facts)
         except Exception as e:
             self.safety.set_ast_transformer_raised(e)
             traceback.print_exc()
             raise e
+        if cache_key is not None:
+            self.safety.instrumented_cell_cache.put(
+                cache_key, (node, line_to_stmt_map, cell_ast_node_by_id, cell_statement_facts)
+            )
         return node
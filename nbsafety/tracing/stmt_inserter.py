@@ -1,33 +1,41 @@
 import ast
 from typing import cast, TYPE_CHECKING
 
-from nbsafety.tracing.trace_events import TraceEvent, EMIT_EVENT
+from nbsafety.tracing.trace_events import TraceEvent
 from nbsafety.utils import fast
 
 if TYPE_CHECKING:
     from typing import Dict, Set
 
 
+_LOAD_CTX = ast.Load()
+
+
 class StatementInserter(ast.NodeTransformer):
     def __init__(self, orig_to_copy_mapping: 'Dict[int, ast.AST]'):
         self._orig_to_copy_mapping = orig_to_copy_mapping
-        self._prepend_stmt_template = '{}("{}", {{stmt_id}})'.format(EMIT_EVENT, TraceEvent.before_stmt.value)
-        self._append_stmt_template = '{}("{}", {{stmt_id}})'.format(EMIT_EVENT, TraceEvent.after_stmt.value)
-
-    def _get_parsed_prepend_stmt(self, stmt: 'ast.stmt') -> 'ast.stmt':
-        with fast.location_of(stmt):
-            return fast.parse(self._prepend_stmt_template.format(stmt_id=id(stmt))).body[0]
-
-    def _get_parsed_append_stmt(self, stmt: 'ast.stmt', ret_expr: 'ast.expr' = None) -> 'ast.stmt':
-        with fast.location_of(stmt):
-            ret = cast(ast.Expr, fast.parse(self._append_stmt_template.format(stmt_id=id(stmt))).body[0])
-            if ret_expr is not None:
-                ret_value = cast(ast.Call, ret.value)
-                ret_value.keywords = fast.kwargs(ret_expr=ret_expr)
-        ret.lineno = getattr(stmt, 'end_lineno', ret.lineno)
-        return ret
-
-    def visit(self, node):
+        self._prepend_stmt_emitter = TraceEvent.before_stmt.emitter_name
+        self._append_stmt_emitter = TraceEvent.after_stmt.emitter_name
+
+    @staticmethod
+    def _make_stmt_boundary_node(emitter_name: str, stmt: 'ast.stmt', *extra_args: 'ast.expr') -> 'ast.stmt':
+        # build `emitter_name(id(stmt), *extra_args)` directly rather than going through the parser;
+        # all the new nodes span the same source range as the statement they bracket
+        loc = {attr: getattr(stmt, attr) for attr in stmt._attributes if hasattr(stmt, attr)}
+        func = ast.Name(emitter_name, _LOAD_CTX, **loc)
+        call = ast.Call(func, [fast.Num(id(stmt), **loc), *extra_args], [], **loc)
+        return ast.Expr(call, **loc)
+
+    def _make_prepend_stmt(self, stmt: 'ast.stmt') -> 'ast.stmt':
+        return self._make_stmt_boundary_node(self._prepend_stmt_emitter, stmt)
+
+    def _make_append_stmt(self, stmt: 'ast.stmt', ret_expr: 'ast.expr' = None) -> 'ast.stmt':
+        if ret_expr is None:
+            return self._make_stmt_boundary_node(self._append_stmt_emitter, stmt)
+        else:
+            return self._make_stmt_boundary_node(self._append_stmt_emitter, stmt, ret_expr)
+
+    def generic_visit(self, node):
         for name, field in ast.iter_fields(node):
             if isinstance(field, ast.AST):
                 setattr(node, name, self.visit(field))
@@ -36,16 +44,17 @@ class StatementInserter(ast.NodeTransformer):
                 for inner_node in field:
                     if isinstance(inner_node, ast.stmt):
                         stmt_copy = cast(ast.stmt, self._orig_to_copy_mapping[id(inner_node)])
-                        new_field.append(self._get_parsed_prepend_stmt(stmt_copy))
+                        new_field.append(self._make_prepend_stmt(stmt_copy))
+                        inner_node = self.visit(inner_node)
                         if isinstance(inner_node, ast.Expr):
                             val = inner_node.value
                             while isinstance(val, ast.Expr):
                                 val = val.value
-                            new_field.append(self._get_parsed_append_stmt(stmt_copy, ret_expr=val))
+                            new_field.append(self._make_append_stmt(stmt_copy, ret_expr=val))
                         else:
-                            new_field.append(self.visit(inner_node))
+                            new_field.append(inner_node)
                             if not isinstance(inner_node, ast.Return):
-                                new_field.append(self._get_parsed_append_stmt(stmt_copy))
+                                new_field.append(self._make_append_stmt(stmt_copy))
                     elif isinstance(inner_node, ast.AST):
                         new_field.append(self.visit(inner_node))
                     else:
@@ -1,45 +1,67 @@
 import ast
-import copy
-from typing import TYPE_CHECKING
+from typing import cast, TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from typing import Dict, List, Set
+    from typing import Any, Dict
 
 
-class StatementMapper(ast.NodeVisitor):
+class StatementMapper(object):
+    """
+    Copies an ast in a single pre-order pass, recording the original -> copy mapping,
+    the id -> node mapping for the copies, and the line -> stmt mapping as it goes.
+    Like `copy.deepcopy`, nodes shared within the original (e.g. ctx singletons)
+    stay shared within the copy.
+    """
     def __init__(self, line_to_stmt_map: 'Dict[int, ast.stmt]', id_map: 'Dict[int, ast.AST]'):
         self.line_to_stmt_map = line_to_stmt_map
         self.id_map = id_map
-        self.traversal: 'List[ast.AST]' = []
+        self.orig_to_copy_mapping: 'Dict[int, ast.AST]' = {}
 
     def __call__(self, node: 'ast.AST') -> 'Dict[int, ast.AST]':
-        # for some bizarre reason we need to visit once to clear empty nodes apparently
-        self.visit(node)
-        self.traversal.clear()
-        
-        self.visit(node)
-        orig_traversal = self.traversal
-        self.traversal = []
-        self.visit(copy.deepcopy(node))
-        copy_traversal = self.traversal
-        orig_to_copy_mapping = {}
-        for no, nc in zip(orig_traversal, copy_traversal):
-            orig_to_copy_mapping[id(no)] = nc
-            self.id_map[id(nc)] = nc
-            if isinstance(nc, ast.stmt):
-                self.line_to_stmt_map[nc.lineno] = nc
-                # workaround for python >= 3.8 wherein function calls seem
-                # to yield trace frames that use the lineno of the first decorator
-                for decorator in getattr(nc, 'decorator_list', []):
-                    self.line_to_stmt_map[decorator.lineno] = nc
-        return orig_to_copy_mapping
-
-    def visit(self, node):
-        self.traversal.append(node)
-        for name, field in ast.iter_fields(node):
-            if isinstance(field, ast.AST):
-                self.visit(field)
-            elif isinstance(field, list):
-                for inner_node in field:
-                    if isinstance(inner_node, ast.AST):
-                        self.visit(inner_node)
+        self.orig_to_copy_mapping = {}
+        self._copy(node)
+        return self.orig_to_copy_mapping
+
+    def copy_node(self, node: 'ast.AST') -> 'ast.AST':
+        """
+        Shallow part of the copy: creates the copy and records it, but leaves its fields unset.
+        """
+        node_copy = node.__class__.__new__(node.__class__)
+        self.orig_to_copy_mapping[id(node)] = node_copy
+        self.id_map[id(node_copy)] = node_copy
+        for attr in node._attributes:
+            try:
+                setattr(node_copy, attr, getattr(node, attr))
+            except AttributeError:
+                pass
+        return node_copy
+
+    def record_stmt(self, node: 'ast.stmt', node_copy: 'ast.stmt') -> None:
+        self.line_to_stmt_map[node.lineno] = node_copy
+        # workaround for python >= 3.8 wherein function calls seem
+        # to yield trace frames that use the lineno of the first decorator
+        for decorator in getattr(node, 'decorator_list', []):
+            self.line_to_stmt_map[decorator.lineno] = node_copy
+
+    def _copy(self, node: 'ast.AST') -> 'ast.AST':
+        node_copy = self.orig_to_copy_mapping.get(id(node), None)
+        if node_copy is not None:
+            return node_copy
+        node_copy = self.copy_node(node)
+        if isinstance(node, ast.stmt):
+            self.record_stmt(node, cast(ast.stmt, node_copy))
+        for name in node._fields:
+            try:
+                field = getattr(node, name)
+            except AttributeError:
+                continue
+            setattr(node_copy, name, self.copy_field(field))
+        return node_copy
+
+    def copy_field(self, field: 'Any') -> 'Any':
+        if isinstance(field, ast.AST):
+            return self._copy(field)
+        elif isinstance(field, list):
+            return [self._copy(inner) if isinstance(inner, ast.AST) else inner for inner in field]
+        else:
+            return field
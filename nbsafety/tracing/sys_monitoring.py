@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import logging
+import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Optional
+    from types import CodeType, FrameType
+    SysTracer = Callable[[FrameType, str, Any], Optional[Callable]]
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.WARNING)
+
+
+_TOOL_NAME = 'nbsafety'
+
+
+def sys_monitoring_available() -> bool:
+    return hasattr(sys, 'monitoring')
+
+
+def _acquire_tool_id() -> int:
+    monitoring = sys.monitoring  # type: ignore
+    # 0, 1, 2, and 5 are reserved for debuggers, coverage tools, profilers, and optimizers
+    for candidate in (3, 4):
+        if monitoring.get_tool(candidate) is None:
+            monitoring.use_tool_id(candidate, _TOOL_NAME)
+            return candidate
+    raise RuntimeError(
+        'sys.monitoring tool ids 3 and 4 are both taken (by %r and %r); '
+        'pass use_sys_monitoring=False to trace with sys.settrace instead'
+        % (monitoring.get_tool(3), monitoring.get_tool(4))
+    )
+
+
+class SysMonitoringTracer(object):
+    """
+    Drives a `sys.settrace`-style tracer function from `sys.monitoring` (PEP 669) events.
+
+    Only events fired from code objects compiled from notebook cells are forwarded; for
+    everything else we return `DISABLE` (where permitted), so that library code runs
+    without any per-event overhead after the first call. Frames only receive 'return' and
+    'exception' events if the tracer asked to trace them upon 'call', mirroring the local
+    trace function semantics of `sys.settrace`.
+
+    A tool id is claimed the first time tracing gets enabled, and given back by `release`.
+    """
+    def __init__(self, tracer: 'SysTracer', is_cell_code: 'Callable[[CodeType], bool]'):
+        self._tracer = tracer
+        self._is_cell_code = is_cell_code
+        self._traced_frames: 'Dict[int, FrameType]' = {}
+        self._tool_id: 'Optional[int]' = None
+        monitoring = sys.monitoring  # type: ignore
+        self._events = monitoring.events
+        self._disable = monitoring.DISABLE
+        self._event_mask = (
+            self._events.PY_START
+            | self._events.PY_RESUME
+            | self._events.PY_THROW
+            | self._events.PY_RETURN
+            | self._events.PY_YIELD
+            | self._events.PY_UNWIND
+            | self._events.RAISE
+        )
+
+    def _callbacks_by_event(self) -> 'Dict[int, Callable[..., Any]]':
+        events = self._events
+        return {
+            events.PY_START: self._py_start,
+            events.PY_RESUME: self._py_start,
+            events.PY_THROW: self._py_throw,
+            events.PY_RETURN: self._py_return,
+            events.PY_YIELD: self._py_return,
+            events.PY_UNWIND: self._py_unwind,
+            events.RAISE: self._raise,
+        }
+
+    def enable(self) -> None:
+        monitoring = sys.monitoring  # type: ignore
+        if self._tool_id is None:
+            self._tool_id = _acquire_tool_id()
+            for event, callback in self._callbacks_by_event().items():
+                monitoring.register_callback(self._tool_id, event, callback)
+        monitoring.set_events(self._tool_id, self._event_mask)
+
+    def disable(self) -> None:
+        if self._tool_id is not None:
+            sys.monitoring.set_events(self._tool_id, self._events.NO_EVENTS)  # type: ignore
+
+    def release(self) -> None:
+        """Unregisters our callbacks and frees the tool id for others to use."""
+        if self._tool_id is None:
+            return
+        monitoring = sys.monitoring  # type: ignore
+        monitoring.set_events(self._tool_id, self._events.NO_EVENTS)
+        for event in self._callbacks_by_event():
+            monitoring.register_callback(self._tool_id, event, None)
+        monitoring.free_tool_id(self._tool_id)
+        self._tool_id = None
+        self._traced_frames.clear()
+
+    def clear_traced_frames(self) -> None:
+        self._traced_frames.clear()
+
+    def _dispatch_local(self, frame: 'FrameType', evt: str, arg: 'Any') -> None:
+        if self._traced_frames.get(id(frame), None) is not frame:
+            return
+        if self._tracer(frame, evt, arg) is None or evt == 'return':
+            # like a local trace function returning None, stop tracing this frame
+            self._traced_frames.pop(id(frame), None)
+
+    def _start_frame(self, frame: 'FrameType') -> None:
+        if self._tracer(frame, 'call', None) is not None:
+            self._traced_frames[id(frame)] = frame
+
+    def _py_start(self, code: 'CodeType', _instruction_offset: int):
+        if not self._is_cell_code(code):
+            return self._disable
+        self._start_frame(sys._getframe(1))
+        return None
+
+    def _py_return(self, code: 'CodeType', _instruction_offset: int, retval: 'Any'):
+        if not self._is_cell_code(code):
+            return self._disable
+        self._dispatch_local(sys._getframe(1), 'return', retval)
+        return None
+
+    # PY_THROW, PY_UNWIND, and RAISE cannot be disabled per code location, so we just return early for these
+
+    def _py_throw(self, code: 'CodeType', _instruction_offset: int, _exception: BaseException):
+        # settrace reports a 'call' for generators and coroutines resumed with throw()
+        if self._is_cell_code(code):
+            self._start_frame(sys._getframe(1))
+
+    def _py_unwind(self, code: 'CodeType', _instruction_offset: int, _exception: BaseException):
+        if self._is_cell_code(code):
+            self._dispatch_local(sys._getframe(1), 'return', None)
+
+    def _raise(self, code: 'CodeType', _instruction_offset: int, exception: BaseException):
+        if self._is_cell_code(code):
+            self._dispatch_local(sys._getframe(1), 'exception', (type(exception), exception, None))
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import ast
 from enum import Enum
 
 from nbsafety.utils import fast
@@ -37,3 +38,11 @@ class TraceEvent(Enum):
 
     def to_ast(self):
         return fast.Constant(self.value)
+
+    @property
+    def emitter_name(self) -> str:
+        """Name of the builtin that instrumented code calls to emit this event."""
+        return '{}_{}'.format(EMIT_EVENT, self.name)
+
+    def emitter_ast(self) -> 'ast.Name':
+        return fast.Name(self.emitter_name, ast.Load())
@@ -2,7 +2,6 @@
 import ast
 import builtins
 from contextlib import contextmanager
-import itertools
 import logging
 import sys
 from typing import cast, TYPE_CHECKING
@@ -14,7 +13,8 @@ from nbsafety.data_model.data_symbol import DataSymbol, DataSymbolType
 from nbsafety.data_model.scope import NamespaceScope
 from nbsafety.tracing.mutation_event import MutationEvent
 from nbsafety.tracing.recovery import on_exception_default_to, return_arg_at_index, return_val
-from nbsafety.tracing.trace_events import TraceEvent, EMIT_EVENT
+from nbsafety.tracing.sys_monitoring import SysMonitoringTracer, sys_monitoring_available
+from nbsafety.tracing.trace_events import TraceEvent
 from nbsafety.tracing.trace_stmt import TraceStatement
 
 if TYPE_CHECKING:
@@ -32,6 +32,8 @@ if TYPE_CHECKING:
     DeepRefCandidate = Tuple[RefCandidate, MutationEvent, RecordedArgs]
     SavedStoreData = Tuple[NamespaceScope, Any, AttrSubVal, bool]
     LexicalCallNestingStack = List[Scope]
+    # handler, event counter at the time of the event, and the handler's args
+    BufferedEvent = Tuple[Callable[..., Any], int, Any, Tuple[Any, ...]]
 
 
 logger = logging.getLogger(__name__)
@@ -52,6 +54,10 @@ ARG_MUTATION_EXCEPTED_MODULES = {
     'widget',
 }
 
+# buffered events hold on to the values they saw, so don't let one statement buffer too many of them
+# (e.g., every iteration of a comprehension happens within the same statement)
+MAX_BUFFERED_EVENTS = 1024
+
 
 class ListLiteral(list):
     pass
@@ -70,6 +76,110 @@ def _make_weakrefable_literal(literal):
         return literal
 
 
+def _before_literal():
+    pass
+
+
+class PendingNamespace(object):
+    """
+    Stands in for the namespace of an object that has only had attributes or subscripts loaded from it so far.
+    The actual NamespaceScope is only made if something ends up needing it (see `TracingManager.materialize`).
+    """
+    __slots__ = ('obj', 'obj_name', 'parent_scope', 'scope')
+
+    def __init__(self, obj: 'Any', obj_name: 'Optional[str]', parent_scope: 'Union[Scope, PendingNamespace]'):
+        self.obj = obj
+        self.obj_name = obj_name
+        self.parent_scope = parent_scope
+        self.scope: 'Optional[NamespaceScope]' = None
+
+
+class PendingLoad(object):
+    """A loaded attribute or subscript that has no DataSymbol yet."""
+    __slots__ = ('namespace', 'attr_or_subscript', 'is_subscript', 'obj_attr_or_sub')
+
+    def __init__(
+            self,
+            namespace: 'Union[NamespaceScope, PendingNamespace]',
+            attr_or_subscript: 'AttrSubVal',
+            is_subscript: bool,
+            obj_attr_or_sub: 'Any',
+    ):
+        self.namespace = namespace
+        self.attr_or_subscript = attr_or_subscript
+        self.is_subscript = is_subscript
+        self.obj_attr_or_sub = obj_attr_or_sub
+
+
+class FrameState(object):
+    """
+    The tracer's state for one traced frame. Call transitions swap in a fresh one, and returns swap
+    the caller's back in; the containers are cleared and reused instead of being allocated per call.
+    """
+    __slots__ = (
+        'prev_trace_stmt_in_cur_frame',
+        'loaded_data_symbols',
+        'pending_loads',
+        'load_awaiting_value',
+        'event_buffer',
+        'saved_store_data',
+        'deep_refs',
+        'mutations',
+        'deep_ref_candidates',
+        'nested_call_stack',
+        'should_record_args',
+        'should_record_args_stack',
+        'literal_namespace',
+        'first_obj_id_in_chain',
+        'cur_frame_original_scope',
+        'active_scope',
+        'inside_lambda',
+    )
+
+    def __init__(self, scope: 'Scope', inside_lambda: bool = False):
+        self.prev_trace_stmt_in_cur_frame: 'Optional[TraceStatement]' = None
+        self.loaded_data_symbols: 'Set[DataSymbol]' = set()
+        self.pending_loads: 'List[PendingLoad]' = []
+        # the attribute / subscript load whose value gets passed to the next event in this frame
+        self.load_awaiting_value: 'Optional[Union[DataSymbol, PendingLoad]]' = None
+        self.event_buffer: 'List[BufferedEvent]' = []
+        self.saved_store_data: 'List[SavedStoreData]' = []
+        self.deep_refs: 'Set[DeepRef]' = set()
+        self.mutations: 'Set[Mutation]' = set()
+        self.deep_ref_candidates: 'List[DeepRefCandidate]' = []
+        self.nested_call_stack: 'LexicalCallNestingStack' = []
+        self.should_record_args = False
+        self.should_record_args_stack: 'List[bool]' = []
+        self.literal_namespace: 'Optional[NamespaceScope]' = None
+        self.first_obj_id_in_chain: 'Optional[int]' = None
+        self.cur_frame_original_scope = scope
+        self.active_scope: 'Union[Scope, PendingNamespace]' = scope
+        self.inside_lambda = inside_lambda
+
+    def reset(self, scope: 'Scope', inside_lambda: bool):
+        self.prev_trace_stmt_in_cur_frame = None
+        self.cur_frame_original_scope = scope
+        self.inside_lambda = inside_lambda
+        self.reset_stmt_state()
+
+    def reset_stmt_state(self):
+        """Clears everything that only lives until the end of the current statement."""
+        self.loaded_data_symbols.clear()
+        self.pending_loads.clear()
+        self.load_awaiting_value = None
+        self.event_buffer.clear()
+        self.saved_store_data.clear()
+        self.deep_refs.clear()
+        self.mutations.clear()
+        self.deep_ref_candidates.clear()
+        self.nested_call_stack.clear()
+        self.should_record_args_stack.clear()
+        self.active_scope = self.cur_frame_original_scope
+        self.should_record_args = False
+        self.literal_namespace = None
+        self.first_obj_id_in_chain = None
+
+
 def _finish_tracing_reset():
     # do nothing; we just want to trigger the newly reenabled tracer with a 'call' event
     pass
@@ -86,91 +196,61 @@ class TracingManager(object):
         self.traced_statements: Dict[int, TraceStatement] = {}
         self.tracing_enabled = False
         self.tracing_reset_pending = False
+        self._sys_monitoring_tracer: 'Optional[SysMonitoringTracer]' = self._make_sys_monitoring_tracer()
 
-        setattr(builtins, EMIT_EVENT, self._emit_event)
-
-        self._stack: 'List[Tuple[Any, ...]]' = []
-        self._stack_item_initializers: 'Dict[str, Callable[[], Any]]' = {}
-        self._stack_items_with_manual_initialization: 'Set[str]' = set()
-        self._registering_stack_state_context = False
-        with self._register_stack_state():
-            # everything here should be copyable
-            self.prev_trace_stmt_in_cur_frame: Optional[TraceStatement] = None
-            self.loaded_data_symbols: Set[DataSymbol] = set()
-            self.saved_store_data: List[SavedStoreData] = []
-            self.deep_refs: Set[DeepRef] = set()
-            self.mutations: Set[Mutation] = set()
-            self.deep_ref_candidates: List[DeepRefCandidate] = []
-            self.nested_call_stack: LexicalCallNestingStack = []
-            self.should_record_args = False
-            self.should_record_args_stack: List[bool] = []
-            self.literal_namespace: Optional[NamespaceScope] = None
-            self.first_obj_id_in_chain: Optional[int] = None
-            with self._needing_manual_initialization():
-                self.cur_frame_original_scope = safety.global_scope
-                self.active_scope = safety.global_scope
-                self.inside_lambda = False
-
-    @property
-    def _stack_item_names(self):
-        return itertools.chain(self._stack_item_initializers.keys(), self._stack_items_with_manual_initialization)
+        for evt, emitter in self._emitters_by_event().items():
+            setattr(builtins, evt.emitter_name, emitter)
 
-    @contextmanager
-    def _register_stack_state(self):
-        self._registering_stack_state_context = True
-        original_state = set(self.__dict__.keys())
-        yield
-        self._registering_stack_state_context = False
-        stack_item_names = set(self.__dict__.keys() - original_state)
-        for stack_item_name in stack_item_names - self._stack_items_with_manual_initialization:
-            stack_item = self.__dict__[stack_item_name]
-            if stack_item is None:
-                self._stack_item_initializers[stack_item_name] = lambda: None
-            elif isinstance(stack_item, bool):
-                init_val = bool(stack_item)
-                self._stack_item_initializers[stack_item_name] = lambda: init_val
-            else:
-                self._stack_item_initializers[stack_item_name] = type(stack_item)
+        self.frame_state = FrameState(safety.global_scope)
+        # states of the frames below the current one, and states that can be reused for new frames
+        self._stack: 'List[FrameState]' = []
+        self._frame_state_pool: 'List[FrameState]' = []
 
-    @contextmanager
-    def _needing_manual_initialization(self):
-        assert self._registering_stack_state_context
-        original_state = set(self.__dict__.keys())
-        yield
-        self._stack_items_with_manual_initialization = set(self.__dict__.keys() - original_state)
+    def reset(self):
+        """
+        Clears what was traced during the last cell. The builtin emitters, the sys.monitoring tracer, and the
+        pooled frame states are kept for the next one; per-statement metadata lives on the NotebookSafety instance.
+        """
+        self.trace_event_counter = 0
+        self.prev_event = None
+        self.prev_trace_stmt = None
+        self.seen_stmts.clear()
+        self.call_depth = 0
+        self.traced_statements.clear()
+        self.tracing_reset_pending = False
+        self._frame_state_pool.extend(self._stack)
+        self._stack.clear()
+        self.frame_state.reset(self.safety.global_scope, False)
+        if self._sys_monitoring_tracer is not None:
+            self._sys_monitoring_tracer.clear_traced_frames()
+
+    def _make_sys_monitoring_tracer(self) -> 'Optional[SysMonitoringTracer]':
+        if not self.safety.config.get('use_sys_monitoring', True) or not sys_monitoring_available():
+            return None
+        return SysMonitoringTracer(self._sys_tracer, self.safety.cell_code_table.is_cell_code)
 
-    @contextmanager
-    def _push_stack(self):
-        self._stack.append(tuple(self.__dict__[stack_item] for stack_item in self._stack_item_names))
-        for stack_item, initializer in self._stack_item_initializers.items():
-            self.__dict__[stack_item] = initializer()
-        for stack_item in self._stack_items_with_manual_initialization:
-            del self.__dict__[stack_item]
-        yield
-        uninitialized_items = []
-        for stack_item in self._stack_items_with_manual_initialization:
-            if stack_item not in self.__dict__:
-                uninitialized_items.append(stack_item)
-        if len(uninitialized_items) > 0:
-            raise ValueError(
-                "Stack item(s) %s requiring manual initialization were not initialized" % uninitialized_items
-            )
+    def _push_stack(self, scope: 'Scope', inside_lambda: bool):
+        self._stack.append(self.frame_state)
+        if len(self._frame_state_pool) > 0:
+            frame_state = self._frame_state_pool.pop()
+            frame_state.reset(scope, inside_lambda)
+        else:
+            frame_state = FrameState(scope, inside_lambda)
+        self.frame_state = frame_state
 
     def _handle_call_transition(self, trace_stmt: 'TraceStatement'):
-        new_scope = trace_stmt.get_post_call_scope()
-        with self._push_stack():
-            # TODO: figure out a better way to determine if we're inside a lambda
-            #  could this one lead to a false negative if a lambda is in the default of a function def kwarg?
-            self.inside_lambda = not isinstance(
-                trace_stmt.stmt_node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
-            )
-            self.cur_frame_original_scope = new_scope
-            self.active_scope = new_scope
-        self.prev_trace_stmt_in_cur_frame = self.prev_trace_stmt = trace_stmt
-
-    def _pop_stack(self):
-        for stack_item_name, stack_item in zip(self._stack_item_names, self._stack.pop()):
-            self.__dict__[stack_item_name] = stack_item
+        # TODO: figure out a better way to determine if we're inside a lambda
+        #  could this one lead to a false negative if a lambda is in the default of a function def kwarg?
+        inside_lambda = not (trace_stmt.facts.is_function_def or trace_stmt.facts.is_class_def)
+        self._push_stack(trace_stmt.get_post_call_scope(), inside_lambda)
+        self.frame_state.prev_trace_stmt_in_cur_frame = self.prev_trace_stmt = trace_stmt
+
+    def _pop_stack(self) -> 'FrameState':
+        # the popped state stays intact until a later push reuses it
+        frame_state = self.frame_state
+        self._frame_state_pool.append(frame_state)
+        self.frame_state = self._stack.pop()
+        return frame_state
 
     def _check_prev_stmt_done_executing_hook(self, event: 'TraceEvent', trace_stmt: 'TraceStatement'):
         if event == TraceEvent.after_stmt:
@@ -185,19 +265,22 @@ class TracingManager(object):
             #     prev_overall.finished_execution_hook()
 
     def _handle_return_transition(self, trace_stmt: 'TraceStatement'):
-        inside_lambda = self.inside_lambda
-        cur_frame_scope = self.cur_frame_original_scope
-        self._pop_stack()
-        return_to_stmt = self.prev_trace_stmt_in_cur_frame
+        returned_from = self._pop_stack()
+        inside_lambda = returned_from.inside_lambda
+        cur_frame_scope = returned_from.cur_frame_original_scope
+        return_to_stmt = self.frame_state.prev_trace_stmt_in_cur_frame
         assert return_to_stmt is not None
         if self.prev_event != TraceEvent.exception:
             # exception events are followed by return events until we hit an except clause
             # no need to track dependencies in this case
-            if isinstance(return_to_stmt.stmt_node, ast.ClassDef):
+            if return_to_stmt.facts.is_class_def:
                 return_to_stmt.class_scope = cast(NamespaceScope, cur_frame_scope)
-            elif isinstance(trace_stmt.stmt_node, ast.Return) or inside_lambda:
+            elif trace_stmt.facts.is_return or inside_lambda:
                 if not trace_stmt.lambda_call_point_deps_done_once:
                     trace_stmt.lambda_call_point_deps_done_once = True
+                    # the caller's loads so far count as dependencies too
+                    self.flush_event_buffer()
+                    self.materialize()
                     return_to_stmt.call_point_deps.append(trace_stmt.compute_rval_dependencies())
 
     def state_transition_hook(
@@ -215,42 +298,85 @@ class TracingManager(object):
             self._handle_return_transition(trace_stmt)
         self.prev_event = event
 
-    def _emit_event(self, evt: str, orig_node_id: int, **kwargs: 'Any'):
-        event = TraceEvent(evt)
-        if event == TraceEvent.before_stmt:
-            return self.before_stmt_tracer(orig_node_id, sys._getframe().f_back)
-        elif event == TraceEvent.after_stmt:
-            return self.after_stmt_tracer(orig_node_id, sys._getframe().f_back, ret_expr=kwargs.get('ret_expr', None))
-        elif event in (TraceEvent.attribute, TraceEvent.subscript):
-            return self.attrsub_tracer(
-                kwargs['obj'],
-                kwargs['attr_or_sub'],
-                kwargs['ctx'],
-                kwargs['call_context'],
-                is_subscript=event == TraceEvent.subscript,
-                obj_name=kwargs.get('name', None),
-            )
-        elif event == TraceEvent.after_attrsub_chain:
-            return self.end_tracer(kwargs['obj'], kwargs['call_context'])
-        elif event == TraceEvent.argument:
-            return self.arg_recorder(kwargs['obj'], self.safety.ast_node_by_id[orig_node_id])
-        elif event == TraceEvent.before_arg_list:
-            return self.before_argument_list(kwargs['obj'])
-        elif event == TraceEvent.after_arg_list:
-            return self.after_argument_list(kwargs['obj'], kwargs['is_attrsub'], kwargs['inside_chain'])
-        elif event == TraceEvent.before_literal:
-            pass
-        elif event == TraceEvent.after_literal:
-            return self.literal_tracer(kwargs['obj'])
-        else:
-            raise ValueError('Unsupported event: %s' % event)
+    def _emitters_by_event(self) -> 'Dict[TraceEvent, Callable[..., Any]]':
+        # instrumented code calls these directly with positional args, so each
+        # handler's signature must match the call that AstEavesdropper or
+        # StatementInserter generates for the corresponding event
+        emitters: 'Dict[TraceEvent, Callable[..., Any]]' = {
+            TraceEvent.attribute: self.attrsub_tracer,
+            TraceEvent.subscript: self.attrsub_tracer,
+            TraceEvent.after_attrsub_chain: self.end_tracer,
+            TraceEvent.argument: self.arg_recorder,
+            TraceEvent.before_arg_list: self.before_argument_list,
+            TraceEvent.after_arg_list: self.after_argument_list,
+        }
+        if self.safety.config.event_buffer:
+            emitters = {evt: self._make_buffering_emitter(handler) for evt, handler in emitters.items()}
+        emitters.update({
+            TraceEvent.before_stmt: self.before_stmt_tracer,
+            TraceEvent.after_stmt: self.after_stmt_tracer,
+            TraceEvent.before_literal: _before_literal,
+            TraceEvent.after_literal: self.literal_tracer,
+        })
+        return emitters
+
+    def _make_buffering_emitter(self, handler: 'Callable[..., Any]') -> 'Callable[..., Any]':
+        """
+        Makes an emitter that just records the event for `flush_event_buffer` to hand to `handler`
+        once the statement finishes, so nothing gets done for events of statements we won't use.
+        """
+        def emit(obj: 'Any', *args: 'Any') -> 'Any':
+            if self.tracing_enabled:
+                trace_stmt = self.frame_state.prev_trace_stmt_in_cur_frame
+                if trace_stmt is not None and not trace_stmt.finished:
+                    event_buffer = self.frame_state.event_buffer
+                    event_buffer.append((handler, self.trace_event_counter, obj, args))
+                    if len(event_buffer) >= MAX_BUFFERED_EVENTS:
+                        self.flush_event_buffer()
+            return obj
+        return emit
 
-    def _get_namespace_for_obj(self, obj: 'Any', obj_name: 'Optional[str]' = None) -> 'NamespaceScope':
-        obj_id = id(obj)
-        ns = self.safety.namespaces.get(obj_id, None)
+    def flush_event_buffer(self):
+        """Runs the handlers for the events buffered so far in this frame, in the order the events happened."""
+        event_buffer = self.frame_state.event_buffer
+        if len(event_buffer) == 0:
+            return
+        tracing_enabled, trace_event_counter = self.tracing_enabled, self.trace_event_counter
+        # the handlers should see things as they were when the events were recorded
+        self.tracing_enabled = True
+        try:
+            for handler, event_counter, obj, args in event_buffer:
+                self.trace_event_counter = event_counter
+                handler(obj, *args)
+        finally:
+            self.tracing_enabled = tracing_enabled
+            self.trace_event_counter = trace_event_counter
+            event_buffer.clear()
+
+    def _get_namespace_for_obj(
+            self, obj: 'Any', obj_name: 'Optional[str]' = None, defer=False
+    ) -> 'Union[NamespaceScope, PendingNamespace]':
+        ns = self.safety.namespaces.get(id(obj), None)
         # print('%s attrsub %s of obj %s' % (ctx, attr_or_subscript, obj))
         if ns is not None:
             return ns
+        if defer:
+            return PendingNamespace(obj, obj_name, self.frame_state.active_scope)
+        return self._make_namespace_for_obj(obj, obj_name, self.frame_state.active_scope)
+
+    def _make_namespace_for_obj(
+            self, obj: 'Any', obj_name: 'Optional[str]', active_scope: 'Union[Scope, PendingNamespace]'
+    ) -> 'NamespaceScope':
+        obj_id = id(obj)
+        # FIXME: brittle strategy for determining parent scope of obj
+        if obj_name is not None and obj_name not in self.frame_state.prev_trace_stmt_in_cur_frame.frame.f_locals:
+            parent_scope = self.safety.global_scope
+        else:
+            # make the parent first, since it could turn out to be this very object's namespace
+            parent_scope = self._materialize_namespace(active_scope)
+            ns = self.safety.namespaces.get(obj_id, None)
+            if ns is not None:
+                return ns
         class_scope = self.safety.namespaces.get(id(obj.__class__), None)
         if class_scope is not None:
             # print('found class scope %s containing %s' % (class_scope, list(class_scope.all_data_symbols_this_indentation())))
@@ -268,22 +394,68 @@ class TracingManager(object):
             except (TypeError, StopIteration):
                 scope_name = '<unknown namespace>'
             ns = NamespaceScope(obj, self.safety, scope_name, parent_scope=None)
-        # FIXME: brittle strategy for determining parent scope of obj
         if ns.parent_scope is None:
-            if (
-                    obj_name is not None and
-                    obj_name not in self.prev_trace_stmt_in_cur_frame.frame.f_locals
-            ):
-                parent_scope = self.safety.global_scope
-            else:
-                parent_scope = self.active_scope
             ns.parent_scope = parent_scope
         return ns
 
+    def _materialize_namespace(self, scope: 'Union[Scope, PendingNamespace]') -> 'Scope':
+        if not isinstance(scope, PendingNamespace):
+            return scope
+        if scope.scope is None:
+            ns = self.safety.namespaces.get(id(scope.obj), None)
+            if ns is None:
+                ns = self._make_namespace_for_obj(scope.obj, scope.obj_name, scope.parent_scope)
+            scope.scope = ns
+        return scope.scope
+
+    def materialize(self):
+        """Makes the namespaces and implicit symbols for this statement's loads so far."""
+        frame_state = self.frame_state
+        for pending_load in frame_state.pending_loads:
+            scope = cast(NamespaceScope, self._materialize_namespace(pending_load.namespace))
+            attr_or_subscript, is_subscript = pending_load.attr_or_subscript, pending_load.is_subscript
+            data_sym = scope.lookup_data_symbol_by_name_this_indentation(attr_or_subscript, is_subscript=is_subscript)
+            if data_sym is None:
+                data_sym = self.safety.data_symbol_class(
+                    attr_or_subscript,
+                    DataSymbolType.SUBSCRIPT if is_subscript else DataSymbolType.DEFAULT,
+                    pending_load.obj_attr_or_sub,
+                    scope,
+                    self.safety,
+                    stmt_node=None,
+                    parents=None,
+                    refresh_cached_obj=True,
+                    implicit=True,
+                )
+                # this is to prevent refs to the scope object from being considered as stale if we just load it
+                data_sym.defined_cell_num = data_sym.required_cell_num = scope.max_defined_timestamp
+                scope.put(attr_or_subscript, data_sym)
+                # print('put', data_sym, 'in', scope.full_namespace_path)
+            frame_state.loaded_data_symbols.add(data_sym)
+        frame_state.pending_loads.clear()
+
+    def _receive_loaded_value(self, obj_attr_or_sub: 'Any'):
+        """
+        Instrumented code passes the value of each traced attribute / subscript load on to whichever
+        event comes next in the chain, so we take it from there instead of evaluating the load again.
+        """
+        frame_state = self.frame_state
+        load = frame_state.load_awaiting_value
+        if load is None:
+            return
+        frame_state.load_awaiting_value = None
+        if isinstance(load, PendingLoad):
+            load.obj_attr_or_sub = obj_attr_or_sub
+            frame_state.pending_loads.append(load)
+        elif load.obj_id != id(obj_attr_or_sub):
+            load.update_obj_ref(obj_attr_or_sub)
+
     @on_exception_default_to(return_arg_at_index(1, logger))
     def attrsub_tracer(
             self, obj, attr_or_subscript, ctx: str, call_context: bool, is_subscript: bool, obj_name: 'Optional[str]'
     ):
+        frame_state = self.frame_state
+        self._receive_loaded_value(obj)
         if not self.tracing_enabled:
             return obj
         should_record_args = False
@@ -291,88 +463,76 @@ class TracingManager(object):
             if obj is None:
                 return None
             obj_id = id(obj)
-            if self.first_obj_id_in_chain is None:
-                self.first_obj_id_in_chain = obj_id
+            if frame_state.first_obj_id_in_chain is None:
+                frame_state.first_obj_id_in_chain = obj_id
             if isinstance(attr_or_subscript, tuple):
                 if not all(isinstance(v, (str, int)) for v in attr_or_subscript):
                     return obj
             elif not isinstance(attr_or_subscript, (str, int)):
                 return obj
 
-            scope = self._get_namespace_for_obj(obj, obj_name=obj_name)
-            self.active_scope = scope
+            # plain loads don't need a namespace or symbols unless something else in the statement does
+            scope = self._get_namespace_for_obj(obj, obj_name=obj_name, defer=ctx == 'Load')
+            frame_state.active_scope = scope
             # if scope is None:  # or self.prev_trace_stmt.finished:
             #     if ctx in ('Store', 'AugStore'):
             #         self.active_scope = self.original_active_scope
             #     return obj
-            if scope is None or self.prev_trace_stmt_in_cur_frame.finished:
+            if scope is None or frame_state.prev_trace_stmt_in_cur_frame.finished:
                 return obj
             elif ctx in ('Store', 'AugStore') and scope is not None:
-                self.saved_store_data.append((scope, obj, attr_or_subscript, is_subscript))
+                # only loads defer their namespaces, so this is already materialized
+                store_scope = cast(NamespaceScope, self._materialize_namespace(scope))
+                frame_state.saved_store_data.append((store_scope, obj, attr_or_subscript, is_subscript))
                 # reset active scope here
-                self.active_scope = self.cur_frame_original_scope
+                frame_state.active_scope = frame_state.cur_frame_original_scope
             if ctx == 'Load':
                 # save off event counter and obj_id
                 # if event counter didn't change when we process the Call retval, and if the
                 # retval is None, this is a likely signal that we have a mutation
                 # TODO: this strategy won't work if the arguments themselves lead to traced function calls
                 # print('looking for', attr_or_subscript)
-                data_sym = scope.lookup_data_symbol_by_name_this_indentation(
-                    attr_or_subscript, is_subscript=is_subscript
-                )
-                try:
-                    obj_attr_or_sub = self.safety.retrieve_namespace_attr_or_sub(
-                        obj, attr_or_subscript, is_subscript
+                if isinstance(scope, PendingNamespace):
+                    data_sym = None
+                else:
+                    data_sym = scope.lookup_data_symbol_by_name_this_indentation(
+                        attr_or_subscript, is_subscript=is_subscript
                     )
-                    if data_sym is None:
-                        symbol_type = DataSymbolType.SUBSCRIPT if is_subscript else DataSymbolType.DEFAULT
-                        data_sym = DataSymbol(
-                            attr_or_subscript,
-                            symbol_type,
-                            obj_attr_or_sub,
-                            scope,
-                            self.safety,
-                            stmt_node=None,
-                            parents=None,
-                            refresh_cached_obj=True,
-                            implicit=True,
-                        )
-                        # this is to prevent refs to the scope object from being considered as stale if we just load it
-                        data_sym.defined_cell_num = data_sym.required_cell_num = scope.max_defined_timestamp
-                        scope.put(attr_or_subscript, data_sym)
-                        # print('put', data_sym, 'in', scope.full_namespace_path)
-                    elif data_sym.obj_id != id(obj_attr_or_sub):
-                        data_sym.update_obj_ref(obj_attr_or_sub)
-                except:
-                    pass
+                if data_sym is not None:
+                    frame_state.load_awaiting_value = data_sym
+                elif not call_context:
+                    # symbols for called attributes would never be used as dependencies, so don't bother
+                    frame_state.load_awaiting_value = PendingLoad(scope, attr_or_subscript, is_subscript, None)
                 if call_context:
                     should_record_args = True
                     mutation_event = MutationEvent.normal
                     if isinstance(obj, list) and attr_or_subscript == 'append':
                         mutation_event = MutationEvent.list_append
-                    self.deep_ref_candidates.append(
+                    frame_state.deep_ref_candidates.append(
                         ((self.trace_event_counter, obj_id, obj_name), mutation_event, set())
                     )
                 elif data_sym is not None:
                     # TODO: if we have a.b.c, will this consider a.b loaded as well as a.b.c? This is bad if so.
-                    self.loaded_data_symbols.add(data_sym)
+                    frame_state.loaded_data_symbols.add(data_sym)
             return obj
         finally:
             if call_context:
-                self.should_record_args_stack.append(self.should_record_args)
-                self.should_record_args = should_record_args
+                frame_state.should_record_args_stack.append(frame_state.should_record_args)
+                frame_state.should_record_args = should_record_args
 
     @on_exception_default_to(return_arg_at_index(1, logger))
     def end_tracer(self, obj: 'Any', call_context: bool):
-        first_obj_id_in_chain = self.first_obj_id_in_chain
-        self.first_obj_id_in_chain = None
+        frame_state = self.frame_state
+        self._receive_loaded_value(obj)
+        first_obj_id_in_chain = frame_state.first_obj_id_in_chain
+        frame_state.first_obj_id_in_chain = None
         if not self.tracing_enabled:
             return obj
-        if self.prev_trace_stmt_in_cur_frame.finished:
-            self.active_scope = self.cur_frame_original_scope
+        if frame_state.prev_trace_stmt_in_cur_frame.finished:
+            frame_state.active_scope = frame_state.cur_frame_original_scope
             return obj
-        if call_context and len(self.deep_ref_candidates) > 0:
-            (evt_counter, obj_id, obj_name), mutation_event, recorded_args = self.deep_ref_candidates.pop()
+        if call_context and len(frame_state.deep_ref_candidates) > 0:
+            (evt_counter, obj_id, obj_name), mutation_event, recorded_args = frame_state.deep_ref_candidates.pop()
             if evt_counter == self.trace_event_counter:
                 if obj is None:
                     if mutation_event == MutationEvent.normal:
@@ -388,22 +548,24 @@ class TracingManager(object):
                                         break
                         except:
                             pass
-                    self.mutations.add((obj_id, tuple(recorded_args), mutation_event))
+                    frame_state.mutations.add((obj_id, tuple(recorded_args), mutation_event))
                 else:
-                    self.deep_refs.add((obj_id, obj_name, tuple(recorded_args)))
+                    frame_state.deep_refs.add((obj_id, obj_name, tuple(recorded_args)))
         # print('reset active scope from', self.active_scope, 'to', self.original_active_scope)
-        self.active_scope = self.cur_frame_original_scope
+        frame_state.active_scope = frame_state.cur_frame_original_scope
         return obj
 
     @on_exception_default_to(return_arg_at_index(1, logger))
-    def arg_recorder(self, arg_obj: 'Any', arg_node: 'ast.AST'):
+    def arg_recorder(self, arg_obj: 'Any', arg_node_id: int):
+        frame_state = self.frame_state
         if not self.tracing_enabled:
             return arg_obj
-        if self.prev_trace_stmt_in_cur_frame.finished or not self.should_record_args:
+        if frame_state.prev_trace_stmt_in_cur_frame.finished or not frame_state.should_record_args:
             return arg_obj
+        arg_node = self.safety.ast_node_by_id[arg_node_id]
         if not isinstance(arg_node, (ast.Attribute, ast.Subscript, ast.Call, ast.Name)):
             return arg_obj
-        if len(self.deep_ref_candidates) == 0:
+        if len(frame_state.deep_ref_candidates) == 0:
             logger.error('Error: no associated symbol for recorded args; skipping recording')
             return arg_obj
 
@@ -411,110 +573,122 @@ class TracingManager(object):
         # TODO: we should be able to get the actual data symbol during live tracing,
         #  instead of trying to resolve from an attrsub chain determined via analysis
         recorded_arg = GetAttrSubSymbols()(arg_node)
-        self.deep_ref_candidates[-1][-1].add((recorded_arg, arg_obj_id))
+        frame_state.deep_ref_candidates[-1][-1].add((recorded_arg, arg_obj_id))
 
         return arg_obj
 
     @on_exception_default_to(return_arg_at_index(1, logger))
     def before_argument_list(self, obj):
+        frame_state = self.frame_state
+        self._receive_loaded_value(obj)
         if not self.tracing_enabled:
             return obj
         # if self.prev_trace_stmt.finished:
         #     return obj
-        self.nested_call_stack.append(self.active_scope)
-        self.active_scope = self.cur_frame_original_scope
+        frame_state.nested_call_stack.append(frame_state.active_scope)
+        frame_state.active_scope = frame_state.cur_frame_original_scope
         return obj
 
     @on_exception_default_to(return_arg_at_index(1, logger))
     def after_argument_list(self, obj: 'Any', should_pop_should_record_args_stack: bool, inside_chain: bool):
+        frame_state = self.frame_state
         if not self.tracing_enabled:
             return obj
         # if self.prev_trace_stmt.finished:
         #     return obj
-        self.active_scope = self.nested_call_stack.pop()
+        frame_state.active_scope = frame_state.nested_call_stack.pop()
         if should_pop_should_record_args_stack:
-            self.should_record_args = self.should_record_args_stack.pop()
+            frame_state.should_record_args = frame_state.should_record_args_stack.pop()
         if inside_chain:
             # TODO: I don't think any test exercises this atm
-            self.active_scope = self._get_namespace_for_obj(obj)
+            frame_state.active_scope = self._get_namespace_for_obj(obj, defer=True)
         return obj
 
     @on_exception_default_to(return_arg_at_index(1, logger))
     def literal_tracer(self, literal):
+        frame_state = self.frame_state
         literal = _make_weakrefable_literal(literal)
         if not self.tracing_enabled:
             return literal
-        if self.prev_trace_stmt_in_cur_frame.finished:
+        if frame_state.prev_trace_stmt_in_cur_frame.finished:
             return literal
         if isinstance(literal, (dict, list, tuple)):
             scope = NamespaceScope(
-                literal, self.safety, None, self.prev_trace_stmt_in_cur_frame.scope
+                literal, self.safety, None, frame_state.prev_trace_stmt_in_cur_frame.scope
             )
             gen = literal.items() if isinstance(literal, dict) else enumerate(literal)
             for i, obj in gen:
+                if scope.add_subscript_to_run(i, obj, frame_state.prev_trace_stmt_in_cur_frame.stmt_node):
+                    continue
                 scope.upsert_data_symbol_for_name(
-                    i, obj, set(), self.prev_trace_stmt_in_cur_frame.stmt_node, True
+                    i, obj, set(), frame_state.prev_trace_stmt_in_cur_frame.stmt_node, True
                 )
-            self.literal_namespace = scope
+            frame_state.literal_namespace = scope
         return literal
 
-    def after_stmt_tracer(self, stmt_id: int, frame: 'FrameType', ret_expr: 'Optional[Any]' = None):
+    def after_stmt_tracer(self, stmt_id: int, ret_expr: 'Optional[Any]' = None, frame: 'Optional[FrameType]' = None):
         if stmt_id in self.seen_stmts:
             return ret_expr
+        if frame is None:
+            frame = sys._getframe().f_back
         stmt = self.safety.ast_node_by_id.get(stmt_id, None)
         if stmt is not None:
             self._sys_tracer(frame, TraceEvent.after_stmt, stmt)
         return ret_expr
 
-    def before_stmt_tracer(self, stmt_id: int, frame: 'FrameType'):
+    def before_stmt_tracer(self, stmt_id: int, frame: 'Optional[FrameType]' = None):
+        # left over if the previous statement in this frame raised partway through a chain
+        self.frame_state.load_awaiting_value = None
         if stmt_id in self.seen_stmts:
             return
+        if frame is None:
+            frame = sys._getframe().f_back
         # logger.warning('reenable tracing: %s', site_id)
-        if self.prev_trace_stmt_in_cur_frame is not None:
-            prev_trace_stmt_in_cur_frame = self.prev_trace_stmt_in_cur_frame
+        if self.frame_state.prev_trace_stmt_in_cur_frame is not None:
+            prev_trace_stmt_in_cur_frame = self.frame_state.prev_trace_stmt_in_cur_frame
             # both of the following stmts should be processed when body is entered
-            if isinstance(prev_trace_stmt_in_cur_frame.stmt_node, (ast.For, ast.If, ast.With)):
-                self.after_stmt_tracer(prev_trace_stmt_in_cur_frame.stmt_id, frame)
+            if prev_trace_stmt_in_cur_frame.facts.has_body_entered_before_finishing:
+                self.after_stmt_tracer(prev_trace_stmt_in_cur_frame.stmt_id, frame=frame)
         trace_stmt = self.traced_statements.get(stmt_id, None)
         if trace_stmt is None:
             trace_stmt = TraceStatement(
                 self.safety,
                 frame,
                 cast(ast.stmt, self.safety.ast_node_by_id[stmt_id]),
-                self.cur_frame_original_scope
+                self.frame_state.cur_frame_original_scope
             )
             self.traced_statements[stmt_id] = trace_stmt
-        self.prev_trace_stmt_in_cur_frame = trace_stmt
+        self.frame_state.prev_trace_stmt_in_cur_frame = trace_stmt
         self.prev_trace_stmt = trace_stmt
         if not self.tracing_enabled:
             assert not self.tracing_reset_pending
             self._enable_tracing()
             self.tracing_reset_pending = True
-            _finish_tracing_reset()  # trigger the tracer with a frame
+            if self._sys_monitoring_tracer is None:
+                _finish_tracing_reset()  # trigger the tracer with a frame
+            else:
+                # sys.monitoring never reports calls to non-cell code like _finish_tracing_reset
+                self._sys_tracer(sys._getframe(), TraceEvent.call, None)
 
     def after_stmt_reset_hook(self):
-        self.loaded_data_symbols.clear()
-        self.saved_store_data.clear()
-        self.deep_refs.clear()
-        self.mutations.clear()
-        self.deep_ref_candidates.clear()
-        self.nested_call_stack.clear()
-        self.should_record_args_stack.clear()
-        self.active_scope = self.cur_frame_original_scope
-        self.should_record_args = False
-        self.literal_namespace = None
-        self.first_obj_id_in_chain = None
+        self.frame_state.reset_stmt_state()
 
     def _enable_tracing(self):
         assert not self.tracing_enabled
         self.tracing_enabled = True
-        sys.settrace(self._sys_tracer)
+        if self._sys_monitoring_tracer is None:
+            sys.settrace(self._sys_tracer)
+        else:
+            self._sys_monitoring_tracer.enable()
 
     def _disable_tracing(self, check_enabled=True):
         if check_enabled:
             assert self.tracing_enabled
         self.tracing_enabled = False
-        sys.settrace(None)
+        if self._sys_monitoring_tracer is None:
+            sys.settrace(None)
+        else:
+            self._sys_monitoring_tracer.disable()
 
     @contextmanager
     def tracing_context(self):
@@ -523,6 +697,8 @@ class TracingManager(object):
             yield
         finally:
             self._disable_tracing(check_enabled=False)
+            if self._sys_monitoring_tracer is not None:
+                self._sys_monitoring_tracer.release()
 
     def _attempt_to_reenable_tracing(self, frame: 'FrameType') -> None:
         if self.safety.is_develop:
@@ -530,8 +706,9 @@ class TracingManager(object):
             assert self.call_depth > 0, 'expected managed call depth > 0, got %d' % self.call_depth
         self.tracing_reset_pending = False
         call_depth = 0
+        cell_code_table = self.safety.cell_code_table
         while frame is not None:
-            if frame.f_code.co_filename.startswith('<ipython-input'):
+            if cell_code_table.is_cell_code(frame.f_code):
                 call_depth += 1
             frame = frame.f_back
         if self.safety.is_develop:
@@ -545,8 +722,11 @@ class TracingManager(object):
         # top level, we need to clear the stack, since we won't
         # catch the return event
         self.call_depth = 0
-        self._stack = []
-        self.nested_call_stack = []
+        self._frame_state_pool.extend(self._stack)
+        self._stack.clear()
+        self.frame_state.nested_call_stack.clear()
+        if self._sys_monitoring_tracer is not None:
+            self._sys_monitoring_tracer.clear_traced_frames()
         if self.safety.config.trace_messages_enabled:
             logger.warning('reenable tracing >>>')
 
@@ -562,10 +742,8 @@ class TracingManager(object):
             self._attempt_to_reenable_tracing(frame)
             return None
 
-        # notebook cells have filenames that appear as '<ipython-input...>'
-        if frame.f_code.co_filename.startswith('<ipython-input'):
-            self.safety.maybe_set_name_to_cell_num_mapping(frame)
-        else:
+        cell_code = self.safety.cell_code_table.lookup(frame.f_code)
+        if cell_code.cell_num is None:
             return None
 
         if event == TraceEvent.line:
@@ -587,21 +765,21 @@ class TracingManager(object):
             if self.call_depth == 0:
                 return self._sys_tracer
 
-        cell_num, lineno = self.safety.get_position(frame)
+        lineno = frame.f_lineno
 
         if event == TraceEvent.after_stmt:
             stmt_node = extra
         else:
             try:
-                stmt_node = self.safety.statement_cache[cell_num][lineno]
+                stmt_node = cell_code.stmt_by_lineno[lineno]
             except KeyError:
                 if self.safety.is_develop:
-                    logger.warning("got key error for stmt node in cell %d, line %d", cell_num, lineno)
+                    logger.warning("got key error for stmt node in cell %d, line %d", cell_code.cell_num, lineno)
                 return self._sys_tracer
 
         trace_stmt = self.traced_statements.get(id(stmt_node), None)
         if trace_stmt is None:
-            trace_stmt = TraceStatement(self.safety, frame, stmt_node, self.cur_frame_original_scope)
+            trace_stmt = TraceStatement(self.safety, frame, stmt_node, self.frame_state.cur_frame_original_scope)
             self.traced_statements[id(stmt_node)] = trace_stmt
 
         if self.safety.config.trace_messages_enabled:
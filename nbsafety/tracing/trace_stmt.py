@@ -4,18 +4,18 @@ from contextlib import contextmanager
 import logging
 from typing import TYPE_CHECKING
 
-from nbsafety.analysis import (
-    AttrSubSymbolChain, get_symbol_edges, stmt_contains_lval
-)
+from nbsafety.analysis import AttrSubSymbolChain
+from nbsafety.data_model.lookup_cache import SymbolLookupCache
 from nbsafety.data_model.scope import NamespaceScope
 from nbsafety.tracing.mutation_event import MutationEvent
 
 if TYPE_CHECKING:
     from types import FrameType
-    from typing import List, Optional, Set
+    from typing import List, Optional, Set, Tuple
     from nbsafety.data_model.data_symbol import DataSymbol
     from nbsafety.data_model.scope import Scope
     from nbsafety.safety import NotebookSafety
+    from nbsafety.types import SupportedIndexType
 
 logger = logging.getLogger(__name__)
 
@@ -25,11 +25,19 @@ class TraceStatement(object):
         self.safety = safety
         self.frame = frame
         self.stmt_node = stmt_node
+        self.facts = safety.get_statement_facts(stmt_node)
         self.scope = scope
         self.class_scope: Optional[NamespaceScope] = None
         self.call_point_deps: List[Set[DataSymbol]] = []
         self.lambda_call_point_deps_done_once = False
         self.call_seen = False
+        # only statements in function bodies get traced again in later cells, so only those keep a cache
+        # across executions; it lives in the function's call scope so that it goes away along with the function
+        self.lookup_cache: Optional[SymbolLookupCache] = None
+        if not scope.is_global and not scope.is_namespace_scope:
+            self.lookup_cache = scope.symbol_lookup_caches.get(id(stmt_node), None)
+            if self.lookup_cache is None:
+                self.lookup_cache = scope.symbol_lookup_caches[id(stmt_node)] = SymbolLookupCache(safety)
 
     @contextmanager
     def replace_active_scope(self, new_active_scope):
@@ -38,6 +46,18 @@ class TraceStatement(object):
         yield
         self.scope = old_scope
 
+    def lookup_data_symbol_by_name(self, name: 'SupportedIndexType') -> 'Optional[DataSymbol]':
+        if self.lookup_cache is None:
+            return self.scope.lookup_data_symbol_by_name(name)
+        return self.lookup_cache.lookup_data_symbol_by_name(self.scope, name)
+
+    def get_most_specific_data_symbol_for_attrsub_chain(
+            self, chain: AttrSubSymbolChain
+    ) -> 'Tuple[Optional[DataSymbol], Optional[DataSymbol], bool]':
+        if self.lookup_cache is None:
+            return self.scope.get_most_specific_data_symbol_for_attrsub_chain(chain)
+        return self.lookup_cache.get_most_specific_data_symbol_for_attrsub_chain(self.scope, chain)
+
     @property
     def finished(self):
         return self.stmt_id in self.safety.tracing_manager.seen_stmts
@@ -46,35 +66,29 @@ class TraceStatement(object):
     def stmt_id(self):
         return id(self.stmt_node)
 
-    def _contains_lval(self):
-        return stmt_contains_lval(self.stmt_node)
-
     def compute_rval_dependencies(self, rval_symbol_refs=None):
         if rval_symbol_refs is None:
-            symbol_edges, _ = get_symbol_edges(self.stmt_node)
-            if len(symbol_edges) == 0:
-                rval_symbol_refs = set()
-            else:
-                rval_symbol_refs = set.union(*symbol_edges.values()) - {None}
+            rval_symbol_refs = self.facts.rval_symbol_refs
         rval_data_symbols = set()
         for name in rval_symbol_refs:
             if name is None:
                 continue
-            maybe_rval_dsym = self.scope.lookup_data_symbol_by_name(name)
+            maybe_rval_dsym = self.lookup_data_symbol_by_name(name)
             if maybe_rval_dsym is not None:
                 rval_data_symbols.add(maybe_rval_dsym)
             # else:
             #     assert not isinstance(name, AttrSubSymbolChain)
-        return rval_data_symbols.union(*self.call_point_deps) | self.safety.tracing_manager.loaded_data_symbols
+        loaded_data_symbols = self.safety.tracing_manager.frame_state.loaded_data_symbols
+        return rval_data_symbols.union(*self.call_point_deps) | loaded_data_symbols
 
     def get_post_call_scope(self):
-        old_scope = self.safety.tracing_manager.cur_frame_original_scope
-        if isinstance(self.stmt_node, ast.ClassDef):
+        old_scope = self.safety.tracing_manager.frame_state.cur_frame_original_scope
+        if self.facts.is_class_def:
             # classes need a new scope before the ClassDef has finished executing,
             # so we make it immediately
             return self.scope.make_child_scope(self.stmt_node.name, obj_id=-1)
 
-        if not isinstance(self.stmt_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        if not self.facts.is_function_def:
             # TODO: probably the right thing is to check is whether a lambda appears somewhere inside the ast node
             # if not isinstance(self.ast_node, ast.Lambda):
             #     raise TypeError('unexpected type for ast node %s' % self.ast_node)
@@ -94,19 +108,17 @@ class TraceStatement(object):
             func_cell.create_symbols_for_call_args()
         return func_cell.call_scope
 
-    def _handle_attrsub_stores(self, symbol_edges, deep_rval_deps):
-        if len(symbol_edges) == 0:
+    def _handle_attrsub_stores(self, deep_rval_deps):
+        if len(self.facts.symbol_edges) == 0:
             rval_deps = deep_rval_deps
         else:
-            rval_deps = self.compute_rval_dependencies(
-                rval_symbol_refs=set.union(*symbol_edges.values()) - {None}
-            ) | deep_rval_deps
-        for scope, obj, attr_or_sub, is_subscript in self.safety.tracing_manager.saved_store_data:
+            rval_deps = self.compute_rval_dependencies() | deep_rval_deps
+        for scope, obj, attr_or_sub, is_subscript in self.safety.tracing_manager.frame_state.saved_store_data:
             try:
                 attr_or_sub_obj = self.safety.retrieve_namespace_attr_or_sub(obj, attr_or_sub, is_subscript)
             except:
                 continue
-            should_overwrite = not isinstance(self.stmt_node, ast.AugAssign)
+            should_overwrite = not self.facts.is_aug_assign
             scope_to_use = scope.get_earliest_ancestor_containing(id(attr_or_sub_obj), is_subscript)
             if scope_to_use is None:
                 # Nobody before `scope` has it, so we'll insert it at this level
@@ -116,7 +128,7 @@ class TraceStatement(object):
                 overwrite=should_overwrite, is_function_def=False, class_scope=None
             )
             # print(scope_to_use, 'upsert', attr_or_sub, attr_or_sub_obj, rval_deps)
-            if len(self.safety.tracing_manager.saved_store_data) == 1:
+            if len(self.safety.tracing_manager.frame_state.saved_store_data) == 1:
                 break
         else:
             return None, None
@@ -126,10 +138,10 @@ class TraceStatement(object):
     def _handle_literal_namespace(self, lval_name, rval_names, stored_attrsub_scope, stored_attrsub_name):
         # remaining_rval_names = set(rval_names)
         remaining_rval_names = rval_names
-        if self.safety.tracing_manager.literal_namespace is None:
+        if self.safety.tracing_manager.frame_state.literal_namespace is None:
             return remaining_rval_names
-        literal_namespace = self.safety.tracing_manager.literal_namespace
-        self.safety.tracing_manager.literal_namespace = None
+        literal_namespace = self.safety.tracing_manager.frame_state.literal_namespace
+        self.safety.tracing_manager.frame_state.literal_namespace = None
         if lval_name is None:
             if stored_attrsub_name is None:
                 literal_namespace.scope_name = '<unknown namespace>'
@@ -162,16 +174,15 @@ class TraceStatement(object):
         # return remaining_rval_names
 
     def _make_lval_data_symbols(self):
-        symbol_edges, should_overwrite = get_symbol_edges(self.stmt_node)
+        facts = self.facts
+        symbol_edges, should_overwrite = facts.symbol_edges, facts.should_overwrite
         deep_rval_deps = self._gather_deep_ref_rval_dsyms()
-        is_function_def = isinstance(self.stmt_node, (ast.FunctionDef, ast.AsyncFunctionDef))
-        is_class_def = isinstance(self.stmt_node, ast.ClassDef)
-        is_import = isinstance(self.stmt_node, (ast.Import, ast.ImportFrom))
+        is_function_def, is_class_def, is_import = facts.is_function_def, facts.is_class_def, facts.is_import
         if is_function_def or is_class_def:
             assert len(symbol_edges) == 1
             # assert not lval_symbol_refs.issubset(rval_symbol_refs)
 
-        stored_attrsub_scope, stored_attrsub_name = self._handle_attrsub_stores(symbol_edges, deep_rval_deps)
+        stored_attrsub_scope, stored_attrsub_name = self._handle_attrsub_stores(deep_rval_deps)
         for lval_name, rval_names in symbol_edges.items():
             rval_names = self._handle_literal_namespace(
                 lval_name, rval_names, stored_attrsub_scope, stored_attrsub_name
@@ -195,7 +206,7 @@ class TraceStatement(object):
                 self.scope.upsert_data_symbol_for_name(
                     lval_name, obj, rval_deps, self.stmt_node, False,
                     overwrite=should_overwrite_for_name, is_function_def=is_function_def, is_import=is_import,
-                    class_scope=self.class_scope, propagate=not isinstance(self.stmt_node, ast.For)
+                    class_scope=self.class_scope, propagate=not facts.is_for
                 )
             except KeyError:
                 logger.warning('keyerror for %s', lval_name)
@@ -203,19 +214,19 @@ class TraceStatement(object):
 
     def _gather_deep_ref_rval_dsyms(self):
         deep_ref_rval_dsyms = set()
-        for deep_ref_obj_id, deep_ref_name, deep_ref_args in self.safety.tracing_manager.deep_refs:
+        for deep_ref_obj_id, deep_ref_name, deep_ref_args in self.safety.tracing_manager.frame_state.deep_refs:
             deep_ref_arg_dsyms = set()
             for arg in deep_ref_args:
                 if isinstance(arg, str):
-                    deep_ref_arg_dsyms.add(self.scope.lookup_data_symbol_by_name(arg))
+                    deep_ref_arg_dsyms.add(self.lookup_data_symbol_by_name(arg))
                 elif isinstance(arg, AttrSubSymbolChain):
-                    deep_ref_arg_dsyms.add(self.scope.get_most_specific_data_symbol_for_attrsub_chain(arg)[0])
+                    deep_ref_arg_dsyms.add(self.get_most_specific_data_symbol_for_attrsub_chain(arg)[0])
             deep_ref_arg_dsyms.discard(None)
             deep_ref_rval_dsyms |= deep_ref_arg_dsyms
             if deep_ref_name is None:
                 deep_ref_rval_dsyms |= self.safety.aliases.get(deep_ref_obj_id, set())
             else:
-                deep_ref_dc = self.scope.lookup_data_symbol_by_name(deep_ref_name)
+                deep_ref_dc = self.lookup_data_symbol_by_name(deep_ref_name)
                 if deep_ref_dc is not None and deep_ref_dc.obj_id == deep_ref_obj_id:
                     deep_ref_rval_dsyms.add(deep_ref_dc)
                 else:
@@ -225,7 +236,9 @@ class TraceStatement(object):
     def handle_dependencies(self):
         if not self.safety.dependency_tracking_enabled:
             return
-        for mutated_obj_id, mutation_args, mutation_event in self.safety.tracing_manager.mutations:
+        if len(self.safety.tracing_manager.frame_state.mutations) > 0 or self.facts.contains_lval:
+            self.safety.tracing_manager.materialize()
+        for mutated_obj_id, mutation_args, mutation_event in self.safety.tracing_manager.frame_state.mutations:
             if mutation_event == MutationEvent.arg_mutate:
                 for _, arg_id in mutation_args:
                     for mutated_sym in self.safety.aliases[arg_id]:
@@ -236,7 +249,7 @@ class TraceStatement(object):
 
             mutation_arg_dsyms = set()
             for arg, _ in mutation_args:
-                mutation_arg_dsyms.add(self.scope.get_most_specific_data_symbol_for_attrsub_chain(arg)[0])
+                mutation_arg_dsyms.add(self.get_most_specific_data_symbol_for_attrsub_chain(arg)[0])
             mutation_arg_dsyms.discard(None)
 
             # NOTE: this next block is necessary to ensure that we add the argument as a namespace child
@@ -257,24 +270,29 @@ class TraceStatement(object):
                                 mutated_obj, self.safety, mutated_sym.name,
                                 parent_scope=mutated_sym.containing_scope
                             )
-                        namespace_scope.upsert_data_symbol_for_name(
-                            len(mutated_obj) - 1, mutation_arg_obj, set(), self.stmt_node,
-                            is_subscript=True, overwrite=False, propagate=False
-                        )
+                        if not namespace_scope.add_subscript_to_run(
+                            len(mutated_obj) - 1, mutation_arg_obj, self.stmt_node
+                        ):
+                            namespace_scope.upsert_data_symbol_for_name(
+                                len(mutated_obj) - 1, mutation_arg_obj, set(), self.stmt_node,
+                                is_subscript=True, overwrite=False, propagate=False
+                            )
             # TODO: add mechanism for skipping namespace children in case of list append
             for mutated_sym in self.safety.aliases[mutated_obj_id]:
                 mutated_sym.update_deps(mutation_arg_dsyms, overwrite=False, mutated=True)
-        if self._contains_lval():
+        if self.facts.contains_lval:
             self._make_lval_data_symbols()
         else:
-            if len(self.safety.tracing_manager.saved_store_data) > 0 and self.safety.is_develop:
+            if len(self.safety.tracing_manager.frame_state.saved_store_data) > 0 and self.safety.is_develop:
                 logger.warning('saw unexpected state in saved_store_data: %s',
-                               self.safety.tracing_manager.saved_store_data)
+                               self.safety.tracing_manager.frame_state.saved_store_data)
 
     def finished_execution_hook(self):
         if self.finished:
             return
         # print('finishing stmt', self.stmt_node)
+        # needs to happen while the statement still counts as unfinished
+        self.safety.tracing_manager.flush_event_buffer()
         self.safety.tracing_manager.seen_stmts.add(self.stmt_id)
         self.handle_dependencies()
         self.safety.tracing_manager.after_stmt_reset_hook()
@@ -5,3 +5,4 @@ if TYPE_CHECKING:
     from nbsafety.analysis.attr_symbols import AttrSubSymbolChain
     SymbolRef = Union[str, AttrSubSymbolChain]
     SupportedIndexType = Union[str, int, Tuple[Union[str, int], ...]]
+    CellId = Union[str, int]
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from .ast_helper import FastAst as fast
+from .content_cache import ContentAddressedCache
 from .dot_dict import DotDict
 from .misc_utils import KeyDict
 from .mixins import CommonEqualityMixin
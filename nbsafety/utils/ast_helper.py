@@ -43,5 +43,7 @@ for ctor_name in ast.__dict__:
     setattr(FastAst, ctor_name, staticmethod(_make_func(ctor_name)))
 
 if sys.version_info >= (3, 8):
+    # these are deprecated aliases of Constant, and as of 3.12 no longer show up in `ast.__dict__`
     FastAst.Str = staticmethod(_make_func('Constant'))
     FastAst.Num = staticmethod(_make_func('Constant'))
+    FastAst.NameConstant = staticmethod(_make_func('Constant'))
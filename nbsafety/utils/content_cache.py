@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+import hashlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Optional
+
+
+class ContentAddressedCache(object):
+    """
+    Bounded LRU cache for things computed purely from a cell's source,
+    keyed by a hash of that source.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._cache: 'OrderedDict[str, Any]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def key_for(cell_source: str) -> str:
+        return hashlib.sha1(cell_source.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> 'Optional[Any]':
+        ret = self._cache.get(key, None)
+        if ret is not None:
+            self._cache.move_to_end(key)
+        return ret
+
+    def put(self, key: str, value: 'Any') -> None:
+        if self.max_size <= 0:
+            return
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
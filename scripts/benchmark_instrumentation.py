@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# need PYTHONPATH="." for this to work
+import argparse
+import ast
+import glob
+import json
+import sys
+import timeit
+
+from IPython.core.inputtransformer2 import TransformerManager
+
+from nbsafety.tracing.ast_eavesdrop import AstEavesdropper
+from nbsafety.tracing.ast_instrumenter import AstInstrumenter
+from nbsafety.tracing.stmt_inserter import StatementInserter
+from nbsafety.tracing.stmt_mapper import StatementMapper
+
+
+def load_cells(notebooks):
+    transformer = TransformerManager()
+    cells = []
+    for notebook in notebooks:
+        with open(notebook, 'r') as f:
+            nb = json.load(f)
+        for cell in nb['cells']:
+            if cell['cell_type'] != 'code':
+                continue
+            source = transformer.transform_cell(''.join(cell['source']))
+            try:
+                ast.parse(source)
+            except SyntaxError:
+                continue
+            cells.append(source)
+    return cells
+
+
+def instrument_three_pass(cell):
+    node = ast.parse(cell)
+    orig_to_copy_mapping = StatementMapper({}, {})(node)
+    node = AstEavesdropper(orig_to_copy_mapping).visit(node)
+    return StatementInserter(orig_to_copy_mapping).visit(node)
+
+
+def instrument_fused(cell):
+    return AstInstrumenter({}, {})(ast.parse(cell))
+
+
+def main(args):
+    notebooks = args.notebooks or glob.glob('./notebooks/*.ipynb')
+    cells = load_cells(notebooks)
+    if len(cells) == 0:
+        print('no parseable code cells found in', notebooks)
+        return 1
+    # parsing is common to both paths; time it separately so that it can be subtracted out
+    results = {'parse only': lambda: [ast.parse(cell) for cell in cells]}
+    results['three-pass'] = lambda: [instrument_three_pass(cell) for cell in cells]
+    results['fused'] = lambda: [instrument_fused(cell) for cell in cells]
+    print('%d cells from %d notebook(s), best of %d x %d:' % (len(cells), len(notebooks), args.repeat, args.number))
+    for name, func in results.items():
+        best = min(timeit.repeat(func, number=args.number, repeat=args.repeat)) / args.number
+        print('%12s: %.3f ms per corpus' % (name, 1000 * best))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare the fused and three-pass ast instrumentation on the code cells of some notebooks.'
+    )
+    parser.add_argument('notebooks', nargs='*', help='Notebooks to take cells from (default: ./notebooks/*.ipynb)')
+    parser.add_argument('--number', type=int, default=20, help='Passes over the corpus per timing.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timings to take the best of.')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# need PYTHONPATH="." for this to work, and needs to be run with ipython, e.g.:
+#   env PYTHONPATH="." ipython3 --quick ./scripts/benchmark_update_protocol.py -- --size 2000
+import argparse
+import os
+import sys
+import timeit
+
+from IPython import get_ipython
+
+from nbsafety.data_model.update_protocol import UpdateProtocol
+from nbsafety.run_mode import SafetyRunMode
+from nbsafety.safety import NotebookSafety
+
+_CELL_MAGIC_NAME = '_SAFETY_BENCHMARK_CELL_MAGIC'
+
+
+def make_safety(args):
+    os.environ[SafetyRunMode.DEVELOP.value] = '1'
+    return NotebookSafety(
+        cell_magic_name=_CELL_MAGIC_NAME, store_history=False, lazy_staleness=args.lazy_staleness
+    )
+
+
+def run_cell(cell):
+    get_ipython().run_cell_magic(_CELL_MAGIC_NAME, None, cell)
+
+
+def build_chain(safety, size):
+    run_cell('x0 = 0\n' + '\n'.join(f'x{i} = x{i - 1} + 1' for i in range(1, size)))
+    return safety.global_scope.lookup_data_symbol_by_name('x0')
+
+
+def build_star(safety, size):
+    run_cell('x = 0\n' + '\n'.join(f'y{i} = x + 1' for i in range(size)))
+    return safety.global_scope.lookup_data_symbol_by_name('x')
+
+
+def build_deep_namespace(safety, size):
+    run_cell(
+        'class Node:\n    pass\n'
+        + '\n'.join(f'n{i} = Node()' for i in range(size + 1)) + '\n'
+        + '\n'.join(f'n{i}.child = n{i + 1}' for i in range(size)) + '\n'
+        + f'n{size}.value = 0'
+    )
+    leaf = get_ipython().user_ns[f'n{size}']
+    return safety.namespaces[id(leaf)].lookup_data_symbol_by_name_this_indentation('value')
+
+
+def time_update(safety, updated_sym, args):
+    def update():
+        safety.updated_symbols.clear()
+        UpdateProtocol(safety, updated_sym, set(), mutated=True)(propagate=True)
+    return min(timeit.repeat(update, number=args.number, repeat=args.repeat)) / args.number
+
+
+def main(args):
+    graphs = {
+        'chain': build_chain,
+        'star': build_star,
+        'deep namespace': build_deep_namespace,
+    }
+    print('%d symbols per graph, best of %d x %d:' % (args.size, args.repeat, args.number))
+    for name, build in graphs.items():
+        safety = make_safety(args)
+        updated_sym = build(safety, args.size)
+        print('%16s: %.3f ms per update' % (name, 1000 * time_update(safety, updated_sym, args)))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time staleness propagation through the update protocol on synthetic dependency graphs.'
+    )
+    parser.add_argument('--size', type=int, default=1000, help='Number of symbols in each graph.')
+    parser.add_argument('--number', type=int, default=10, help='Updates per timing.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timings to take the best of.')
+    parser.add_argument(
+        '--lazy-staleness', action='store_true', help='Compute staleness on demand instead of propagating it.'
+    )
+    sys.exit(main(parser.parse_args()))
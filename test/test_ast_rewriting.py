@@ -1,9 +1,21 @@
 # -*- coding: utf-8 -*-
 import ast
+import sys
+from typing import TYPE_CHECKING
 
+from nbsafety.analysis import compute_statement_facts, get_symbol_edges, stmt_contains_lval
 from nbsafety.tracing.ast_eavesdrop import AstEavesdropper
+from nbsafety.tracing.ast_instrumenter import AstInstrumenter
+from nbsafety.tracing.stmt_inserter import StatementInserter
+from nbsafety.tracing.stmt_mapper import StatementMapper
 from nbsafety.utils import KeyDict
 
+if TYPE_CHECKING:
+    from typing import Dict
+
+
+_NUM_FIELD = 'value' if sys.version_info >= (3, 8) else 'n'
+
 
 PROGRAM = """
 for i in [foo(x) for x in [1, 2, 3]]:
@@ -24,4 +36,55 @@ def test_ast_rewrite():
     No asserts; just make sure we don't throw an error.
     """
     rewriter = AstEavesdropper(KeyDict())
-    assert rewriter.visit(ast.parse(PROGRAM)) is not None
\ No newline at end of file
+    assert rewriter.visit(ast.parse(PROGRAM)) is not None
+
+
+def _dump_with_node_ids_replaced(node: ast.AST, id_map: 'Dict[int, ast.AST]', root_copy: ast.AST) -> str:
+    # the instrumented code refers to copied nodes by id; replace these ids with positions in the copied ast
+    position_by_id = {id(copy): pos for pos, copy in enumerate(ast.walk(root_copy))}
+    for inner in ast.walk(node):
+        node_id = getattr(inner, _NUM_FIELD, None)
+        if isinstance(node_id, int) and node_id in id_map:
+            setattr(inner, _NUM_FIELD, position_by_id[node_id])
+    return ast.dump(node)
+
+
+def test_fused_instrumentation_matches_three_pass():
+    line_to_stmt_map: 'Dict[int, ast.stmt]' = {}
+    id_map: 'Dict[int, ast.AST]' = {}
+    module = ast.parse(PROGRAM)
+    orig_to_copy_mapping = StatementMapper(line_to_stmt_map, id_map)(module)
+    root_copy = orig_to_copy_mapping[id(module)]
+    instrumented = AstEavesdropper(orig_to_copy_mapping).visit(module)
+    instrumented = StatementInserter(orig_to_copy_mapping).visit(instrumented)
+
+    fused_line_to_stmt_map: 'Dict[int, ast.stmt]' = {}
+    fused_id_map: 'Dict[int, ast.AST]' = {}
+    fused_module = ast.parse(PROGRAM)
+    instrumenter = AstInstrumenter(fused_line_to_stmt_map, fused_id_map)
+    fused_instrumented = instrumenter(fused_module)
+    fused_root_copy = instrumenter.orig_to_copy_mapping[id(fused_module)]
+
+    assert ast.dump(root_copy, include_attributes=True) == ast.dump(fused_root_copy, include_attributes=True)
+    assert len(id_map) == len(fused_id_map)
+    assert line_to_stmt_map.keys() == fused_line_to_stmt_map.keys()
+    for lineno, stmt in line_to_stmt_map.items():
+        assert ast.dump(stmt) == ast.dump(fused_line_to_stmt_map[lineno])
+    assert _dump_with_node_ids_replaced(instrumented, id_map, root_copy) == _dump_with_node_ids_replaced(
+        fused_instrumented, fused_id_map, fused_root_copy
+    )
+
+
+def test_statement_facts_cover_statement_copies():
+    id_map: 'Dict[int, ast.AST]' = {}
+    AstInstrumenter({}, id_map)(ast.parse(PROGRAM))
+    facts_by_stmt_id = compute_statement_facts(id_map.values())
+    stmt_copies = [node for node in id_map.values() if isinstance(node, ast.stmt)]
+    assert len(facts_by_stmt_id) == len(stmt_copies)
+    for stmt in stmt_copies:
+        facts = facts_by_stmt_id[id(stmt)]
+        symbol_edges, should_overwrite = get_symbol_edges(stmt)
+        assert facts.symbol_edges == dict(symbol_edges)
+        assert facts.should_overwrite == should_overwrite
+        assert facts.contains_lval == stmt_contains_lval(stmt)
+        assert facts.is_for == isinstance(stmt, ast.For)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from nbsafety.analysis.cell_links import compute_stale_and_refresher_links
+
+
+def _fixpoint_stale_links(direct_links, stale_cells):
+    stale_links = {cell_id: set(links) for cell_id, links in direct_links.items()}
+    changed = True
+    while changed:
+        changed = False
+        for stale_cell_id in stale_cells:
+            new_links = set(stale_links[stale_cell_id])
+            for refresher_cell_id in stale_links[stale_cell_id]:
+                if refresher_cell_id in stale_cells:
+                    new_links |= stale_links[refresher_cell_id]
+            new_links.discard(stale_cell_id)
+            changed = changed or new_links != stale_links[stale_cell_id]
+            stale_links[stale_cell_id] = new_links
+    return {cell_id: links - stale_cells for cell_id, links in stale_links.items()}
+
+
+def test_chain_through_stale_cells():
+    direct_links = {3: {2}, 2: {1}, 1: {0}}
+    stale_links, refresher_links = compute_stale_and_refresher_links(direct_links, {1, 2, 3})
+    assert stale_links == {1: {0}, 2: {0}, 3: {0}}
+    assert sorted(refresher_links[0]) == [1, 2, 3]
+
+
+def test_cycle_among_stale_cells():
+    direct_links = {1: {2, 4}, 2: {3}, 3: {1, 5}, 6: {1}}
+    stale_cells = {1, 2, 3, 6}
+    stale_links, refresher_links = compute_stale_and_refresher_links(direct_links, stale_cells)
+    assert stale_links == _fixpoint_stale_links(direct_links, stale_cells)
+    assert stale_links[6] == {4, 5}
+    assert sorted(refresher_links[4]) == [1, 2, 3, 6]
+    stale_links[1].add(7)
+    assert 7 not in stale_links[2]
+
+
+def test_matches_fixpoint_on_long_chain():
+    num_cells = 2000
+    direct_links = {cell_id: {cell_id - 1} for cell_id in range(1, num_cells)}
+    direct_links[num_cells // 2].add(-1)
+    stale_cells = set(range(1, num_cells))
+    stale_links, _ = compute_stale_and_refresher_links(direct_links, stale_cells)
+    assert stale_links[1] == {0}
+    assert stale_links[num_cells - 1] == {0, -1}
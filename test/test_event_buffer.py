@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from IPython import get_ipython
+
+from nbsafety.tracing.trace_manager import MAX_BUFFERED_EVENTS
+from test.utils import assert_detected, make_safety_fixture
+
+logging.basicConfig(level=logging.ERROR)
+
+# Reset dependency graph before each test
+_safety_fixture, _safety_state, run_cell = make_safety_fixture(event_buffer=True)
+
+
+def test_attribute_dependency():
+    run_cell("""
+class Foo(object):
+    def __init__(self, x):
+        self.x = x
+""")
+    run_cell('foo = Foo(5)')
+    run_cell('y = foo.x + 1')
+    run_cell('foo.x = 8')
+    run_cell('logging.info(y)')
+    assert_detected(_safety_state, '`y` depends on old value of `foo.x`')
+
+
+def test_list_mutation_through_method_call():
+    run_cell('lst = [0, 1]')
+    run_cell('x = lst + [2]')
+    run_cell('lst.append(3)')
+    run_cell('logging.info(x)')
+    assert_detected(_safety_state, '`x` depends on old value of `lst`')
+
+
+def test_loads_before_call_count_as_return_dependencies():
+    run_cell("""
+class Foo(object):
+    def __init__(self, x):
+        self.x = x
+""")
+    run_cell('def f(v): return v + 1')
+    run_cell('foo = Foo(5)')
+    run_cell('y = f(foo.x)')
+    run_cell('foo.x = 9')
+    run_cell('logging.info(y)')
+    assert_detected(_safety_state, '`y` depends on old value of `foo.x`')
+
+
+def test_subscript_dependency_in_loop_body():
+    run_cell('lst = [0, 1, 2]')
+    run_cell("""
+for i in range(3):
+    y = lst[0] + lst[1]
+""")
+    run_cell('lst[1] = 5')
+    run_cell('logging.info(y)')
+    assert_detected(_safety_state, '`y` depends on old value of `lst[1]`')
+
+
+def test_buffer_bounded_within_comprehension():
+    buffer_sizes = []
+    get_ipython().user_ns['record_buffer_size'] = lambda: buffer_sizes.append(
+        len(_safety_state[0].tracing_manager.frame_state.event_buffer)
+    )
+    run_cell("""
+class Foo(object):
+    def __init__(self, x):
+        self.x = x
+""")
+    run_cell(f'foos = [Foo(i) for i in range({2 * MAX_BUFFERED_EVENTS})]')
+    run_cell('y = [foo.x + 1 for foo in foos if record_buffer_size() is None]')
+    assert 0 < max(buffer_sizes) < MAX_BUFFERED_EVENTS
+    run_cell(f'foos[{2 * MAX_BUFFERED_EVENTS - 1}].x = 42')
+    run_cell('logging.info(y)')
+    assert_detected(_safety_state, '`y` depends on old value of `foos[-1].x`')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from test.utils import assert_detected, make_safety_fixture
+
+logging.basicConfig(level=logging.ERROR)
+
+# Reset dependency graph before each test
+_safety_fixture, _safety_state, run_cell = make_safety_fixture(
+    variants=[{'lazy_staleness': False}, {'lazy_staleness': True}, {'graph_store': True}]
+)
+
+
+def _symbol_names():
+    return {dsym.readable_name for dsym in _safety_state[0].all_data_symbols()}
+
+
+def test_function_locals_collected():
+    run_cell("""
+def f(x):
+    y = x + 1
+    return y
+""")
+    run_cell('z = f(5)')
+    assert 'y' not in _symbol_names()
+    assert 'z' in _symbol_names()
+    assert len(_safety_state[0].garbage_symbol_candidates) == 0
+
+
+def test_no_garbage_left_after_cell():
+    run_cell('lst = [[0], [1], [2]]')
+    run_cell('x = lst[1][0] + 1')
+    run_cell('lst = []')
+    run_cell('d = {"a": {"b": 1}}')
+    run_cell('d["a"] = 5')
+    assert not any(dsym.is_garbage for dsym in _safety_state[0].all_data_symbols())
+
+
+def test_no_edges_to_collected_symbols():
+    run_cell('import pandas as pd')
+    run_cell('df = pd.DataFrame({"a": [0, 1], "b": [2., 3.]})')
+    run_cell('asdf = df.b')
+    # the old `df.b` goes away after this
+    run_cell('df.b *= 7')
+    dsyms = set(_safety_state[0].all_data_symbols())
+    assert all(parent in dsyms for dsym in dsyms for parent in dsym.parents)
+    lazy_staleness = _safety_state[0].lazy_staleness
+    if lazy_staleness is not None:
+        symbol_ids = {dsym.symbol_id for dsym in dsyms}
+        assert set(lazy_staleness._acknowledged_epochs) <= symbol_ids
+        assert set(lazy_staleness._acknowledging_children) <= symbol_ids
+        assert all(set(epochs) <= symbol_ids for epochs in lazy_staleness._acknowledged_epochs.values())
+
+
+def test_collected_symbol_still_reaches_children():
+    run_cell('import gc')
+    run_cell("""
+class A:
+    pass
+""")
+    run_cell('lst = [A()]')
+    run_cell('lst[0].v = 1')
+    run_cell('z = lst[0].v + 1')
+    run_cell('tmp = lst.pop(); del tmp; gc.collect()')
+    run_cell('lst.append(A())')
+    run_cell('lst[0].v = 2')
+    run_cell('logging.info(z)')
+    assert_detected(_safety_state, '`z` depends on the old value of `lst[0].v`')
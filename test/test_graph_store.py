@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+
+from nbsafety.data_model.graph_store import DependencyGraphStore, GraphStoreDataSymbol
+from test.utils import make_safety_fixture
+
+logging.basicConfig(level=logging.ERROR)
+
+# Reset dependency graph before each test
+_safety_fixture, _safety_state, run_cell = make_safety_fixture(graph_store=True)
+
+
+class _FakeSymbol(object):
+    def __init__(self, symbol_id):
+        self.symbol_id = symbol_id
+
+
+def _make_store(num_symbols):
+    store = DependencyGraphStore()
+    symbols = [_FakeSymbol(symbol_id) for symbol_id in range(num_symbols)]
+    for sym in symbols:
+        store.register(sym)
+    return store, symbols
+
+
+def _assert_matches(store, edges, num_symbols):
+    assert store.num_edges == len(edges)
+    for symbol_id in range(num_symbols):
+        assert sorted(store.child_ids(symbol_id)) == sorted(c for p, c in edges if p == symbol_id)
+        assert sorted(store.parent_ids(symbol_id)) == sorted(p for p, c in edges if c == symbol_id)
+
+
+def test_edges_before_and_after_compaction():
+    store, syms = _make_store(4)
+    store.add_edge(syms[0], syms[1])
+    store.add_edge(syms[0], syms[2])
+    store.add_edge(syms[2], syms[3])
+    store.add_edge(syms[2], syms[3])
+    _assert_matches(store, {(0, 1), (0, 2), (2, 3)}, 4)
+    store.compact()
+    _assert_matches(store, {(0, 1), (0, 2), (2, 3)}, 4)
+    store.remove_edge(syms[0], syms[1])
+    store.add_edge(syms[3], syms[0])
+    assert not store.has_edge(0, 1)
+    assert store.has_edge(3, 0)
+    _assert_matches(store, {(0, 2), (2, 3), (3, 0)}, 4)
+    store.add_edge(syms[0], syms[1])
+    store.remove_edge(syms[3], syms[0])
+    _assert_matches(store, {(0, 1), (0, 2), (2, 3)}, 4)
+
+
+def test_random_edits_match_edge_set():
+    rng = random.Random(0)
+    num_symbols = 30
+    store, syms = _make_store(num_symbols)
+    edges = set()
+    for step in range(3000):
+        parent, child = rng.randrange(num_symbols), rng.randrange(num_symbols)
+        if rng.random() < 0.6:
+            store.add_edge(syms[parent], syms[child])
+            edges.add((parent, child))
+        else:
+            store.remove_edge(syms[parent], syms[child])
+            edges.discard((parent, child))
+        if step % 500 == 0:
+            store.compact()
+            _assert_matches(store, edges, num_symbols)
+        if step % 97 == 0:
+            new_sym = _FakeSymbol(num_symbols)
+            store.register(new_sym)
+            syms.append(new_sym)
+            num_symbols += 1
+    _assert_matches(store, edges, num_symbols)
+
+
+def test_positions_and_released_symbols():
+    store, syms = _make_store(4)
+    store.add_edge(syms[0], syms[1], 2)
+    store.add_edge(syms[0], syms[1], 1)
+    assert store.edge_position(0, 1) == 2
+    store.add_edge(syms[0], syms[2], 0)
+    store.add_edge(syms[2], syms[3], 0)
+    store.add_edge(syms[3], syms[1], 0)
+    store.compact()
+    store.add_edge(syms[0], syms[2], 3)
+    assert sorted(store.child_edges(0)) == [(1, 2), (2, 3)]
+    store.release(syms[2])
+    # a released symbol loses the edges from its parents, and its children stop seeing it as a parent,
+    # but it keeps its edges to its children
+    assert store.num_edges == 3
+    assert store.edge_position(0, 2) is None
+    assert list(store.parent_ids(2)) == []
+    assert list(store.parent_ids(3)) == []
+    assert list(store.child_edges(2)) == [(3, 0)]
+    store.compact()
+    assert store.num_edges == 3
+    assert sorted(store.child_edges(0)) == [(1, 2)]
+    assert list(store.parent_ids(3)) == []
+    assert list(store.child_edges(2)) == [(3, 0)]
+    # once it gets new edges, its children see it again
+    store.add_edge(syms[0], syms[2], 4)
+    _assert_matches(store, {(0, 1), (0, 2), (2, 3), (3, 1)}, 4)
+    assert store.symbols[2] is syms[2]
+
+
+def test_stale_symbols_scan():
+    store, syms = _make_store(3)
+    store.defined_cell_nums[1] = 2
+    store.required_cell_nums[1] = 5
+    store.defined_cell_nums[2] = 5
+    store.required_cell_nums[2] = 5
+    assert store.stale_symbols() == [syms[1]]
+    store.release(syms[1])
+    assert store.stale_symbols() == []
+
+
+def test_store_is_only_copy_of_symbol_graph():
+    run_cell('a = 1')
+    run_cell('b = a + 1')
+    run_cell('c = a + b')
+    run_cell('a = 3')
+    safety = _safety_state[0]
+    store = safety.graph_store
+    lookup = safety.global_scope.lookup_data_symbol_by_name
+    a, b, c = lookup('a'), lookup('b'), lookup('c')
+    for dsym in safety.all_data_symbols():
+        assert isinstance(dsym, GraphStoreDataSymbol)
+        assert dsym._parents is None and dsym._children_by_cell_position is None
+        assert store.defined_cell_nums[dsym.symbol_id] == dsym.defined_cell_num
+        assert store.required_cell_nums[dsym.symbol_id] == dsym.required_cell_num
+    assert a.parents == set()
+    assert b.parents == {a}
+    assert c.parents == {a, b}
+    assert {child for _, children in a.iter_children_by_cell_position() for child in children} == {b, c}
+    assert set(store.stale_symbols()) == {b, c}
+    run_cell('b = 5')
+    assert b.parents == set()
+    assert c.parents == {a, b}
+    assert not store.has_edge(a.symbol_id, b.symbol_id)
+
+
+def test_collected_symbols_released():
+    run_cell("""
+def f(x):
+    y = x + 1
+    return y
+""")
+    run_cell('z = f(5)')
+    store = _safety_state[0].graph_store
+    live_ids = {dsym.symbol_id for dsym in _safety_state[0].all_data_symbols()}
+    assert {symbol_id for symbol_id, dsym in enumerate(store.symbols) if dsym is not None} == live_ids
+    for symbol_id in live_ids:
+        assert set(store.child_ids(symbol_id)) <= live_ids
+        assert set(store.parent_ids(symbol_id)) <= live_ids
+
@@ -3,7 +3,7 @@ import ast
 import sys
 # from .utils import skipif_known_failing
 
-from nbsafety.analysis.live_refs import compute_live_dead_symbol_refs
+from nbsafety.analysis.live_refs import compute_live_dead_symbol_refs, is_symbol_ref_killed
 
 
 def _remove_callpoints(symbols):
@@ -46,6 +46,23 @@ def test_comprehension_with_live_elt():
     assert dead == {'y', '_'}
 
 
+def test_killed_refs_compose_like_concatenation():
+    # the refresher computation relies on this to avoid analyzing each pair of cells concatenated together
+    cells = [
+        'x = 5\nlst = [x, y]',
+        'y = x + 1\nprint(lst[0], foo.bar)',
+        'foo = make_foo()\nfoo.bar = baz(x)',
+        'def f(a):\n    return a + z\nf(y)',
+        'lst[1] = f(w)\nprint(lst[1])',
+    ]
+    for first in cells:
+        first_live, first_dead = compute_live_dead_symbol_refs(first)
+        for second in cells:
+            second_live, second_dead = compute_live_dead_symbol_refs(second)
+            live = first_live | {ref for ref in second_live if not is_symbol_ref_killed(ref, first_dead)}
+            assert (live, first_dead | second_dead) == compute_live_dead_symbol_refs(f'{first}\n\n{second}')
+
+
 if sys.version_info >= (3, 8):
     def test_walrus():
         live, dead = compute_live_dead_symbol_refs("""
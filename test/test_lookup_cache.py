@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from test.utils import assert_detected, assert_not_detected, make_safety_fixture
+
+logging.basicConfig(level=logging.ERROR)
+
+# Reset dependency graph before each test
+_safety_fixture, _safety_state, run_cell = make_safety_fixture()
+
+
+def lookup_function(func_name):
+    return _safety_state[0].global_scope.lookup_data_symbol_by_name(func_name)
+
+
+def lookup_cache_for_function_body(func_name, stmt_idx=0):
+    func_dsym = lookup_function(func_name)
+    return func_dsym.call_scope.symbol_lookup_caches[id(func_dsym.stmt_node.body[stmt_idx])]
+
+
+def test_function_body_lookups_cached_across_cells():
+    run_cell('y = 5')
+    run_cell('def f():\n    return y + 1')
+    run_cell('w = f()')
+    cache = lookup_cache_for_function_body('f')
+    entry = cache._name_entries['y']
+    run_cell('w = f()')
+    assert cache._name_entries['y'] is entry
+    run_cell('y = 7')
+    run_cell('logging.info(w)')
+    assert_detected(_safety_state, '`w` depends on stale `y`')
+
+
+def test_rebound_locals_do_not_invalidate_other_lookups():
+    run_cell('y = 5')
+    run_cell("""
+def f(x):
+    z = x + 1
+    return y + z
+""")
+    run_cell('w = f(1)')
+    cache = lookup_cache_for_function_body('f', stmt_idx=1)
+    entry = cache._name_entries['y']
+    # `x` and `z` get new symbols in the call scope every call, but `y` resolves the same as before
+    run_cell('w = f(2)')
+    assert cache._name_entries['y'] is entry
+    assert cache._name_entries['z'] is not entry
+    run_cell('y = 7')
+    run_cell('logging.info(w)')
+    assert_detected(_safety_state, '`w` depends on stale `y`')
+
+
+def test_top_level_statements_not_cached():
+    run_cell('y = 5')
+    run_cell('w = y + 1')
+    assert len(_safety_state[0].global_scope.symbol_lookup_caches) == 0
+
+
+def test_caches_dropped_when_function_redefined():
+    run_cell('y = 5')
+    run_cell('def f():\n    return y + 1')
+    run_cell('w = f()')
+    call_scope = lookup_function('f').call_scope
+    assert len(call_scope.symbol_lookup_caches) == 1
+    run_cell('def f():\n    return y + 2')
+    assert lookup_function('f').call_scope is call_scope
+    assert len(call_scope.symbol_lookup_caches) == 0
+    run_cell('w = f()')
+    assert len(call_scope.symbol_lookup_caches) == 1
+
+
+def test_cached_lookup_invalidated_when_symbol_replaced():
+    run_cell('import math as y')
+    run_cell('def f():\n    return y')
+    run_cell('w = f()')
+    # replaces the import symbol for `y` with a new one
+    run_cell('y = 5')
+    run_cell('w = f()')
+    run_cell('y = 6')
+    run_cell('logging.info(w)')
+    assert_detected(_safety_state, '`w` depends on the new symbol for `y`')
+
+
+def test_cached_chain_invalidated_when_attribute_rebound():
+    run_cell("""
+class Foo:
+    def __init__(self, x):
+        self.x = x
+""")
+    run_cell('foo = Foo(Foo([1]))')
+    run_cell('def f():\n    return foo.x.x.append(2)')
+    run_cell('f()')
+    run_cell('foo.x = Foo([3])')
+    run_cell('f()')
+    run_cell('assert foo.x.x == [3, 2]')
+    assert_not_detected(_safety_state)
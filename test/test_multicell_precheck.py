@@ -21,6 +21,27 @@ def run_cell(cell, cell_id=None, **kwargs):
     run_cell_(cell, **kwargs)
 
 
+class FakeComm(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+def freshness_delta(cells, changed_cell_ids, executed_cell_id=None):
+    """Mocks a version 2 `cell_freshness` request and returns the response"""
+    comm = FakeComm()
+    _safety_state[0].handle({
+        'type': 'cell_freshness',
+        'version': 2,
+        'executed_cell_id': executed_cell_id,
+        'content_hash_by_cell_id': {cell_id: str(hash(content)) for cell_id, content in cells.items()},
+        'changed_content_by_cell_id': {cell_id: cells[cell_id] for cell_id in changed_cell_ids},
+    }, comm=comm)
+    return comm.sent[0]
+
+
 def test_simple():
     cells = {
         0: 'x = 0',
@@ -38,6 +59,87 @@ def test_simple():
     assert response['refresher_links'] == {1: [3]}
 
 
+def test_only_changed_cells_reanalyzed():
+    cells = {
+        0: 'x = 0',
+        1: 'y = x + 1',
+        2: 'logging.info(y)',
+    }
+    for idx, cell in cells.items():
+        run_cell(cell, idx)
+    response = _safety_state[0].check_and_link_multiple_cells(cells)
+    assert response['stale_cells'] == []
+    num_cached_cells = len(_safety_state[0].liveness_cache)
+    cells[0] = 'x = 42'
+    run_cell(cells[0], 0)
+    response = _safety_state[0].check_and_link_multiple_cells(cells)
+    assert response['stale_cells'] == [2]
+    assert response['stale_links'] == {2: [1]}
+    assert len(_safety_state[0].liveness_cache) == num_cached_cells + 1
+
+
+def test_freshness_delta_only_lists_changed_cells():
+    cells = {
+        0: 'x = 0',
+        1: 'y = x + 1',
+        2: 'x = 42',
+        3: 'logging.info(y)',
+    }
+    for idx in range(3):
+        run_cell(cells[idx], idx)
+    response = freshness_delta(cells, cells.keys(), executed_cell_id=2)
+    assert set(response['changed_cells']) == {1, 2, 3}
+    assert response['stale_cells'] == [3]
+    assert response['stale_links'] == {3: [1]}
+    assert response['refresher_links'] == {1: [3]}
+    response = freshness_delta(cells, [])
+    assert response['changed_cells'] == []
+    run_cell(cells[1], 1)
+    response = freshness_delta(cells, [], executed_cell_id=1)
+    assert set(response['changed_cells']) == {1, 3}
+    assert response['stale_cells'] == []
+    assert response['fresh_cells'] == []
+    assert response['stale_links'] == {}
+    assert response['refresher_links'] == {}
+
+
+def test_freshness_delta_asks_for_missing_sources():
+    cells = {
+        0: 'x = 0',
+        1: 'y = x + 1',
+    }
+    for idx, cell in cells.items():
+        run_cell(cell, idx)
+    response = freshness_delta(cells, [0])
+    assert response['missing_cell_ids'] == [1]
+    response = freshness_delta(cells, [1])
+    assert response['changed_cells'] == []
+    cells[0] = 'x = 42'
+    run_cell(cells[0], 0)
+    response = freshness_delta(cells, [], executed_cell_id=0)
+    assert response['missing_cell_ids'] == [0]
+    response = freshness_delta(cells, [0], executed_cell_id=0)
+    assert response['changed_cells'] == [0, 1]
+    assert response['fresh_cells'] == [1]
+
+
+def test_naive_refresher_computation():
+    _safety_state[0].config.naive_refresher_computation = True
+    cells = {
+        0: 'x = 0',
+        1: 'y = x + 1',
+        2: 'x = 42',
+        3: 'logging.info(y)',
+        4: 'z = x + 1\ny = 7',
+    }
+    for idx in range(3):
+        run_cell(cells[idx], idx)
+    response = _safety_state[0].check_and_link_multiple_cells(cells)
+    assert response['stale_cells'] == [3]
+    assert set(response['stale_links'][3]) == {1, 4}
+    assert response['refresher_links'] == {1: [3], 4: [3]}
+
+
 def test_refresh_after_exception_fixed():
     cells = {
         0: 'x = 0',
@@ -8,7 +8,9 @@ logging.basicConfig(level=logging.ERROR)
 
 # Reset dependency graph before each test
 # _safety_fixture, _safety_state, run_cell_ = make_safety_fixture(setup_cells=['%safety trace_messages enable'])
-_safety_fixture, _safety_state, run_cell_ = make_safety_fixture()
+_safety_fixture, _safety_state, run_cell_ = make_safety_fixture(
+    variants=[{'lazy_staleness': False}, {'lazy_staleness': True}]
+)
 
 
 def run_cell(cell, **kwargs):
@@ -56,6 +58,63 @@ def test_simplest():
     assert_detected('should have detected b has stale dep on old a')
 
 
+def test_transitive_staleness_recorded_on_symbol():
+    run_cell('a = 1')
+    run_cell('b = a + 1')
+    run_cell('c = b + 1')
+    run_cell('a = 3')
+    c = _safety_state[0].global_scope.lookup_data_symbol_by_name('c')
+    assert c.is_stale
+    c.record_staleness()
+    assert c.fresher_ancestors == {_safety_state[0].global_scope.lookup_data_symbol_by_name('a')}
+    run_cell('logging.info(c)')
+    assert_detected('c transitively depends on old a')
+
+
+def test_redefinition_refreshes():
+    run_cell('a = 1')
+    run_cell('b = a + 1')
+    run_cell('a = 3')
+    run_cell('b = a + 1')
+    run_cell('logging.info(b)')
+    assert_not_detected('b was recomputed from the new a')
+
+
+def test_no_backwards_propagation_when_disabled():
+    safety = _safety_state[0]
+    safety.config.backwards_cell_staleness_propagation = False
+    safety.set_active_cell('x_def', position_idx=0)
+    run_cell('x = 0')
+    safety.set_active_cell('y_def', position_idx=2)
+    run_cell('y = x + 1')
+    safety.set_active_cell('x_below', position_idx=3)
+    run_cell('x = 42')
+    safety.set_active_cell('y_use', position_idx=4)
+    run_cell('logging.info(y)')
+    assert_not_detected('`x` was updated below the cell that `y` was defined in')
+    safety.set_active_cell('x_above', position_idx=1)
+    run_cell('x = 43')
+    safety.set_active_cell('y_use', position_idx=4)
+    run_cell('logging.info(y)')
+    assert_detected('`x` was updated above the cell that `y` was defined in')
+
+
+def test_no_backwards_propagation_older_update_still_counts():
+    safety = _safety_state[0]
+    safety.config.backwards_cell_staleness_propagation = False
+    safety.set_active_cell('x_def', position_idx=0)
+    run_cell('x = 0')
+    safety.set_active_cell('y_def', position_idx=2)
+    run_cell('y = x + 1')
+    safety.set_active_cell('x_above', position_idx=1)
+    run_cell('x = 43')
+    safety.set_active_cell('x_below', position_idx=3)
+    run_cell('x = 44')
+    safety.set_active_cell('y_use', position_idx=4)
+    run_cell('logging.info(y)')
+    assert_detected('`x` was updated above the cell that `y` was defined in before it was updated below it')
+
+
 def test_readme_example():
     run_cell('def eval_model_1(): return 0.5')
     run_cell('def eval_model_2(): return 0.85')
@@ -1317,6 +1376,52 @@ logging.info(x)
     assert_detected('`x` depends on stale value of `a`')
 
 
+def test_tracing_manager_reused_across_cells():
+    tracing_manager = _safety_state[0].tracing_manager
+    run_cell('x = 5')
+    run_cell('def f(): return x + 1')
+    run_cell('y = f()')
+    assert _safety_state[0].tracing_manager is tracing_manager
+    # statements traced in earlier cells get traced again
+    run_cell('y = f()')
+    run_cell('x = 6')
+    run_cell('logging.info(y)')
+    assert_detected('`y` depends on old value of `x`')
+
+
+def test_nested_code_mapped_to_defining_cell():
+    run_cell("""
+def f():
+    return [x + 1 for x in range(3)]
+""")
+    run_cell("""
+def g():
+    return [x + 1 for x in range(3)]
+""")
+    run_cell('y = f() + g()')
+    safety = _safety_state[0]
+    for func_name in ('f', 'g'):
+        func_sym = safety.global_scope.lookup_data_symbol_by_name(func_name)
+        func_code = func_sym._get_obj().__code__
+        nested_codes = [const for const in func_code.co_consts if hasattr(const, 'co_consts')]
+        for code in [func_code] + nested_codes:
+            assert safety.cell_code_table.lookup(code).cell_num == func_sym.defined_cell_num
+
+
+def test_cell_code_entries_dropped_with_code():
+    run_cell('def f(): return [x + 1 for x in range(3)]')
+    run_cell('y = f()')
+    safety = _safety_state[0]
+    func_code = safety.global_scope.lookup_data_symbol_by_name('f')._get_obj().__code__
+    code_ids = [id(func_code)] + [id(const) for const in func_code.co_consts if hasattr(const, 'co_consts')]
+    assert all(code_id in safety.cell_code_table._entries for code_id in code_ids)
+    del func_code
+    run_cell('del f')
+    run_cell('import gc; gc.collect()')
+    # the ids may have been reused by newer code, but no entry should outlive its code
+    assert all(entry.code_ref() is not None for entry in safety.cell_code_table._entries.values())
+
+
 def test_exception_stack_unwind():
     import builtins
     safety_state = '_safety_state'
@@ -1736,6 +1841,131 @@ y = x + 1
     assert_detected('`y` depends on old value `x`')
 
 
+def test_rerun_unchanged_cells_with_cached_instrumentation():
+    run_cell('a = 1')
+    run_cell('b = a + 1')
+    run_cell('a = 3')
+    run_cell('logging.info(b)')
+    assert_detected('`b` depends on old value of `a`')
+    num_cached = len(_safety_state[0].instrumented_cell_cache)
+    run_cell('b = a + 1')
+    assert len(_safety_state[0].instrumented_cell_cache) == num_cached
+    run_cell('logging.info(b)')
+    assert_not_detected('`b` was refreshed by rerunning an unchanged cell')
+    run_cell('a = 5')
+    run_cell('logging.info(b)')
+    assert_detected('`b` depends on old value of `a`')
+
+
+def test_long_dependency_chain_does_not_hit_recursion_limit():
+    chain_length = sys.getrecursionlimit()
+    run_cell('x0 = 0\n' + '\n'.join(f'x{i} = x{i - 1} + 1' for i in range(1, chain_length)))
+    run_cell('x0 = 42')
+    run_cell(f'logging.info(x{chain_length - 1})')
+    assert_detected(f'`x{chain_length - 1}` transitively depends on old value of `x0`')
+
+
+def test_plain_attribute_loads_make_no_namespaces():
+    run_cell('import math')
+    num_namespaces = len(_safety_state[0].namespaces)
+    run_cell('math.pi * 2')
+    run_cell('math.floor(math.e)')
+    assert len(_safety_state[0].namespaces) == num_namespaces
+
+
+def test_attribute_dependency_after_plain_load():
+    run_cell("""
+class Foo(object):
+    def __init__(self, x):
+        self.x = x
+""")
+    run_cell('foo = Foo(5)')
+    run_cell('foo.x + 1')
+    run_cell('y = foo.x + 1')
+    run_cell('foo.x = 8')
+    run_cell('logging.info(y)')
+    assert_detected('`y` depends on old value of `foo.x`')
+
+
+def test_traced_loads_evaluated_once():
+    run_cell("""
+class Foo(object):
+    def __init__(self):
+        self.num_gets = 0
+
+    @property
+    def prop(self):
+        self.num_gets += 1
+        return [1, 2, 3]
+""")
+    run_cell('foo = Foo()')
+    run_cell('x = foo.prop[0] + 1')
+    run_cell('assert foo.num_gets == 1')
+    run_cell('y = foo.prop')
+    run_cell('assert foo.num_gets == 2')
+    assert_not_detected()
+
+
+def test_dependency_on_attribute_of_property_value():
+    run_cell("""
+class Foo(object):
+    def __init__(self):
+        self.lst = [1, 2, 3]
+
+    @property
+    def prop(self):
+        return self.lst
+""")
+    run_cell('foo = Foo()')
+    run_cell('y = foo.prop[1] + 1')
+    run_cell('foo.lst[1] = 5')
+    run_cell('logging.info(y)')
+    assert_detected('`y` depends on old value of `foo.lst[1]`')
+
+
+def test_slotted_attribute_resolution_only_gets_requested_member():
+    run_cell("""
+class Foo(object):
+    __slots__ = ('x', 'num_gets')
+
+    def __init__(self):
+        self.x = 0
+        self.num_gets = 0
+
+    @property
+    def expensive(self):
+        self.num_gets += 1
+        return 42
+""")
+    run_cell('foo = Foo()')
+    run_cell('y = 5')
+    run_cell('foo.x = y + 1')
+    run_cell('y = 7')
+    run_cell('logging.info(foo.x)')
+    assert_detected('`foo.x` depends on old value of `y`')
+    run_cell('assert foo.num_gets == 0')
+    assert_not_detected()
+
+
+def test_caller_loads_kept_across_nested_calls():
+    run_cell("""
+class Foo(object):
+    def __init__(self, x):
+        self.x = x
+""")
+    run_cell('foo = Foo(5)')
+    run_cell('bar = Foo(6)')
+    run_cell('def g(v): return bar.x + v')
+    run_cell('def f(v): return g(v) + 1')
+    run_cell('y = foo.x + f(1)')
+    run_cell('z = foo.x + f(2) + 3')
+    run_cell('foo.x = 9')
+    run_cell('logging.info(y)')
+    assert_detected('`y` depends on old value of `foo.x`')
+    run_cell('logging.info(z)')
+    assert_detected('`z` depends on old value of `foo.x`')
+
+
 if sys.version_info >= (3, 8):
     def test_walrus_simple():
         run_cell("""
@@ -1760,3 +1990,13 @@ if (x := (y := (z := 1) + 1) + 1) > 0:
         assert_detected('`x` depends on old value of `y`')
         run_cell('logging.info(a)')
         assert_detected('`a` depends on old value of `y`')
+
+
+if sys.version_info >= (3, 12):
+    def test_sys_monitoring_backend_in_use():
+        assert _safety_state[0].tracing_manager._sys_monitoring_tracer is not None
+        run_cell('x = 1')
+        run_cell('y = x + 1')
+        run_cell('x = 2')
+        run_cell('logging.info(y)')
+        assert_detected('`y` depends on old value of `x`')
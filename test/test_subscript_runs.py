@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from test.utils import assert_detected, make_safety_fixture
+
+logging.basicConfig(level=logging.ERROR)
+
+# Reset dependency graph before each test
+_safety_fixture, _safety_state, run_cell = make_safety_fixture(subscript_runs=True)
+
+
+def lookup_namespace(name):
+    safety = _safety_state[0]
+    return safety.namespaces[safety.global_scope.lookup_data_symbol_by_name(name).obj_id]
+
+
+def test_literal_elements_share_run():
+    run_cell('lst = [1, 2, 3, 4, 5]')
+    namespace = lookup_namespace('lst')
+    assert len(namespace.data_symbol_by_name(is_subscript=True)) == 0
+    assert namespace.num_subscript_symbols == 5
+
+
+def test_lookup_splits_run():
+    run_cell('lst = [1, 2, 3, 4, 5]')
+    run_cell('x = lst[2] + 1')
+    namespace = lookup_namespace('lst')
+    assert list(namespace.data_symbol_by_name(is_subscript=True).keys()) == [2]
+    assert namespace.num_subscript_symbols == 5
+    assert [(run.start, run.stop) for run in namespace._subscript_runs] == [(0, 2), (3, 5)]
+
+
+def test_mutable_elements_get_symbols():
+    run_cell('lst = [1, "a", [2], 3.0]')
+    namespace = lookup_namespace('lst')
+    assert list(namespace.data_symbol_by_name(is_subscript=True).keys()) == [2]
+    assert namespace.num_subscript_symbols == 4
+
+
+def test_materialized_symbols_match_run():
+    run_cell('lst = [1, 2, 3]')
+    run_cell('y = 0')
+    namespace = lookup_namespace('lst')
+    lst_defined_cell_num = _safety_state[0].global_scope.lookup_data_symbol_by_name('lst').defined_cell_num
+    dsyms = sorted(namespace.all_data_symbols_this_indentation(), key=lambda dsym: dsym.name)
+    assert [dsym.name for dsym in dsyms] == [0, 1, 2]
+    assert all(dsym.defined_cell_num == lst_defined_cell_num and not dsym.is_stale for dsym in dsyms)
+    assert len(namespace._subscript_runs) == 0
+
+
+def test_stale_element_detected():
+    run_cell('lst = [1, 2, 3]')
+    run_cell('x = lst[1] + 1')
+    run_cell('lst[1] = 7')
+    run_cell('logging.info(x)')
+    assert_detected(_safety_state, '`x` depends on old value of `lst[1]`')
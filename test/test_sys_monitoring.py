@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import sys
+
+import pytest
+
+from nbsafety.tracing.sys_monitoring import SysMonitoringTracer
+
+
+class _FakeEvents(object):
+    NO_EVENTS = 0
+    PY_START = 1 << 0
+    PY_RESUME = 1 << 1
+    PY_RETURN = 1 << 2
+    PY_YIELD = 1 << 3
+    PY_THROW = 1 << 4
+    PY_UNWIND = 1 << 5
+    RAISE = 1 << 6
+
+
+class _FakeMonitoring(object):
+    """Just enough of `sys.monitoring` to drive a SysMonitoringTracer by hand."""
+    events = _FakeEvents
+    DISABLE = object()
+    OPTIMIZER_ID = 5
+
+    def __init__(self):
+        self.tools = {}
+        self.callbacks = {}
+        self.event_masks = {}
+
+    def get_tool(self, tool_id):
+        return self.tools.get(tool_id, None)
+
+    def use_tool_id(self, tool_id, name):
+        if tool_id in self.tools:
+            raise ValueError('tool %d is already in use' % tool_id)
+        self.tools[tool_id] = name
+
+    def free_tool_id(self, tool_id):
+        self.tools.pop(tool_id, None)
+
+    def register_callback(self, tool_id, event, func):
+        if func is None:
+            self.callbacks.pop((tool_id, event), None)
+        else:
+            self.callbacks[tool_id, event] = func
+
+    def set_events(self, tool_id, event_mask):
+        self.event_masks[tool_id] = event_mask
+
+
+@pytest.fixture
+def monitoring(monkeypatch):
+    fake = _FakeMonitoring()
+    monkeypatch.setattr(sys, 'monitoring', fake, raising=False)
+    return fake
+
+
+def _make_tracer(events):
+    def tracer(frame, evt, _arg):
+        events.append((frame.f_code.co_name, evt))
+        return tracer
+    return SysMonitoringTracer(tracer, lambda code: code.co_name.startswith('cell_'))
+
+
+def test_claims_unreserved_tool_ids(monitoring):
+    _make_tracer([]).enable()
+    assert monitoring.tools == {3: 'nbsafety'}
+    _make_tracer([]).enable()
+    assert monitoring.tools == {3: 'nbsafety', 4: 'nbsafety'}
+
+
+def test_clear_error_when_no_tool_id_free(monitoring):
+    monitoring.use_tool_id(3, 'other')
+    monitoring.use_tool_id(4, 'other')
+    with pytest.raises(RuntimeError, match='use_sys_monitoring=False'):
+        _make_tracer([]).enable()
+    assert monitoring.get_tool(monitoring.OPTIMIZER_ID) is None
+
+
+def test_release_unregisters_callbacks_and_frees_tool_id(monitoring):
+    tracer = _make_tracer([])
+    tracer.enable()
+    assert (3, _FakeEvents.PY_THROW) in monitoring.callbacks
+    assert monitoring.event_masks[3] & _FakeEvents.PY_THROW
+    tracer.disable()
+    assert monitoring.tools == {3: 'nbsafety'}
+    tracer.release()
+    assert monitoring.tools == {}
+    assert monitoring.callbacks == {}
+    assert monitoring.event_masks[3] == _FakeEvents.NO_EVENTS
+    # tracing can start up again afterwards
+    tracer.enable()
+    assert monitoring.tools == {3: 'nbsafety'}
+
+
+def test_frame_resumed_by_throw_gets_traced(monitoring):
+    events = []
+    tracer = _make_tracer(events)
+
+    def cell_gen():
+        code = sys._getframe().f_code
+        tracer._py_throw(code, 0, ValueError())
+        tracer._py_return(code, 0, None)
+
+    cell_gen()
+    assert events == [('cell_gen', 'call'), ('cell_gen', 'return')]
+
+
+def test_non_cell_code_disabled(monitoring):
+    events = []
+    tracer = _make_tracer(events)
+
+    def library_func():
+        code = sys._getframe().f_code
+        assert tracer._py_start(code, 0) is monitoring.DISABLE
+        assert tracer._py_throw(code, 0, ValueError()) is None
+        assert tracer._py_return(code, 0, None) is monitoring.DISABLE
+
+    library_func()
+    assert events == []
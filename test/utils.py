@@ -27,7 +27,24 @@ def assert_bool(val, msg=''):
     assert val, str(msg)
 
 
+def stale_detected(safety_state: 'List[Optional[NotebookSafety]]') -> bool:
+    return safety_state[0].test_and_clear_detected_flag()
+
+
+def assert_detected(safety_state: 'List[Optional[NotebookSafety]]', msg=''):
+    assert_bool(stale_detected(safety_state), msg=msg)
+
+
+def assert_not_detected(safety_state: 'List[Optional[NotebookSafety]]', msg=''):
+    assert_bool(not stale_detected(safety_state), msg=msg)
+
+
+def _variant_id(variant):
+    return ','.join(f'{k}={v}' for k, v in variant.items())
+
+
 # Reset dependency graph before each test to prevent unexpected stale dependency
+# (if `variants` is given, each test runs once for each dict of extra kwargs in it)
 def make_safety_fixture(**kwargs) -> 'Tuple[Any, List[Optional[NotebookSafety]], Any]':
     os.environ[SafetyRunMode.DEVELOP.value] = '1'
     safety_state: List[Optional[NotebookSafety]] = [None]
@@ -43,14 +60,16 @@ def make_safety_fixture(**kwargs) -> 'Tuple[Any, List[Optional[NotebookSafety]],
     store_history = kwargs.pop('store_history', False)
     test_context = kwargs.pop('test_context', True)
     setup_cells = kwargs.pop('setup_cells', [])
+    variants = kwargs.pop('variants', None)
 
-    @pytest.fixture(autouse=True)
-    def init_or_reset_dependency_graph():
+    @pytest.fixture(autouse=True, params=variants, ids=_variant_id)
+    def init_or_reset_dependency_graph(request):
         safety_state[0] = NotebookSafety(
             cell_magic_name='_SAFETY_CELL_MAGIC',
             store_history=store_history,
             test_context=test_context,
-            **kwargs
+            **kwargs,
+            **getattr(request, 'param', {})
         )
         run_cell('import sys')
         run_cell('sys.path.append("./test")')